@@ -231,7 +231,7 @@ function launching_scripts {
     sleep 0.1
     screen -S "Script_AIL" -X screen -t "CveModule" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./CveModule.py; read x"
     sleep 0.1
-    screen -S "Script_AIL" -X screen -t "Decoder" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./Decoder.py; read x"
+    screen -S "Script_AIL" -X screen -t "Decoder" bash -c "cd ${AIL_BIN}/core; ${ENV_PY} ./Module_Runner.py modules.Decoder; read x"
     sleep 0.1
     screen -S "Script_AIL" -X screen -t "Duplicates" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./Duplicates.py; read x"
     sleep 0.1
@@ -270,6 +270,8 @@ function launching_scripts {
 #    screen -S "Script_AIL" -X screen -t "Pasties" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./Pasties.py; read x"
 #    sleep 0.1
 #    screen -S "Script_AIL" -X screen -t "Indexer" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./Indexer.py; read x"
+#    sleep 0.1
+#    screen -S "Script_AIL" -X screen -t "Pipeline" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./Pipeline.py; read x"
 #    sleep 0.1
 
     screen -S "Script_AIL" -X screen -t "MISP_Thehive_Auto_Push" bash -c "cd ${AIL_BIN}/modules; ${ENV_PY} ./MISP_Thehive_Auto_Push.py; read x"
@@ -296,7 +298,7 @@ function launching_scripts {
     sleep 0.1
     screen -S "Script_AIL" -X screen -t "Tracker_Regex" bash -c "cd ${AIL_BIN}/trackers; ${ENV_PY} ./Tracker_Regex.py; read x"
     sleep 0.1
-    screen -S "Script_AIL" -X screen -t "Tracker_Yara" bash -c "cd ${AIL_BIN}/trackers; ${ENV_PY} ./Tracker_Yara.py; read x"
+    screen -S "Script_AIL" -X screen -t "Tracker_Yara" bash -c "cd ${AIL_BIN}/core; ${ENV_PY} ./Module_Runner.py trackers.Tracker_Yara; read x"
     sleep 0.1
     screen -S "Script_AIL" -X screen -t "Retro_Hunt" bash -c "cd ${AIL_BIN}/trackers; ${ENV_PY} ./Retro_Hunt.py; read x"
     sleep 0.1
@@ -596,7 +598,7 @@ function launch_tests() {
   echo -e $GREEN"\t* Flask:   $isflasked"$DEFAULT
   echo -e ""
   echo -e ""
-  python3 -m nose2 --start-dir $tests_dir --coverage $bin_dir --with-coverage test_api test_modules
+  python3 -m nose2 --start-dir $tests_dir --coverage $bin_dir --with-coverage test_api test_modules test_lib
 }
 
 function reset_password() {
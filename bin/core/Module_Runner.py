@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+The Module Runner
+=================
+
+Start and supervise N worker processes of an AIL module.
+All workers consume the same queue.
+
+The number of workers is configured in configs/modules.cfg, in the module section:
+    min_workers = 1     # Number of workers always running
+    max_workers = 4     # Autoscale up to max_workers, based on the queue backlog
+    scale_backlog = 100 # Start a new worker if backlog > scale_backlog * nb_workers
+
+Usage:
+    ./Module_Runner.py modules.Decoder
+    ./Module_Runner.py trackers.Retro_Hunt:Retro_Hunt_Module
+
+"""
+
+##################################
+# Import External packages
+##################################
+import argparse
+import importlib
+import logging.config
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import ail_logger
+from lib import ail_queues
+from lib.ConfigLoader import ConfigLoader
+
+logging.config.dictConfig(ail_logger.get_config(name='modules'))
+
+
+def _get_module_class(module_path):
+    if ':' in module_path:
+        module_path, class_name = module_path.split(':', 1)
+    else:
+        class_name = module_path.rsplit('.', 1)[-1]
+    return getattr(importlib.import_module(module_path), class_name)
+
+def _run_worker(module_path):
+    module = _get_module_class(module_path)()
+
+    # Graceful shutdown: end the current message/batch
+    def stop_worker(signum, frame):
+        module.proceed = False
+    signal.signal(signal.SIGTERM, stop_worker)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    try:
+        module.run()
+    finally:
+        module.queue.stop()
+
+
+class ModuleRunner:
+    """
+    Supervise the worker processes of a module
+    """
+
+    def __init__(self, module_path, min_workers=None, max_workers=None):
+        self.module_path = module_path
+        self.logger = logging.getLogger(f'{self.__class__.__name__}')
+
+        self.module_name = _get_module_class(module_path).__name__
+        # Module Queue, used to monitor the backlog
+        self.queue_name = f'queue:{self.module_name}:in'
+
+        config_loader = ConfigLoader(config_file=ail_queues.MODULES_FILE)
+        self.min_workers = self._get_config_int(config_loader, 'min_workers', 1)
+        self.max_workers = self._get_config_int(config_loader, 'max_workers', self.min_workers)
+        self.scale_backlog = self._get_config_int(config_loader, 'scale_backlog', 100)
+        if min_workers:
+            self.min_workers = min_workers
+        if max_workers:
+            self.max_workers = max_workers
+        self.max_workers = max(self.min_workers, self.max_workers)
+
+        # Time in seconds between two checks of the workers
+        self.refresh_time = 10
+
+        self.workers = []
+        # Workers ending their current message/batch, reaped by _clean_workers
+        self.stopping_workers = []
+        self.proceed = True
+
+        self.nb_processed = 0
+        self.last_stats = time.time()
+
+    def _get_config_int(self, config_loader, option, default):
+        if config_loader.has_option(self.module_name, option):
+            return config_loader.get_config_int(self.module_name, option)
+        return default
+
+    def get_nb_messages(self):
+        return ail_queues.r_queues.llen(self.queue_name)
+
+    def start_worker(self):
+        worker = multiprocessing.Process(target=_run_worker, args=(self.module_path,), name=f'{self.module_name}_worker')
+        worker.start()
+        self.workers.append(worker)
+        self.logger.info(f'{self.module_name}: worker {worker.pid} started ({len(self.workers)} workers)')
+
+    def stop_worker(self):
+        worker = self.workers.pop()
+        worker.terminate()  # SIGTERM -> graceful shutdown
+        self.stopping_workers.append(worker)
+        self.logger.info(f'{self.module_name}: worker {worker.pid} stopping ({len(self.workers)} workers)')
+        return worker
+
+    def _clean_workers(self):
+        stopping_workers = []
+        for worker in self.stopping_workers:
+            worker.join(timeout=0)
+            if worker.is_alive():
+                stopping_workers.append(worker)
+            else:
+                self.logger.info(f'{self.module_name}: worker {worker.pid} stopped with code {worker.exitcode}')
+                # Put back the messages of a batch interrupted by an error
+                nb_messages = ail_queues.requeue_messages(self.module_name, worker.pid)
+                if nb_messages:
+                    self.logger.warning(f'{self.module_name}: {nb_messages} messages of worker {worker.pid} requeued')
+        self.stopping_workers = stopping_workers
+
+        workers = []
+        for worker in self.workers:
+            if worker.is_alive():
+                workers.append(worker)
+            else:
+                self.logger.warning(f'{self.module_name}: worker {worker.pid} exited with code {worker.exitcode}')
+                # Put back the messages of the batch interrupted by the worker exit
+                nb_messages = ail_queues.requeue_messages(self.module_name, worker.pid)
+                if nb_messages:
+                    self.logger.warning(f'{self.module_name}: {nb_messages} messages of worker {worker.pid} requeued')
+        self.workers = workers
+
+    def scale(self):
+        self._clean_workers()
+        while len(self.workers) < self.min_workers:
+            self.start_worker()
+
+        nb_messages = self.get_nb_messages()
+        nb_workers = len(self.workers)
+        if nb_messages > self.scale_backlog * nb_workers and nb_workers < self.max_workers:
+            self.start_worker()
+        elif nb_messages == 0 and nb_workers > self.min_workers:
+            self.stop_worker()
+
+    def update_stats(self):
+        nb_processed = sum(ail_queues.get_module_nb_processed(self.module_name).values())
+        now = time.time()
+        throughput = round((nb_processed - self.nb_processed) / (now - self.last_stats), 2)
+        # Counters are reset when a worker is stopped
+        if throughput >= 0:
+            ail_queues.set_module_throughput(self.module_name, throughput)
+            self.logger.debug(f'{self.module_name}: {len(self.workers)} workers, {throughput} messages/s')
+        self.nb_processed = nb_processed
+        self.last_stats = now
+
+    def stop(self, signum=None, frame=None):
+        self.proceed = False
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.logger.info(f'{self.module_name}: Module Runner started, {self.min_workers}-{self.max_workers} workers')
+        while self.proceed:
+            self.scale()
+            self.update_stats()
+            time.sleep(self.refresh_time)
+
+        # Graceful shutdown
+        while self.workers:
+            self.stop_worker()
+        for worker in multiprocessing.active_children():
+            worker.join()
+        self._clean_workers()
+        self.logger.info(f'{self.module_name}: Module Runner stopped')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start and supervise the worker processes of an AIL module')
+    parser.add_argument('module', type=str,
+                        help='Module path, relative to AIL_BIN, ex: modules.Decoder or trackers.Retro_Hunt:Retro_Hunt_Module')
+    parser.add_argument('--min', type=int, help='Minimum number of workers', default=None)
+    parser.add_argument('--max', type=int, help='Maximum number of workers', default=None)
+    args = parser.parse_args()
+
+    runner = ModuleRunner(args.module, min_workers=args.min, max_workers=args.max)
+    runner.run()
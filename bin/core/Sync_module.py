@@ -39,23 +39,25 @@ class Sync_module(AbstractModule):
         # Waiting time in seconds between to message processed
         self.pending_seconds = 10
 
-        self.dict_sync_queues = ail_2_ail.get_all_sync_queue_dict()
-        self.last_refresh = time.time()
+        # Tags inverted index of the sync queues filters
+        self.router = ail_2_ail.Sync_Queues_Router()
         self.last_refresh_queues = time.time()
 
-        print(self.dict_sync_queues)
+        print(self.router.queues)
 
         # Send module state to logs
         self.logger.info(f'Module {self.module_name} Launched')
 
     def compute(self, message):
 
-        ### REFRESH DICT
-        if self.last_refresh < ail_2_ail.get_last_updated_sync_config():
-            self.last_refresh = time.time()
-            self.dict_sync_queues = ail_2_ail.get_all_sync_queue_dict()
+        ### REFRESH QUEUES
+        if self.router.refresh():
             print('sync queues refreshed')
-            print(self.dict_sync_queues)
+            print(self.router.queues)
+
+        # No filter to match
+        if not self.router.tags_index:
+            return None
 
         obj = ail_objects.get_obj_from_global_id(message)
 
@@ -63,17 +65,16 @@ class Sync_module(AbstractModule):
 
         # check filter + tags
         # print(message)
-        for queue_uuid in self.dict_sync_queues:
-            filter_tags = self.dict_sync_queues[queue_uuid]['filter']
-            if filter_tags and tags:
-                # print('tags: {tags} filter: {filter_tags}')
-                if filter_tags.issubset(tags):
-                    obj_dict = obj.get_default_meta()
-                    # send to queue push and/or pull
-                    for dict_ail in self.dict_sync_queues[queue_uuid]['ail_instances']:
-                        print(f'ail_uuid: {dict_ail["ail_uuid"]} obj: {obj.type}:{obj.get_subtype(r_str=True)}:{obj.id}')
-                        ail_2_ail.add_object_to_sync_queue(queue_uuid, dict_ail['ail_uuid'], obj_dict,
-                                                           push=dict_ail['push'], pull=dict_ail['pull'])
+        queues = []
+        for queue_uuid, dict_queue in self.router.get_queues(tags):
+            # send to queue push and/or pull
+            for dict_ail in dict_queue['ail_instances']:
+                print(f'ail_uuid: {dict_ail["ail_uuid"]} obj: {obj.type}:{obj.get_subtype(r_str=True)}:{obj.id}')
+                queues.append((queue_uuid, dict_ail['ail_uuid'], dict_ail['push'], dict_ail['pull'], dict_queue['max_size']))
+        if queues:
+            nb_dropped = ail_2_ail.add_object_to_sync_queues(obj.get_default_meta(), queues)
+            if nb_dropped:
+                self.logger.warning(f'{self.module_name}: sync queues full, {nb_dropped} object(s) dropped')
 
     def run(self):
         """
@@ -28,6 +28,11 @@ r_serv_db = config_loader.get_db_conn("Kvrocks_DB")
 r_serv_sync = config_loader.get_db_conn("Kvrocks_DB")
 config_loader = None
 
+# Max size of the sync queues created without max size, capacity of the former hardcoded ltrim 0 200
+SYNC_QUEUE_DEFAULT_MAX_SIZE = 201
+# Sync queues updates kept for the routers refresh, older updates trigger a full reload
+SYNC_QUEUE_UPDATES_TTL = 86400
+
 WEBSOCKETS_CLOSE_CODES = {
                             1000: 'Normal Closure',
                             1001: 'Going Away',
@@ -101,11 +106,52 @@ def get_last_updated_sync_config():
         epoch = 0
     return float(epoch)
 
-def set_last_updated_sync_config():
-    epoch = int(time.time())
-    r_serv_sync.set(f'ail:instance:queue:last_updated_sync_config', epoch)
+def set_last_updated_sync_config(queues_uuid=None):
+    """
+    :param queues_uuid: updated sync queues, None: all the sync queues need to be reloaded
+    """
+    epoch = time.time()
+    pipe = r_serv_sync.pipeline(transaction=False)
+    pipe.set(f'ail:instance:queue:last_updated_sync_config', epoch)
+    if queues_uuid is None:
+        # a full reload supersedes all the previous updates
+        pipe.delete('ail:instance:queue:last_updated_sync_queue')
+        pipe.hset('ail:instance:queue:last_updated_sync_queue', 'all', epoch)
+    else:
+        for queue_uuid in queues_uuid:
+            pipe.hset('ail:instance:queue:last_updated_sync_queue', queue_uuid, epoch)
+    pipe.execute()
+    _prune_sync_queues_updates(epoch)
     return epoch
 
+def _prune_sync_queues_updates(epoch):
+    """
+    Remove the sync queues updates older than SYNC_QUEUE_UPDATES_TTL, the routers not refreshed since are fully reloaded
+    """
+    pruned_epoch = epoch - SYNC_QUEUE_UPDATES_TTL
+    to_prune = []
+    for queue_uuid, updated_epoch in r_serv_sync.hgetall('ail:instance:queue:last_updated_sync_queue').items():
+        if queue_uuid != 'pruned' and float(updated_epoch) < pruned_epoch:
+            to_prune.append(queue_uuid)
+    if to_prune:
+        pipe = r_serv_sync.pipeline(transaction=False)
+        pipe.hdel('ail:instance:queue:last_updated_sync_queue', *to_prune)
+        pipe.hset('ail:instance:queue:last_updated_sync_queue', 'pruned', pruned_epoch)
+        pipe.execute()
+
+def get_sync_queues_updated_since(epoch):
+    """
+    :return: set of the sync queues updated after epoch, 'all': all the sync queues
+    """
+    updated = set()
+    for queue_uuid, updated_epoch in r_serv_sync.hgetall('ail:instance:queue:last_updated_sync_queue').items():
+        if float(updated_epoch) > epoch:
+            if queue_uuid == 'pruned':
+                # updates removed since the last refresh
+                queue_uuid = 'all'
+            updated.add(queue_uuid)
+    return updated
+
 # # TODO: get connection status
 # # TODO: get connection METADATA
 # # TODO: client => reconnect on fails (with timeout)
@@ -499,7 +545,7 @@ def change_pull_push_state(ail_uuid, pull=None, push=None):
             r_serv_sync.hset(f'ail:instance:{ail_uuid}', 'push', push)
             edited = True
     if edited:
-        set_last_updated_sync_config()
+        set_last_updated_sync_config(queues_uuid=get_ail_instance_all_sync_queue(ail_uuid))
         refresh_ail_instance_connection(ail_uuid)
 
 def get_ail_server_version(ail_uuid):
@@ -603,7 +649,7 @@ def create_ail_instance(ail_uuid, url, api_key=None, description=None, pull=True
     if description:
         r_serv_sync.hset(f'ail:instance:{ail_uuid}', 'description', description)
     change_pull_push_state(ail_uuid, pull=pull, push=push)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[])
     refresh_ail_instance_connection(ail_uuid)
     return ail_uuid
 
@@ -616,7 +662,7 @@ def delete_ail_instance(ail_uuid):
     r_serv_sync.srem('ail:instance:key:all', ail_uuid)
     r_serv_sync.delete(f'ail:instance:key:{key}', ail_uuid)
     r_serv_sync.srem('ail:instance:all', ail_uuid)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[])
     refresh_ail_instance_connection(ail_uuid)
     clear_save_ail_server_error(ail_uuid)
     return ail_uuid
@@ -901,6 +947,16 @@ def get_sync_queue_description(queue_uuid):
 def get_sync_queue_max_size(queue_uuid):
     return r_serv_sync.hget(f'ail2ail:sync_queue:{queue_uuid}', 'max_size')
 
+def get_sync_queue_trim_size(queue_uuid):
+    """
+    :return: max number of objects kept by AIL instance in this sync queue
+    """
+    max_size = get_sync_queue_max_size(queue_uuid)
+    if max_size:
+        return int(max_size)
+    else:
+        return SYNC_QUEUE_DEFAULT_MAX_SIZE
+
 # # TODO: ADD FILTER
 def get_sync_queue_metadata(queue_uuid):
     dict_meta = {}
@@ -928,24 +984,110 @@ def get_queues_metadata(l_queues_uuid):
     return l_queues
 
 #####################################################
+def get_sync_queue_dict(queue_uuid):
+    """
+    :return: filter and enabled AIL instances of a sync queue, None if the queue is not used
+    """
+    if is_queue_used_by_ail_instance(queue_uuid):
+        dict_queue = {}
+        dict_queue['filter'] = get_sync_queue_filter(queue_uuid)
+        dict_queue['max_size'] = get_sync_queue_trim_size(queue_uuid)
+
+        dict_queue['ail_instances'] = [] ############ USE DICT ?????????
+        for ail_uuid in get_sync_queue_all_ail_instance(queue_uuid):
+            dict_ail = {'ail_uuid': ail_uuid,
+                        'pull': is_ail_instance_pull_enabled(ail_uuid),
+                        'push': is_ail_instance_push_enabled(ail_uuid)}
+            if dict_ail['pull'] or dict_ail['push']:
+                dict_queue['ail_instances'].append(dict_ail)
+        if dict_queue['ail_instances']:
+            return dict_queue
+    return None
+
 def get_all_sync_queue_dict():
     dict_sync_queues = {}
     for queue_uuid in get_all_sync_queue():
-        if is_queue_used_by_ail_instance(queue_uuid):
-            dict_queue = {}
-            dict_queue['filter'] = get_sync_queue_filter(queue_uuid)
-
-            dict_queue['ail_instances'] = [] ############ USE DICT ?????????
-            for ail_uuid in get_sync_queue_all_ail_instance(queue_uuid):
-                dict_ail = {'ail_uuid': ail_uuid,
-                            'pull': is_ail_instance_pull_enabled(ail_uuid),
-                            'push': is_ail_instance_push_enabled(ail_uuid)}
-                if dict_ail['pull'] or dict_ail['push']:
-                    dict_queue['ail_instances'].append(dict_ail)
-            if dict_queue['ail_instances']:
-                dict_sync_queues[queue_uuid] = dict_queue
+        dict_queue = get_sync_queue_dict(queue_uuid)
+        if dict_queue:
+            dict_sync_queues[queue_uuid] = dict_queue
     return dict_sync_queues
 
+class Sync_Queues_Router(object):
+    """
+    Route the objects to the sync queues matching their tags
+
+    Inverted index of the filters: tag -> sync queues. A queue matches an object
+    if all the tags of its filter are found, the matched tags are counted by queue.
+    The queues are reloaded incrementally on sync config update.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.tags_index = {}
+        self.last_refresh = 0
+        self.refresh()
+
+    def _add_queue(self, queue_uuid, dict_queue):
+        self.queues[queue_uuid] = dict_queue
+        for tag in dict_queue['filter']:
+            if tag not in self.tags_index:
+                self.tags_index[tag] = set()
+            self.tags_index[tag].add(queue_uuid)
+
+    def _remove_queue(self, queue_uuid):
+        dict_queue = self.queues.pop(queue_uuid, None)
+        if dict_queue:
+            for tag in dict_queue['filter']:
+                self.tags_index[tag].discard(queue_uuid)
+                if not self.tags_index[tag]:
+                    self.tags_index.pop(tag)
+
+    def update_queue(self, queue_uuid):
+        self._remove_queue(queue_uuid)
+        dict_queue = get_sync_queue_dict(queue_uuid)
+        # a queue without filter doesn't match any object
+        if dict_queue and dict_queue['filter']:
+            self._add_queue(queue_uuid, dict_queue)
+
+    def reload(self):
+        self.queues = {}
+        self.tags_index = {}
+        for queue_uuid, dict_queue in get_all_sync_queue_dict().items():
+            if dict_queue['filter']:
+                self._add_queue(queue_uuid, dict_queue)
+
+    def refresh(self):
+        """
+        Reload the sync queues updated since the last refresh
+
+        :return: True if the sync queues were updated
+        """
+        last_updated = get_last_updated_sync_config()
+        if last_updated <= self.last_refresh:
+            return False
+        updated = get_sync_queues_updated_since(self.last_refresh)
+        if not self.last_refresh or 'all' in updated:
+            self.reload()
+        else:
+            for queue_uuid in updated:
+                self.update_queue(queue_uuid)
+        self.last_refresh = last_updated
+        return True
+
+    def get_queues(self, tags):
+        """
+        :return: list of (queue_uuid, dict_queue) matching the tags
+        """
+        counts = {}
+        for tag in set(tags):
+            for queue_uuid in self.tags_index.get(tag, ()):
+                counts[queue_uuid] = counts.get(queue_uuid, 0) + 1
+        queues = []
+        for queue_uuid, nb in counts.items():
+            if nb == len(self.queues[queue_uuid]['filter']):
+                queues.append((queue_uuid, self.queues[queue_uuid]))
+        return queues
+
 def is_queue_registred_by_ail_instance(queue_uuid, ail_uuid):
     try:
         return r_serv_sync.sismember(f'ail:instance:sync_queue:{ail_uuid}', queue_uuid)
@@ -956,7 +1098,7 @@ def register_ail_to_sync_queue(ail_uuid, queue_uuid):
     is_linked = is_ail_instance_linked_to_sync_queue(ail_uuid)
     r_serv_sync.sadd(f'ail2ail:sync_queue:ail_instance:{queue_uuid}', ail_uuid)
     r_serv_sync.sadd(f'ail:instance:sync_queue:{ail_uuid}', queue_uuid)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[queue_uuid])
     if not is_linked:
         refresh_ail_instance_connection(ail_uuid)
 
@@ -964,7 +1106,7 @@ def register_ail_to_sync_queue(ail_uuid, queue_uuid):
 def unregister_ail_to_sync_queue(ail_uuid, queue_uuid):
     r_serv_sync.srem(f'ail2ail:sync_queue:ail_instance:{queue_uuid}', ail_uuid)
     r_serv_sync.srem(f'ail:instance:sync_queue:{ail_uuid}', queue_uuid)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[queue_uuid])
     is_linked = is_ail_instance_linked_to_sync_queue(ail_uuid)
     if not is_linked:
         refresh_ail_instance_connection(ail_uuid)
@@ -982,11 +1124,11 @@ def edit_sync_queue_description(queue_uuid, new_description):
     if new_description is not None and new_description != description:
         r_serv_sync.hset(f'ail2ail:sync_queue:{queue_uuid}', 'description', new_description)
 
-# # TODO: trigger update
 def edit_sync_queue_max_size(queue_uuid, new_max_size):
     max_size = get_sync_queue_max_size(queue_uuid)
     if new_max_size > 0 and new_max_size != max_size:
         r_serv_sync.hset(f'ail2ail:sync_queue:{queue_uuid}', 'max_size', new_max_size)
+        set_last_updated_sync_config(queues_uuid=[queue_uuid])
 
 def edit_sync_queue_filter_tags(queue_uuid, new_tags):
     tags = set(get_sync_queue_filter(queue_uuid))
@@ -995,12 +1137,12 @@ def edit_sync_queue_filter_tags(queue_uuid, new_tags):
         r_serv_sync.delete(f'ail2ail:sync_queue:filter:tags:{queue_uuid}')
         for tag in new_tags:
             r_serv_sync.sadd(f'ail2ail:sync_queue:filter:tags:{queue_uuid}', tag)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[queue_uuid])
 
 # # TODO: optionnal name ???
 # # TODO: SANITYZE TAGS
 # # TODO: SANITYZE queue_uuid
-def create_sync_queue(name, tags=[], description=None, max_size=100, _queue_uuid=None):
+def create_sync_queue(name, tags=[], description=None, max_size=SYNC_QUEUE_DEFAULT_MAX_SIZE, _queue_uuid=None):
     if _queue_uuid:
         queue_uuid = sanityze_uuid(_queue_uuid).replace('-', '')
     else:
@@ -1015,7 +1157,7 @@ def create_sync_queue(name, tags=[], description=None, max_size=100, _queue_uuid
     for tag in tags:
         r_serv_sync.sadd(f'ail2ail:sync_queue:filter:tags:{queue_uuid}', tag)
 
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[queue_uuid])
     return queue_uuid
 
 def delete_sync_queue(queue_uuid):
@@ -1024,7 +1166,7 @@ def delete_sync_queue(queue_uuid):
     r_serv_sync.delete(f'ail2ail:sync_queue:{queue_uuid}')
     r_serv_sync.delete(f'ail2ail:sync_queue:filter:tags:{queue_uuid}')
     r_serv_sync.srem('ail2ail:sync_queue:all', queue_uuid)
-    set_last_updated_sync_config()
+    set_last_updated_sync_config(queues_uuid=[queue_uuid])
     return queue_uuid
 
 ## API ##
@@ -1046,7 +1188,7 @@ def api_create_sync_queue(json_dict):
 
     max_size = json_dict.get('max_size')
     if not max_size:
-        max_size = 100
+        max_size = SYNC_QUEUE_DEFAULT_MAX_SIZE
     try:
         max_size = int(max_size)
     except ValueError:
@@ -1175,21 +1317,85 @@ def get_sync_queue_objects_by_queue_uuid(queue_uuid, ail_uuid, push=True):
         sync_mode = 'pull'
     return r_serv_sync.lrange(f'sync:queue:{sync_mode}:{queue_uuid}:{ail_uuid}', 0, -1)
 
-# # TODO: use queue max_size
-def add_object_to_sync_queue(queue_uuid, ail_uuid, obj_dict, push=True, pull=True, json_obj=True):
+def get_sync_queue_objects_and_queues_uuid(ail_uuid, nb, push=True):
+    """
+    Pop up to nb objects from the sync queues of an AIL instance
+
+    :return: list of (Obj, queue_uuid)
+    """
+    if push:
+        sync_mode = 'push'
+    else:
+        sync_mode = 'pull'
+    objs = []
+    for queue_uuid in get_ail_instance_all_sync_queue(ail_uuid):
+        obj_dicts = r_serv_sync.lpop(f'sync:queue:{sync_mode}:{queue_uuid}:{ail_uuid}', nb - len(objs))
+        if obj_dicts:
+            for obj_dict in obj_dicts:
+                obj_dict = json.loads(obj_dict)
+                # # REVIEW: # TODO: create by obj type
+                objs.append((Item(obj_dict['id']), queue_uuid))
+            if len(objs) >= nb:
+                break
+    return objs
+
+def add_object_to_sync_queue(queue_uuid, ail_uuid, obj_dict, push=True, pull=True, json_obj=True, max_size=None):
+    if max_size is None:
+        max_size = get_sync_queue_trim_size(queue_uuid)
+    return add_object_to_sync_queues(obj_dict, [(queue_uuid, ail_uuid, push, pull, max_size)], json_obj=json_obj)
+
+def add_object_to_sync_queues(obj_dict, queues, json_obj=True):
+    """
+    Add an object to multiple sync queues, the queues are trimmed to their max size
+
+    :param queues: list of (queue_uuid, ail_uuid, push, pull, max_size)
+    :return: number of objects dropped by the trim of the queues
+    """
     if json_obj:
         obj = json.dumps(obj_dict)
     else:
         obj = obj_dict
 
-    # # TODO: # FIXME: USE CACHE ??????
-    if push:
-        r_serv_sync.lpush(f'sync:queue:push:{queue_uuid}:{ail_uuid}', obj)
-        r_serv_sync.ltrim(f'sync:queue:push:{queue_uuid}:{ail_uuid}', 0, 200)
+    pipe = r_serv_sync.pipeline(transaction=False)
+    pushed = []
+    for queue_uuid, ail_uuid, push, pull, max_size in queues:
+        for sync_mode, enabled in (('push', push), ('pull', pull)):
+            if enabled:
+                # lpush result offset: index of the next queued command
+                pushed.append((sync_mode, queue_uuid, ail_uuid, max_size, len(pipe)))
+                pipe.lpush(f'sync:queue:{sync_mode}:{queue_uuid}:{ail_uuid}', obj)
+                pipe.ltrim(f'sync:queue:{sync_mode}:{queue_uuid}:{ail_uuid}', 0, max_size - 1)
+                _notify_sync_queue(ail_uuid, sync_mode, pipe)
+    res = pipe.execute()
+
+    # Count the objects dropped by the trim: lpush returns the length of the queue
+    nb_dropped = 0
+    for sync_mode, queue_uuid, ail_uuid, max_size, offset in pushed:
+        dropped = res[offset] - max_size
+        if dropped > 0:
+            r_serv_sync.hincrby(f'sync:queue:dropped:{ail_uuid}', f'{sync_mode}:{queue_uuid}', dropped)
+            nb_dropped += dropped
+    return nb_dropped
+
+def get_sync_queue_nb_dropped(queue_uuid, ail_uuid, sync_mode):
+    nb = r_serv_sync.hget(f'sync:queue:dropped:{ail_uuid}', f'{sync_mode}:{queue_uuid}')
+    if nb:
+        return int(nb)
+    else:
+        return 0
 
-    if pull:
-        r_serv_sync.lpush(f'sync:queue:pull:{queue_uuid}:{ail_uuid}', obj)
-        r_serv_sync.ltrim(f'sync:queue:pull:{queue_uuid}:{ail_uuid}', 0, 200)
+# Wake-up signal of the sync clients waiting for new objects
+def _notify_sync_queue(ail_uuid, sync_mode, r_pipe):
+    r_pipe.lpush(f'sync:queue:notify:{sync_mode}:{ail_uuid}', 1)
+    r_pipe.ltrim(f'sync:queue:notify:{sync_mode}:{ail_uuid}', 0, 0)
+
+def wait_sync_queue(ail_uuid, sync_mode, timeout):
+    """
+    Wait until a new object is added to a sync queue of this AIL instance
+
+    :return: True if an object was added, False on timeout
+    """
+    return r_serv_sync.blpop(f'sync:queue:notify:{sync_mode}:{ail_uuid}', timeout=timeout) is not None
 
 def resend_object_to_sync_queue(ail_uuid, queue_uuid, Obj, push=True):
     if queue_uuid is not None and Obj is not None:
@@ -1208,6 +1414,10 @@ def add_ail_stream_to_sync_importer(ail_stream):
     ail_stream = json.dumps(ail_stream)
     r_serv_sync.sadd('sync:queue:importer', ail_stream)
 
+def add_ail_streams_to_sync_importer(ail_streams):
+    if ail_streams:
+        r_serv_sync.sadd('sync:queue:importer', *[json.dumps(ail_stream) for ail_stream in ail_streams])
+
 #############################
 #                           #
 #### AIL EXCHANGE FORMAT ####
@@ -21,6 +21,7 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from lib import ail_logger
 from core import ail_2_ail
+from core import ail_2_ail_transport
 from lib.ConfigLoader import ConfigLoader
 
 #### LOGS ####
@@ -95,6 +96,39 @@ async def push(websocket, ail_uuid):
         ail_2_ail.resend_object_to_sync_queue(ail_uuid, queue_uuid, Obj, push=True)
         raise err
 
+# BATCH TRANSPORT
+async def pull_batch(websocket, ail_uuid, compression):
+    def write_ail_streams(ail_streams):
+        for ail_stream in ail_streams:
+            sys.stdout.write(json.dumps(ail_stream))
+    await ail_2_ail_transport.receive_batches(websocket, compression, write_ail_streams)
+
+async def push_batch(websocket, ail_uuid, compression):
+    sender = ail_2_ail_transport.BatchSender(websocket, compression)
+    loop = asyncio.get_event_loop()
+    try:
+        while True:
+            # get elems to send
+            objs = ail_2_ail.get_sync_queue_objects_and_queues_uuid(ail_uuid, ail_2_ail_transport.BATCH_SIZE)
+            if objs:
+                await sender.send(objs)
+            else:
+                await sender.flush()
+                # wait for new objects
+                await loop.run_in_executor(None, ail_2_ail.wait_sync_queue, ail_uuid, 'push', 10)
+                # check if connection open
+                if not websocket.open:
+                    # raise websocket internal exceptions
+                    await websocket.send('')
+
+    except (websockets.exceptions.ConnectionClosed, ConnectionError) as err:
+        # resend unacknowledged objects in queue on Connection Error
+        for Obj, queue_uuid in sender.get_unacked():
+            ail_2_ail.resend_object_to_sync_queue(ail_uuid, queue_uuid, Obj, push=True)
+        raise err
+    finally:
+        sender.close()
+
 async def ail_to_ail_client(ail_uuid, sync_mode, api, ail_key=None, client_id=None):
     if not ail_2_ail.exists_ail_instance(ail_uuid):
         print('AIL server not found')
@@ -122,16 +156,27 @@ async def ail_to_ail_client(ail_uuid, sync_mode, api, ail_key=None, client_id=No
             ssl=ssl_context,
             local_addr=local_addr,
             #open_timeout=10, websockers 10.0 /!\ python>=3.7
-            extra_headers={"Authorization": f"{ail_key}"}
+            extra_headers={"Authorization": f"{ail_key}"},
+            subprotocols=ail_2_ail_transport.get_subprotocols(),
+            max_size=ail_2_ail_transport.MAX_FRAME_SIZE
         ) as websocket:
             # success
             ail_2_ail.clear_save_ail_server_error(ail_uuid)
 
+            # None: legacy transport
+            compression = ail_2_ail_transport.get_subprotocol_compression(websocket.subprotocol)
+
             if sync_mode == 'pull':
-                await pull(websocket, ail_uuid)
+                if compression:
+                    await pull_batch(websocket, ail_uuid, compression)
+                else:
+                    await pull(websocket, ail_uuid)
 
             elif sync_mode == 'push':
-                await push(websocket, ail_uuid)
+                if compression:
+                    await push_batch(websocket, ail_uuid, compression)
+                else:
+                    await push(websocket, ail_uuid)
                 await websocket.close()
 
             elif sync_mode == 'api':
@@ -18,6 +18,7 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from lib import ail_logger
 from core import ail_2_ail
+from core import ail_2_ail_transport
 from lib.ConfigLoader import ConfigLoader
 
 
@@ -165,6 +166,33 @@ async def push(websocket, ail_uuid):
         # # TODO: Close connection on junk
         ail_2_ail.add_ail_stream_to_sync_importer(ail_stream)
 
+# BATCH TRANSPORT
+# PULL: Send data to client
+async def pull_batch(websocket, ail_uuid, compression):
+    sender = ail_2_ail_transport.BatchSender(websocket, compression)
+    try:
+        while True:
+            # get elems to send
+            objs = ail_2_ail.get_sync_queue_objects_and_queues_uuid(ail_uuid, ail_2_ail_transport.BATCH_SIZE, push=False)
+            if objs:
+                await sender.send(objs)
+            # END PULL
+            else:
+                break
+        await sender.flush()
+    except (websockets.exceptions.ConnectionClosed, ConnectionError) as err:
+        # resend unacknowledged objects in queue on Connection Error
+        for Obj, queue_uuid in sender.get_unacked():
+            ail_2_ail.resend_object_to_sync_queue(ail_uuid, queue_uuid, Obj, push=False)
+        raise err
+    finally:
+        sender.close()
+
+# PUSH: receive data from client
+async def push_batch(websocket, ail_uuid, compression):
+    # # TODO: CHECK ail_stream
+    await ail_2_ail_transport.receive_batches(websocket, compression, ail_2_ail.add_ail_streams_to_sync_importer)
+
 # API: server API
 # # TODO: ADD TIMEOUT ???
 async def api(websocket, ail_uuid, api):
@@ -189,6 +217,8 @@ async def ail_to_ail_serv(websocket, path):
     remote_address = websocket.remote_address
     path = unpack_path(path)
     sync_mode = path['sync_mode']
+    # None: legacy transport
+    compression = ail_2_ail_transport.get_subprotocol_compression(websocket.subprotocol)
 
     # # TODO: check if it works
     # # DEBUG:
@@ -199,13 +229,19 @@ async def ail_to_ail_serv(websocket, path):
     await register(websocket)
     try:
         if sync_mode == 'pull':
-            await pull(websocket, websocket.ail_uuid)
+            if compression:
+                await pull_batch(websocket, websocket.ail_uuid, compression)
+            else:
+                await pull(websocket, websocket.ail_uuid)
             await websocket.close()
             logger.info(f'Connection closed: {ail_uuid} {remote_address}')
             print(f'Connection closed: {ail_uuid} {remote_address}')
 
         elif sync_mode == 'push':
-            await push(websocket, websocket.ail_uuid)
+            if compression:
+                await push_batch(websocket, websocket.ail_uuid, compression)
+            else:
+                await push(websocket, websocket.ail_uuid)
 
         elif sync_mode == 'api':
             await api(websocket, websocket.ail_uuid, path['api'])
@@ -318,7 +354,8 @@ if __name__ == '__main__':
     cert_dir = os.environ['AIL_FLASK']
     ssl_context.load_cert_chain(certfile=os.path.join(cert_dir, 'server.crt'), keyfile=os.path.join(cert_dir, 'server.key'))
 
-    start_server = websockets.serve(ail_to_ail_serv, host, port, ssl=ssl_context, create_protocol=AIL_2_AIL_Protocol, max_size=None)
+    start_server = websockets.serve(ail_to_ail_serv, host, port, ssl=ssl_context, create_protocol=AIL_2_AIL_Protocol, max_size=ail_2_ail_transport.MAX_FRAME_SIZE,
+                                  subprotocols=ail_2_ail_transport.get_subprotocols())
 
     print(f'Server Launched:    wss://{host}:{port}')
     logger.info(f'Server Launched:    wss://{host}:{port}')
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+AIL 2 AIL Batch Transport
+=========================
+
+Sync transport negotiated with a websocket subprotocol: ail-sync-batch.<compression>
+
+The objects are sent in compressed binary frames: {'seq': <frame number>, 'objects': [ail_stream, ...]}
+The receiver acknowledges each frame with a text message: {'ack': <frame number>}
+The sender keeps up to WINDOW frames in flight, the objects of the unacknowledged frames are sent
+back to their sync queue if the connection is lost.
+The websocket messages and the decompressed frames are limited to MAX_FRAME_SIZE bytes, the connection
+is closed if a peer sends a larger frame.
+
+A client or a server without subprotocol falls back to the legacy transport, one JSON object by message.
+"""
+import asyncio
+import json
+import os
+import sys
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from core import ail_2_ail
+from lib.ConfigLoader import ConfigLoader
+
+config_loader = ConfigLoader()
+if config_loader.has_option('AIL_2_AIL', 'batch_size'):
+    BATCH_SIZE = config_loader.get_config_int('AIL_2_AIL', 'batch_size')
+else:
+    BATCH_SIZE = 100
+if config_loader.has_option('AIL_2_AIL', 'window'):
+    WINDOW = config_loader.get_config_int('AIL_2_AIL', 'window')
+else:
+    WINDOW = 4
+# Max size of a websocket message and of a decompressed frame, in MB
+if config_loader.has_option('AIL_2_AIL', 'max_frame_size'):
+    MAX_FRAME_SIZE = config_loader.get_config_int('AIL_2_AIL', 'max_frame_size') * 1024 * 1024
+else:
+    MAX_FRAME_SIZE = 100 * 1024 * 1024
+config_loader = None
+
+# Websocket close code: Message Too Big
+CLOSE_CODE_TOO_BIG = 1009
+
+class FrameSizeError(ValueError):
+    pass
+
+SUBPROTOCOL = 'ail-sync-batch'
+
+def get_compressions():
+    """
+    :return: supported compressions, by preference
+    """
+    if zstandard:
+        return ['zstd', 'deflate']
+    else:
+        return ['deflate']
+
+def get_subprotocols():
+    return [f'{SUBPROTOCOL}.{compression}' for compression in get_compressions()]
+
+def get_subprotocol_compression(subprotocol):
+    """
+    :return: compression of the negotiated subprotocol, None: legacy transport
+    """
+    if subprotocol and subprotocol.startswith(f'{SUBPROTOCOL}.'):
+        compression = subprotocol.split('.', 1)[1]
+        if compression in get_compressions():
+            return compression
+    return None
+
+# # # # FRAMES # # # #
+
+def compress(compression, data):
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    else:
+        return zlib.compress(data, 6)
+
+def decompress(compression, data, max_size=MAX_FRAME_SIZE):
+    """
+    Bounded decompression
+
+    :raise FrameSizeError: if the decompressed data is larger than max_size
+    """
+    if compression == 'zstd':
+        chunks = []
+        size = 0
+        with zstandard.ZstdDecompressor().stream_reader(data) as reader:
+            while True:
+                chunk = reader.read(min(max_size + 1 - size, 1048576))
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > max_size:
+                    raise FrameSizeError(f'Decompressed frame larger than {max_size} bytes')
+        return b''.join(chunks)
+    else:
+        decompressor = zlib.decompressobj()
+        decompressed = decompressor.decompress(data, max_size + 1)
+        if len(decompressed) > max_size or decompressor.unconsumed_tail:
+            raise FrameSizeError(f'Decompressed frame larger than {max_size} bytes')
+        return decompressed
+
+def pack_frame(compression, seq, ail_streams):
+    return compress(compression, json.dumps({'seq': seq, 'objects': ail_streams}).encode())
+
+def unpack_frame(compression, frame, max_size=MAX_FRAME_SIZE):
+    """
+    :return: frame number, list of ail_stream
+    """
+    frame = json.loads(decompress(compression, frame, max_size=max_size))
+    return frame['seq'], frame['objects']
+
+# # # # SENDER # # # #
+
+class BatchSender:
+    """
+    Send batches of objects with a bounded window of unacknowledged frames
+    """
+
+    def __init__(self, websocket, compression, window=WINDOW, create_ail_stream=ail_2_ail.create_ail_stream):
+        self.websocket = websocket
+        self.compression = compression
+        self.window = window
+        self.create_ail_stream = create_ail_stream
+        self.nb_bytes = 0
+        self.seq = 0
+        # seq: list of (Obj, queue_uuid)
+        self.inflight = {}
+        self._acked = asyncio.Event()
+        self._reader = None
+
+    async def _read_acks(self):
+        async for message in self.websocket:
+            try:
+                seq = json.loads(message)['ack']
+            except (ValueError, KeyError, TypeError):
+                continue
+            self.inflight.pop(seq, None)
+            self._acked.set()
+
+    async def _wait_ack(self):
+        if self._reader is None:
+            self._reader = asyncio.ensure_future(self._read_acks())
+        self._acked.clear()
+        waiter = asyncio.ensure_future(self._acked.wait())
+        await asyncio.wait({self._reader, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+        if self._reader.done():
+            # raise the connection error
+            self._reader.result()
+            raise ConnectionError('Connection closed by the receiver')
+
+    async def send(self, objs):
+        """
+        :param objs: list of (Obj, queue_uuid)
+        """
+        ail_streams = [self.create_ail_stream(obj) for obj, _ in objs]
+        # Split the batches larger than the receiver limit
+        if len(objs) > 1 and len(json.dumps(ail_streams)) > MAX_FRAME_SIZE:
+            middle = len(objs) // 2
+            await self.send(objs[:middle])
+            await self.send(objs[middle:])
+            return None
+        self.seq += 1
+        self.inflight[self.seq] = objs
+        while len(self.inflight) > self.window:
+            await self._wait_ack()
+        frame = pack_frame(self.compression, self.seq, ail_streams)
+        self.nb_bytes += len(frame)
+        await self.websocket.send(frame)
+
+    async def flush(self):
+        """
+        Wait until all the frames are acknowledged
+        """
+        while self.inflight:
+            await self._wait_ack()
+
+    def get_unacked(self):
+        unacked = []
+        for seq in sorted(self.inflight):
+            unacked.extend(self.inflight[seq])
+        return unacked
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+
+# # # # RECEIVER # # # #
+
+async def receive_batches(websocket, compression, callback):
+    """
+    Receive frames and acknowledge them once processed
+
+    :param callback: function called with the list of ail_stream of a frame
+    """
+    async for frame in websocket:
+        if isinstance(frame, str):
+            frame = frame.encode()
+        try:
+            seq, ail_streams = unpack_frame(compression, frame)
+        except FrameSizeError as e:
+            await websocket.close(code=CLOSE_CODE_TOO_BIG, reason=str(e))
+            raise e
+        callback(ail_streams)
+        await websocket.send(json.dumps({'ack': seq}))
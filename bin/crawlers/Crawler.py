@@ -3,6 +3,7 @@
 
 import os
 import logging.config
+import multiprocessing
 import sys
 import time
 
@@ -15,6 +16,7 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from modules.abstract_module import AbstractModule
 from lib import ail_logger
+from lib import correlations_engine
 from lib import crawlers
 from lib.ConfigLoader import ConfigLoader
 from lib.exceptions import TimeoutException, OnionFilteringError
@@ -24,6 +26,7 @@ from lib.objects import Etags
 from lib.objects.Domains import Domain
 from lib.objects import DomHashs
 from lib.objects import Favicons
+from lib.objects import HHHashs
 from lib.objects.Items import Item
 from lib.objects import Screenshots
 from lib.objects import Titles
@@ -39,6 +42,47 @@ def timeout_handler(signum, frame):
 
 signal.signal(signal.SIGALRM, timeout_handler)
 
+def exit_handler(signum, frame):
+    sys.exit(0)
+
+
+def _process_capture_node(node):
+    """
+    Extract the objects of a crawled page, run by the post-processing workers
+
+    :param node: dict, page of a capture
+    :return: dict of the extracted objects
+    """
+    html = node['html']
+    res = {'gzip64': crawlers.get_gzipped_b64_item(node['item_id'], html),
+           'dom_hash': DomHashs.compute_dom_hash(html),
+           'title': None, 'title_timeout': False,
+           'screenshot': None,
+           'cookies': [], 'etags': [], 'hhhashs': {}}
+
+    # TITLE
+    signal.alarm(60)
+    try:
+        res['title'] = crawlers.extract_title_from_html(html)
+    except TimeoutException:
+        res['title_timeout'] = True
+    else:
+        signal.alarm(0)
+
+    # SCREENSHOT
+    if node.get('png'):
+        screenshot = Screenshots.create_screenshot(node['png'], b64=False)
+        if screenshot:
+            res['screenshot'] = screenshot.id
+
+    # HAR
+    if node.get('har'):
+        crawlers.save_har(node['har_id'], node['har'])
+        res['cookies'] = list(crawlers.extract_cookies_names_from_har(node['har']))
+        res['etags'] = list(crawlers.extract_etag_from_har(node['har']))
+        res['hhhashs'] = crawlers.get_hhhashs_from_har(node['har'], node['domain'])
+    return res
+
 
 class Crawler(AbstractModule):
 
@@ -64,6 +108,12 @@ class Crawler(AbstractModule):
         self.default_har = config_loader.get_config_boolean('Crawler', 'default_har')
         self.default_screenshot = config_loader.get_config_boolean('Crawler', 'default_screenshot')
         self.default_depth_limit = config_loader.get_config_int('Crawler', 'default_depth_limit')
+        if config_loader.has_option('Crawler', 'post_processing_workers'):
+            self.post_processing_workers = config_loader.get_config_int('Crawler', 'post_processing_workers')
+        else:
+            self.post_processing_workers = 4
+        if not self.post_processing_workers:
+            self.post_processing_workers = os.cpu_count() or 1
 
         ail_url_to_push_discovery = config_loader.get_config_str('Crawler', 'ail_url_to_push_onion_discovery')
         ail_key_to_push_discovery = config_loader.get_config_str('Crawler', 'ail_key_to_push_onion_discovery')
@@ -85,9 +135,23 @@ class Crawler(AbstractModule):
 
         self.crawler_scheduler = crawlers.CrawlerScheduler()
 
+        # Capture post-processing workers, started before the Lacus threads
+        # The pages are pickled to the workers: ~2% of their processing time (tools/benchmarks/benchmark_crawler_nodes.py)
+        if self.post_processing_workers > 1:
+            self.post_processing_pool = multiprocessing.Pool(self.post_processing_workers)
+            # Stop the workers with the module
+            signal.signal(signal.SIGTERM, exit_handler)
+            signal.signal(signal.SIGHUP, exit_handler)
+        else:
+            self.post_processing_pool = None
+
         # LACUS
         self.lacus = crawlers.get_lacus()
         self.is_lacus_up = crawlers.is_lacus_connected(delta_check=0)
+        # Concurrent Lacus requests
+        self.capture_manager = crawlers.LacusCaptureManager(self.lacus)
+        # Status of the captures being checked
+        self.captures_status = None
 
         # Capture
         self.har = None
@@ -107,6 +171,18 @@ class Crawler(AbstractModule):
         # Send module state to logs
         self.logger.info('Crawler initialized')
 
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.close_post_processing_pool()
+
+    def close_post_processing_pool(self):
+        if self.post_processing_pool:
+            self.post_processing_pool.terminate()
+            self.post_processing_pool.join()
+            self.post_processing_pool = None
+
     def refresh_lacus_status(self):
         try:
             lacus_up = self.is_lacus_up
@@ -114,6 +190,7 @@ class Crawler(AbstractModule):
             # refresh lacus
             if not lacus_up and self.is_lacus_up:
                 self.lacus = crawlers.get_lacus()
+                self.capture_manager.lacus = self.lacus
         except:
             self.is_lacus_up = False
         if not self.is_lacus_up:
@@ -149,92 +226,131 @@ class Crawler(AbstractModule):
             self.filter_unknown_onion = crawlers.is_onion_filter_unknown()
             self.last_config_check = int(time.time())
 
-        # Check if a new Capture can be Launched
-        if crawlers.get_nb_crawler_captures() < crawlers.get_crawler_max_captures():
-            task_row = crawlers.add_task_to_lacus_queue()
-            if task_row:
-                task, priority = task_row
-                domain = task.get_domain()
-                if self.filter_unsafe_onion:
-                    if domain.endswith('.onion'):
-                        try:
-                            if not crawlers.check_if_onion_is_safe(domain, unknown=self.filter_unknown_onion):
-                                # print('---------------------------------------------------------')
-                                # print('DOMAIN FILTERED')
-                                task.delete()
-                                return None
-                        except OnionFilteringError:
-                            task.reset()
-                            self.logger.warning(f'Onion Filtering Connection Error, {task.uuid} Send back in queue')
-                            time.sleep(10)
-                            return None
-
-                task.start()
-                task_uuid = task.uuid
-                try:
-                    self.enqueue_capture(task_uuid, priority)
-                except ConnectionError:
-                    print(task_row)
-                    task = crawlers.CrawlerTask(task_uuid)
-                    task.add_to_db_crawler_queue(priority)
+        # Launch new Captures, up to the Lacus concurrency limit
+        self.launch_captures()
+
+        # Check the status of the Captures, a completed capture is returned as soon as its status is received
+        if self.captures_status is None:
+            captures = crawlers.get_crawler_captures_to_check()
+            if captures:
+                self.captures_status = self.capture_manager.iter_captures_status(captures)
+        if self.captures_status is not None:
+            for capture, status in self.captures_status:
+                if isinstance(status, ConnectionError):
+                    self.logger.warning(f'Lacus ConnectionError, capture {capture.uuid}')
+                    capture.update(-1)
+                    self.captures_status.close()
+                    self.captures_status = None
                     self.refresh_lacus_status()
                     return None
-
-        # Get CrawlerCapture Object
-        capture = crawlers.get_crawler_capture()
-        if capture:
-            try:
-                status = self.lacus.get_capture_status(capture.uuid)
-                print(status)
-                if status == crawlers.CaptureStatus.DONE:
+                elif isinstance(status, Exception):
+                    self.captures_status.close()
+                    self.captures_status = None
+                    raise status
+                if self.update_capture_status(capture, status):
                     return capture
-                elif status == crawlers.CaptureStatus.UNKNOWN:
-                    capture_start = capture.get_start_time(r_str=False)
-                    if capture_start == 0:
-                        task = capture.get_task()
-                        task.delete()
-                        capture.delete()
-                        self.logger.warning(f'capture UNKNOWN ERROR STATE, {task.uuid} Removed from queue')
-                        return None
-                    if int(time.time()) - capture_start > 600:  # TODO ADD in new crawler config
-                        task = capture.get_task()
-                        task.reset()
-                        capture.delete()
-                        self.logger.warning(f'capture UNKNOWN Timeout, {task.uuid} Send back in queue')
-                    else:
-                        capture.update(status)
-                elif status == crawlers.CaptureStatus.QUEUED:
-                    capture_start = capture.get_start_time(r_str=False)
-                    if int(time.time()) - capture_start > 36000:  # TODO ADD in new crawler config
-                        task = capture.get_task()
-                        task.reset()
-                        capture.delete()
-                        self.logger.warning(f'capture QUEUED Timeout, {task.uuid}, {task.get_url()} Send back in queue, start_time={capture_start}')
-                    else:
-                        capture.update(status)
-                    print(capture.uuid, crawlers.CaptureStatus(status).name, int(time.time()))
-                elif status == crawlers.CaptureStatus.ONGOING:
-                    capture.update(status)
-                    print(capture.uuid, crawlers.CaptureStatus(status).name, int(time.time()))
-                # Invalid State
-                else:
-                    task = capture.get_task()
-                    task.reset()
-                    capture.delete()
-                    self.logger.warning(f'ERROR INVALID CAPTURE STATUS {status}, {task.uuid} Send back in queue')
-
-            except ConnectionError:
-                self.logger.warning(f'Lacus ConnectionError, capture {capture.uuid}')
-                capture.update(-1)
-                self.refresh_lacus_status()
+            self.captures_status = None
 
         try:
             time.sleep(self.pending_seconds)
         except TimeoutException:
             pass
 
+    def launch_captures(self):
+        max_captures = crawlers.get_crawler_max_captures()
+        self.capture_manager.set_concurrency(max_captures)
+        tasks = []
+        # Check if new Captures can be Launched
+        for _ in range(max_captures - crawlers.get_nb_crawler_captures()):
+            task_row = crawlers.add_task_to_lacus_queue()
+            if not task_row:
+                break
+            task, priority = task_row
+            task.load()
+            domain = task.get_domain()
+            if self.filter_unsafe_onion:
+                if domain.endswith('.onion'):
+                    try:
+                        if not crawlers.check_if_onion_is_safe(domain, unknown=self.filter_unknown_onion):
+                            # print('---------------------------------------------------------')
+                            # print('DOMAIN FILTERED')
+                            task.delete()
+                            continue
+                    except OnionFilteringError:
+                        task.reset()
+                        self.logger.warning(f'Onion Filtering Connection Error, {task.uuid} Send back in queue')
+                        time.sleep(10)
+                        break
+
+            task.start()
+            tasks.append((task, priority))
+
+        # Enqueue the Captures concurrently
+        error = None
+        for task_row, res in self.capture_manager.map(self.enqueue_capture, tasks, args=lambda row: (row[0].uuid, row[1])):
+            if isinstance(res, Exception):
+                task, priority = task_row
+                print(task_row)
+                task = crawlers.CrawlerTask(task.uuid)
+                task.add_to_db_crawler_queue(priority)
+                if isinstance(res, ConnectionError):
+                    error = ConnectionError
+                else:
+                    error = res
+        if error is ConnectionError:
+            self.refresh_lacus_status()
+        elif error:
+            raise error
+
+    def update_capture_status(self, capture, status):
+        """
+        Update the status of a capture
+
+        :return: True if the capture is completed
+        """
+        print(status)
+        if status == crawlers.CaptureStatus.DONE:
+            # Captures completed are processed once
+            return crawlers.pop_crawler_capture(capture.uuid)
+        elif status == crawlers.CaptureStatus.UNKNOWN:
+            capture_start = capture.get_start_time(r_str=False)
+            if capture_start == 0:
+                task = capture.get_task()
+                task.delete()
+                capture.delete()
+                self.logger.warning(f'capture UNKNOWN ERROR STATE, {task.uuid} Removed from queue')
+                return False
+            if int(time.time()) - capture_start > 600:  # TODO ADD in new crawler config
+                task = capture.get_task()
+                task.reset()
+                capture.delete()
+                self.logger.warning(f'capture UNKNOWN Timeout, {task.uuid} Send back in queue')
+            else:
+                capture.update(status)
+        elif status == crawlers.CaptureStatus.QUEUED:
+            capture_start = capture.get_start_time(r_str=False)
+            if int(time.time()) - capture_start > 36000:  # TODO ADD in new crawler config
+                task = capture.get_task()
+                task.reset()
+                capture.delete()
+                self.logger.warning(f'capture QUEUED Timeout, {task.uuid}, {task.get_url()} Send back in queue, start_time={capture_start}')
+            else:
+                capture.update(status)
+            print(capture.uuid, crawlers.CaptureStatus(status).name, int(time.time()))
+        elif status == crawlers.CaptureStatus.ONGOING:
+            capture.update(status)
+            print(capture.uuid, crawlers.CaptureStatus(status).name, int(time.time()))
+        # Invalid State
+        else:
+            task = capture.get_task()
+            task.reset()
+            capture.delete()
+            self.logger.warning(f'ERROR INVALID CAPTURE STATUS {status}, {task.uuid} Send back in queue')
+        return False
+
     def enqueue_capture(self, task_uuid, priority):
         task = crawlers.CrawlerTask(task_uuid)
+        task.load()
         # print(task)
         # task = {
         #         'uuid': task_uuid,
@@ -296,6 +412,7 @@ class Crawler(AbstractModule):
         print('saving capture', capture.uuid)
 
         task = capture.get_task()
+        task.load()
         domain = task.get_domain()
         print(domain)
         if not domain:
@@ -368,6 +485,19 @@ class Crawler(AbstractModule):
         self.root_item = None
 
     def save_capture_response(self, parent_id, entries):
+        nodes = []
+        if not self.get_capture_nodes(parent_id, entries, nodes):
+            return False
+        self.save_capture_nodes(nodes)
+        return True
+
+    def get_capture_nodes(self, parent_id, entries, nodes):
+        """
+        Walk the capture tree: follow the redirections and create the items ids of the pages
+
+        :param nodes: list of the pages of the capture, filled in crawl order
+        :return: False if the domain is filtered
+        """
         print(entries.keys())
         if 'error' in entries:
             # TODO IMPROVE ERROR MESSAGE
@@ -400,12 +530,47 @@ class Crawler(AbstractModule):
 
         if 'html' in entries and entries.get('html'):
             item_id = crawlers.create_item_id(self.items_dir, self.domain.id)
+            node = {'item_id': item_id, 'parent_id': parent_id, 'last_url': last_url, 'domain': self.domain.id,
+                    'html': entries['html'], 'favicons': entries.get('potential_favicons')}
+            if self.screenshot:
+                node['png'] = entries.get('png')
+            if self.har and entries.get('har'):
+                node['har'] = entries['har']
+                node['har_id'] = crawlers.create_har_id(self.date, item_id)
+            nodes.append(node)
+            if self.root_item is None:
+                self.root_item = item_id
+            parent_id = item_id
+
+        # Next Children
+        entries_children = entries.get('children')
+        if entries_children:
+            for children in entries_children:
+                self.get_capture_nodes(parent_id, children, nodes)
+        return True
+
+    def save_capture_nodes(self, nodes):
+        """
+        Save the pages of a capture, the objects are extracted by the post-processing workers
+
+        :param nodes: list of the pages of the capture, in crawl order
+        """
+        date = self.date.replace('/', '')
+        if self.post_processing_pool and len(nodes) > 1:
+            results = self.post_processing_pool.imap(_process_capture_node, nodes)
+        else:
+            results = map(_process_capture_node, nodes)
+
+        # objects seen by the domain, added once by capture: (obj type, obj id, domain): [obj, nb]
+        domain_objs = {}
+        correlations = []
+        for node, res in zip(nodes, results):
+            item_id = node['item_id']
             item = Item(item_id)
             print(item.id)
 
-            gzip64encoded = crawlers.get_gzipped_b64_item(item.id, entries['html'])
             # send item to Global
-            relay_message = f'crawler {gzip64encoded}'
+            relay_message = f'crawler {res["gzip64"]}'
             self.add_message_to_queue(obj=item, message=relay_message, queue='Importers')
 
             # Tag # TODO replace me with metadata to tags
@@ -413,28 +578,18 @@ class Crawler(AbstractModule):
             self.add_message_to_queue(obj=item, message=msg, queue='Tags')
 
             # TODO replace me with metadata to add
-            crawlers.create_item_metadata(item_id, last_url, parent_id)
-            if self.root_item is None:
-                self.root_item = item_id
-            parent_id = item_id
+            crawlers.create_item_metadata(item_id, node['last_url'], node['parent_id'])
 
             # DOM-HASH
-            dom_hash = DomHashs.create(entries['html'])
-            dom_hash.add(self.date.replace('/', ''), item)
-            dom_hash.add_correlation('domain', '', self.domain.id)
+            dom_hash = DomHashs.create(node['html'], obj_id=res['dom_hash'])
+            dom_hash.add(date, item)
+            correlations.append((dom_hash.type, '', dom_hash.id, 'domain', '', node['domain']))
 
             # TITLE
-            signal.alarm(60)
-            try:
-                title_content = crawlers.extract_title_from_html(entries['html'])
-            except TimeoutException:
+            if res['title_timeout']:
                 self.logger.warning(f'BeautifulSoup HTML parser timeout: {item_id}')
-                title_content = None
-            else:
-                signal.alarm(0)
-
-            if title_content:
-                title = Titles.create_title(title_content)
+            if res['title']:
+                title = Titles.create_title(res['title'])
                 title.add(item.get_date(), item)
                 # Tracker
                 self.tracker_yara.compute_manual(title)
@@ -445,47 +600,45 @@ class Crawler(AbstractModule):
                 self.add_message_to_queue(obj=title, message=msg, queue='Titles')
 
             # SCREENSHOT
-            if self.screenshot:
-                if 'png' in entries and entries.get('png'):
-                    screenshot = Screenshots.create_screenshot(entries['png'], b64=False)
-                    if screenshot:
-                        if not screenshot.is_tags_safe():
-                            unsafe_tag = 'dark-web:topic="pornography-child-exploitation"'
-                            self.domain.add_tag(unsafe_tag)
-                            item.add_tag(unsafe_tag)
-                        # Remove Placeholder pages # TODO Replace with warning list ???
-                        if screenshot.id not in self.placeholder_screenshots:
-                            # Create Correlations
-                            screenshot.add_correlation('item', '', item_id)
-                            screenshot.add_correlation('domain', '', self.domain.id)
-                        self.add_message_to_queue(obj=screenshot, queue='Images')
+            if res['screenshot']:
+                screenshot = Screenshots.Screenshot(res['screenshot'])
+                if not screenshot.is_tags_safe():
+                    unsafe_tag = 'dark-web:topic="pornography-child-exploitation"'
+                    self.domain.add_tag(unsafe_tag)
+                    item.add_tag(unsafe_tag)
+                # Remove Placeholder pages # TODO Replace with warning list ???
+                if screenshot.id not in self.placeholder_screenshots:
+                    # Create Correlations
+                    correlations.append((screenshot.type, '', screenshot.id, 'item', '', item_id))
+                    correlations.append((screenshot.type, '', screenshot.id, 'domain', '', node['domain']))
+                self.add_message_to_queue(obj=screenshot, queue='Images')
+
             # HAR
-            if self.har:
-                if 'har' in entries and entries.get('har'):
-                    har_id = crawlers.create_har_id(self.date, item_id)
-                    crawlers.save_har(har_id, entries['har'])
-                    for cookie_name in crawlers.extract_cookies_names_from_har(entries['har']):
-                        print(cookie_name)
-                        cookie = CookiesNames.create(cookie_name)
-                        cookie.add(self.date.replace('/', ''), self.domain)
-                    for etag_content in crawlers.extract_etag_from_har(entries['har']):
-                        print(etag_content)
-                        etag = Etags.create(etag_content)
-                        etag.add(self.date.replace('/', ''), self.domain)
-                    crawlers.extract_hhhash(entries['har'], self.domain.id, self.date.replace('/', ''))
+            objs = []
+            for cookie_name in res['cookies']:
+                print(cookie_name)
+                objs.append(CookiesNames.create(cookie_name))
+            for etag_content in res['etags']:
+                print(etag_content)
+                objs.append(Etags.create(etag_content))
+            for hhhash, hhhash_header in res['hhhashs'].items():
+                objs.append(HHHashs.create(hhhash_header, hhhash))
+            for obj in objs:
+                key = (obj.type, obj.id, node['domain'])
+                if key in domain_objs:
+                    domain_objs[key][1] += 1
+                else:
+                    domain_objs[key] = [obj, 1]
 
             # FAVICON
-            if entries.get('potential_favicons'):
-                for favicon in entries['potential_favicons']:
+            if node['favicons']:
+                for favicon in node['favicons']:
                     fav = Favicons.create(favicon)
                     fav.add(item.get_date(), item)
 
-        # Next Children
-        entries_children = entries.get('children')
-        if entries_children:
-            for children in entries_children:
-                self.save_capture_response(parent_id, children)
-        return True
+        for (_, _, domain), (obj, nb) in domain_objs.items():
+            obj.add(date, Domain(domain), nb=nb)
+        correlations_engine.add_obj_correlations(correlations)
 
 
 if __name__ == '__main__':
@@ -7,11 +7,16 @@ The ``Domain``
 
 """
 
+import json
 import os
 import sys
+import threading
+import time
 import redis
 import configparser
 
+from contextlib import contextmanager
+
 # Get Config file
 config_dir = os.path.join(os.environ['AIL_HOME'], 'configs')
 default_config_file = os.path.join(config_dir, 'core.cfg')
@@ -24,6 +29,163 @@ if not os.path.exists(default_config_file):
 
  # # TODO: add config_field to reload
 
+# # # # CONNECTION POOLS # # # #
+
+class _MetricsConnectionMixin(object):
+    """
+    Count the commands, the round-trips and the time spent waiting for the responses
+    """
+
+    def __init__(self, *args, metrics=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics = metrics
+
+    def connect(self, *args, **kwargs):
+        if self._sock is None:
+            self._metrics['connections'] += 1
+        return super().connect(*args, **kwargs)
+
+    def send_packed_command(self, *args, **kwargs):
+        self._metrics['round_trips'] += 1
+        return super().send_packed_command(*args, **kwargs)
+
+    def read_response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            self._metrics['commands'] += 1
+            self._metrics['wait_time'] += time.perf_counter() - start
+
+class MetricsConnection(_MetricsConnectionMixin, redis.Connection):
+    pass
+
+class MetricsUnixDomainSocketConnection(_MetricsConnectionMixin, redis.UnixDomainSocketConnection):
+    pass
+
+# Process-wide connection pools: (host, port, db, password, unix socket, decode_responses): pool
+_pools = {}
+_pools_names = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(host='localhost', port=6379, db=0, password=None, unix_socket_path=None,
+                        decode_responses=True, name=None):
+    """
+    Get the process-wide connection pool of a Redis/Kvrocks server, created on first use
+
+    :param unix_socket_path: connect with an unix socket instead of host/port
+    :param name: config section using this pool
+    """
+    key = (host, port, db, password, unix_socket_path, decode_responses)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                metrics = {'connections': 0, 'round_trips': 0, 'commands': 0, 'wait_time': 0.0}
+                if unix_socket_path:
+                    pool = redis.ConnectionPool(connection_class=MetricsUnixDomainSocketConnection,
+                                                path=unix_socket_path, db=db, password=password,
+                                                decode_responses=decode_responses, metrics=metrics)
+                else:
+                    pool = redis.ConnectionPool(connection_class=MetricsConnection,
+                                                host=host, port=port, db=db, password=password,
+                                                decode_responses=decode_responses, metrics=metrics)
+                _pools[key] = pool
+                _pools_names[key] = set()
+    if name:
+        _pools_names[key].add(name)
+    return pool
+
+def get_pools_metrics():
+    """
+    :return: list of the metrics of the connection pools of this process
+    """
+    pools_metrics = []
+    for key, pool in list(_pools.items()):
+        host, port, db, _, unix_socket_path, decode_responses = key
+        metrics = dict(pool.connection_kwargs['metrics'])
+        if unix_socket_path:
+            metrics['server'] = f'unix://{unix_socket_path}/{db}'
+        else:
+            metrics['server'] = f'{host}:{port}/{db}'
+        metrics['names'] = sorted(_pools_names[key])
+        metrics['decode_responses'] = decode_responses
+        metrics['in_use'] = len(pool._in_use_connections)
+        metrics['available'] = len(pool._available_connections)
+        if metrics['round_trips']:
+            metrics['latency'] = metrics['wait_time'] / metrics['round_trips']
+        else:
+            metrics['latency'] = 0.0
+        pools_metrics.append(metrics)
+    return pools_metrics
+
+# Redis_Cache client of the pools metrics, created on first use
+_r_metrics = None
+
+def _get_metrics_conn():
+    global _r_metrics
+    if _r_metrics is None:
+        _r_metrics = ConfigLoader().get_redis_conn('Redis_Cache')
+    return _r_metrics
+
+def save_pools_metrics(process_name, ttl=300):
+    """
+    Save the connection pools metrics of this process in Redis_Cache, expire after ttl seconds
+    """
+    r_cache = _get_metrics_conn()
+    process_name = f'{process_name}:{os.getpid()}'
+    pipe = r_cache.pipeline(transaction=False)
+    pipe.setex(f'redis:pools:metrics:{process_name}', ttl, json.dumps(get_pools_metrics()))
+    pipe.zadd('redis:pools:metrics', {process_name: time.time()})
+    pipe.zremrangebyscore('redis:pools:metrics', '-inf', time.time() - ttl)
+    pipe.execute()
+
+def get_all_processes_pools_metrics():
+    """
+    :return: dict, process name: connection pools metrics
+    """
+    r_cache = _get_metrics_conn()
+    processes = r_cache.zrange('redis:pools:metrics', 0, -1)
+    all_metrics = {}
+    if processes:
+        for process_name, metrics in zip(processes, r_cache.mget([f'redis:pools:metrics:{p}' for p in processes])):
+            if metrics:
+                all_metrics[process_name] = json.loads(metrics)
+    return all_metrics
+
+# Pipelines of the current batches, by thread
+_batches = threading.local()
+
+@contextmanager
+def batch(r_conn, transaction=False):
+    """
+    Group the commands sent to r_conn in one pipeline, executed at the end of the block
+
+    A nested batch on the same connection joins the outer batch.
+    Nothing is sent if the block raises an exception.
+
+        with batch(r_db) as pipe:
+            pipe.sadd(key, member)
+            pipe.hincrby(key2, field, 1)
+    """
+    pipes = getattr(_batches, 'pipes', None)
+    if pipes is None:
+        pipes = _batches.pipes = {}
+    pipe = pipes.get(id(r_conn))
+    if pipe is not None:
+        yield pipe
+        return
+    pipe = r_conn.pipeline(transaction=transaction)
+    pipes[id(r_conn)] = pipe
+    try:
+        yield pipe
+        pipes.pop(id(r_conn), None)
+        pipe.execute()
+    finally:
+        pipes.pop(id(r_conn), None)
+        pipe.reset()
+
 class ConfigLoader(object):
     """docstring for Config_Loader."""
 
@@ -34,17 +196,30 @@ class ConfigLoader(object):
         else:
             self.cfg.read(default_config_file)
 
+    def _get_unix_socket_path(self, section):
+        if self.cfg.has_option(section, 'unixsocket'):
+            unix_socket_path = self.cfg.get(section, 'unixsocket')
+            if unix_socket_path:
+                return unix_socket_path
+        return None
+
     def get_redis_conn(self, redis_name, decode_responses=True):
-        return redis.StrictRedis(host=self.cfg.get(redis_name, "host"),
-                                  port=self.cfg.getint(redis_name, "port"),
-                                  db=self.cfg.getint(redis_name, "db"),
-                                  decode_responses=decode_responses)
+        pool = get_connection_pool(host=self.cfg.get(redis_name, "host"),
+                                   port=self.cfg.getint(redis_name, "port"),
+                                   db=self.cfg.getint(redis_name, "db"),
+                                   unix_socket_path=self._get_unix_socket_path(redis_name),
+                                   decode_responses=decode_responses,
+                                   name=redis_name)
+        return redis.StrictRedis(connection_pool=pool)
 
     def get_db_conn(self, db_name, decode_responses=True):
-        return redis.StrictRedis(host=self.cfg.get(db_name, "host"),
-                                  port=self.cfg.getint(db_name, "port"),
-                                  password=self.cfg.get(db_name, "password"),
-                                  decode_responses=decode_responses)
+        pool = get_connection_pool(host=self.cfg.get(db_name, "host"),
+                                   port=self.cfg.getint(db_name, "port"),
+                                   password=self.cfg.get(db_name, "password"),
+                                   unix_socket_path=self._get_unix_socket_path(db_name),
+                                   decode_responses=decode_responses,
+                                   name=db_name)
+        return redis.StrictRedis(connection_pool=pool)
 
     def get_files_directory(self, key_name):
         directory_path = self.cfg.get('Directories', key_name)
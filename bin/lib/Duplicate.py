@@ -2,12 +2,16 @@
 # -*-coding:UTF-8 -*
 
 import os
+import random
+import re
 import ssdeep
 import sys
 import time
 import tlsh
+import xxhash
 
 import datetime
+import numpy as np
 
 sys.path.append(os.environ['AIL_BIN'])
 ##################################
@@ -18,6 +22,14 @@ from lib.ConfigLoader import ConfigLoader
 config_loader = ConfigLoader()
 r_serv_db = config_loader.get_db_conn("Kvrocks_Duplicates")
 MIN_ITEM_SIZE = float(config_loader.get_config_str('Modules_Duplicates', 'min_paste_size')) # # TODO: RENAME ME
+if config_loader.has_option('Modules_Duplicates', 'cache_refresh'):
+    CACHE_REFRESH = config_loader.get_config_int('Modules_Duplicates', 'cache_refresh')
+else:
+    CACHE_REFRESH = 30
+if config_loader.has_option('Modules_Duplicates', 'cache_max_hashs'):
+    CACHE_MAX_HASHS = config_loader.get_config_int('Modules_Duplicates', 'cache_max_hashs')
+else:
+    CACHE_MAX_HASHS = 1000000
 config_loader = None
 
 #
@@ -68,7 +80,293 @@ def get_object_id_by_hash(algo, hash, date_ymonth):
     return r_serv_db.hget(f'duplicates:hashs:{algo}:{date_ymonth}', hash)
 
 def save_object_hash(algo, date_ymonth, hash, obj_id):
-    r_serv_db.hset(f'duplicates:hashs:{algo}:{date_ymonth}', hash, obj_id)
+    """
+    :return: size of the month segment
+    """
+    pipe = r_serv_db.pipeline(transaction=False)
+    pipe.hset(f'duplicates:hashs:{algo}:{date_ymonth}', hash, obj_id)
+    pipe.rpush(f'duplicates:segment:{algo}:{date_ymonth}', hash)
+    return pipe.execute()[1]
+
+# # # # # # # # # # # # #
+#                       #
+#     HASH SEGMENTS     #
+#                       #
+# # # # # # # # # # # # #
+
+# Append-only list of the hashs saved in a month, read incrementally by the hashs caches
+
+def get_segment_size(algo, date_ymonth):
+    return r_serv_db.llen(f'duplicates:segment:{algo}:{date_ymonth}')
+
+def get_segment_hashs(algo, date_ymonth, start=0):
+    return r_serv_db.lrange(f'duplicates:segment:{algo}:{date_ymonth}', start, -1)
+
+def get_segment_hashs_by_offsets(algo, offsets_by_month):
+    """
+    :param offsets_by_month: dict, date_ymonth: offsets of the hashs in the segment
+    :return: dict, date_ymonth: set of hashs
+    """
+    pipe = r_serv_db.pipeline(transaction=False)
+    months = []
+    for date_ymonth, offsets in offsets_by_month.items():
+        for offset in offsets:
+            pipe.lindex(f'duplicates:segment:{algo}:{date_ymonth}', int(offset))
+            months.append(date_ymonth)
+    hashs = {date_ymonth: set() for date_ymonth in offsets_by_month}
+    if months:
+        for date_ymonth, hash_ in zip(months, pipe.execute()):
+            if hash_:
+                hashs[date_ymonth].add(hash_)
+    return hashs
+
+def is_segment_built(algo, date_ymonth):
+    return r_serv_db.sismember(f'duplicates:segments:{algo}', date_ymonth)
+
+def build_segment(algo, date_ymonth):
+    """
+    Create the segment of a month from its hashs, months saved before the segments
+    """
+    hashs = get_algo_hashs_by_month(algo, date_ymonth)
+    pipe = r_serv_db.pipeline()
+    pipe.delete(f'duplicates:segment:{algo}:{date_ymonth}')
+    for i in range(0, len(hashs), 1000):
+        pipe.rpush(f'duplicates:segment:{algo}:{date_ymonth}', *hashs[i:i + 1000])
+    pipe.sadd(f'duplicates:segments:{algo}', date_ymonth)
+    pipe.execute()
+
+# # # # # # # # # # # # #
+#                       #
+#   SIMILARITY INDEX    #
+#                       #
+# # # # # # # # # # # # #
+
+# Index keys are 32 bits hashs of the index grams/bands: collisions only add candidates, scored before being kept
+
+# ssdeep only compare hashs with a common substring of 7 characters in the chunks of the same block size
+SSDEEP_NGRAM = 7
+# Minimizers: the smallest 5-gram of each window of 3 consecutive 5-grams.
+# Two chunks sharing a 7 characters substring share a window, and so a minimizer.
+SSDEEP_MINIMIZER_LENGTH = 5
+SSDEEP_MINIMIZER_WINDOW = SSDEEP_NGRAM - SSDEEP_MINIMIZER_LENGTH + 1
+# TLSH body: 128 buckets of 2 bits. Bucket sampling LSH: 48 tables of 8 sampled buckets
+TLSH_BODY_LENGTH = 64
+TLSH_LSH_TABLES = 48
+TLSH_LSH_BUCKETS = 8
+# Fixed seed: the sampled buckets are the same in all the processes
+_tlsh_rand = random.Random(1337)
+TLSH_LSH_SAMPLES = [_tlsh_rand.sample(range(TLSH_BODY_LENGTH * 2), TLSH_LSH_BUCKETS) for _ in range(TLSH_LSH_TABLES)]
+_tlsh_rand = None
+
+def _get_index_key(key):
+    return xxhash.xxh32_intdigest(key.encode())
+
+def _ssdeep_eliminate_sequences(chunk):
+    # ssdeep remove sequences of more than 3 identical characters before comparing chunks
+    return re.sub(r'(.)\1{3,}', r'\1\1\1', chunk)
+
+def _get_ssdeep_chunk_minimizers(b_size, chunk):
+    keys = set()
+    if len(chunk) < SSDEEP_NGRAM:
+        return keys
+    grams = []
+    for i in range(len(chunk) - SSDEEP_MINIMIZER_LENGTH + 1):
+        grams.append(_get_index_key(f'{b_size}:{chunk[i:i + SSDEEP_MINIMIZER_LENGTH]}'))
+    for i in range(len(grams) - SSDEEP_MINIMIZER_WINDOW + 1):
+        keys.add(min(grams[i:i + SSDEEP_MINIMIZER_WINDOW]))
+    return keys
+
+def get_ssdeep_index_keys(ssdeep_hash):
+    """
+    Hashs with a non zero similarity share at least one key: a minimizer of a chunk with the same block size
+    """
+    keys = set()
+    try:
+        block_size, chunk1, chunk2 = ssdeep_hash.split(':', 2)
+        block_size = int(block_size)
+    except ValueError:
+        return keys
+    chunk2 = chunk2.split(',', 1)[0]
+    for b_size, chunk in ((block_size, chunk1), (block_size * 2, chunk2)):
+        keys |= _get_ssdeep_chunk_minimizers(b_size, _ssdeep_eliminate_sequences(chunk))
+    return keys
+
+def get_tlsh_index_keys(tlsh_hash):
+    """
+    Locality sensitive keys: the values of sampled buckets of the TLSH body.
+    Similar hashs have at least one identical sample, with a high probability
+    """
+    keys = set()
+    if len(tlsh_hash) < TLSH_BODY_LENGTH:  # TNULL
+        return keys
+    try:
+        body = bytes.fromhex(tlsh_hash[-TLSH_BODY_LENGTH:])
+    except ValueError:
+        return keys
+    buckets = []
+    for byte in body:
+        buckets.extend(((byte >> 6) & 3, (byte >> 4) & 3, (byte >> 2) & 3, byte & 3))
+    for i, sample in enumerate(TLSH_LSH_SAMPLES):
+        keys.add(_get_index_key(f'{i}:' + ''.join(str(buckets[b]) for b in sample)))
+    return keys
+
+def get_algo_index_keys(algo, hash_):
+    if algo == 'ssdeep':
+        return get_ssdeep_index_keys(hash_)
+    elif algo == 'tlsh':
+        return get_tlsh_index_keys(hash_)
+    return set()
+
+
+class _MonthIndex:
+    """
+    Postings of the hashs of a month: index key -> offset of the hash in the month segment
+
+    The postings are packed in a sorted numpy array of uint64, (key << 32) | offset: 8 bytes by posting.
+    The hashs themselves are not kept in memory, the candidates are read from the segment.
+    The postings added since the last merge are kept in a dict.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.postings = np.empty(0, dtype=np.uint64)
+        self.pending = {}
+        self.nb_pending = 0
+
+    def __len__(self):
+        return self.offset
+
+    def get_memory_size(self):
+        return self.postings.nbytes + self.nb_pending * 8
+
+    def add(self, offset, keys):
+        for key in keys:
+            if key not in self.pending:
+                self.pending[key] = []
+            self.pending[key].append(offset)
+        self.nb_pending += len(keys)
+
+    def merge(self, force=False):
+        # Merge when the pending postings reach 1/8 of the array, the array is sorted again
+        if not self.nb_pending or (not force and self.nb_pending < max(100000, len(self.postings) // 8)):
+            return None
+        pending = np.fromiter(((key << 32) | offset for key, offsets in self.pending.items() for offset in offsets),
+                              dtype=np.uint64, count=self.nb_pending)
+        self.postings = np.sort(np.concatenate((self.postings, pending)))
+        self.pending = {}
+        self.nb_pending = 0
+
+    def get_offsets(self, keys):
+        offsets = set()
+        if not keys:
+            return offsets
+        if len(self.postings):
+            np_keys = np.fromiter(keys, dtype=np.uint64, count=len(keys)) << np.uint64(32)
+            starts = np.searchsorted(self.postings, np_keys)
+            ends = np.searchsorted(self.postings, np_keys | np.uint64(0xFFFFFFFF), side='right')
+            for start, end in zip(starts, ends):
+                if start != end:
+                    offsets.update((self.postings[start:end] & np.uint64(0xFFFFFFFF)).tolist())
+        for key in keys:
+            offsets.update(self.pending.get(key, ()))
+        return offsets
+
+
+class HashsCache:
+    """
+    In-memory similarity index of the hashs of the last months, used by the Duplicates module
+
+    Loaded from the hash segments and refreshed every CACHE_REFRESH seconds with the hashs
+    appended since the last refresh. Only the postings are kept in memory, about 400 bytes
+    by ssdeep or TLSH hash. The months are loaded from the most recent one, the older months
+    are not indexed if the index reaches max_hashs hashs.
+    """
+
+    def __init__(self, algo, nb_months, refresh_time=CACHE_REFRESH, max_hashs=CACHE_MAX_HASHS):
+        self.algo = algo
+        self.nb_months = nb_months
+        self.refresh_time = refresh_time
+        self.max_hashs = max_hashs
+        self.last_refresh = 0
+        # date_ymonth: _MonthIndex
+        self.months = {}
+        # months not indexed, max_hashs reached
+        self.skipped = []
+
+    def get_months(self):
+        return list(self.months.keys())
+
+    def get_nb_hashs(self):
+        return sum(len(month) for month in self.months.values())
+
+    def get_memory_size(self):
+        return sum(month.get_memory_size() for month in self.months.values())
+
+    def refresh(self, force=False):
+        now = time.time()
+        if not force and now - self.last_refresh < self.refresh_time:
+            return None
+        self.last_refresh = now
+
+        dates = get_last_x_month_dates(self.nb_months)
+        for date_ymonth in list(self.months.keys()):
+            if date_ymonth not in dates:
+                self.months.pop(date_ymonth)
+        self.skipped = []
+        nb_hashs = 0
+        for date_ymonth in dates:
+            month = self.months.get(date_ymonth)
+            if month is None:
+                if nb_hashs >= self.max_hashs:
+                    self.skipped.append(date_ymonth)
+                    continue
+                if not is_segment_built(self.algo, date_ymonth):
+                    build_segment(self.algo, date_ymonth)
+                month = _MonthIndex()
+                self.months[date_ymonth] = month
+            hashs = get_segment_hashs(self.algo, date_ymonth, start=month.offset)
+            for hash_ in hashs:
+                month.add(month.offset, get_algo_index_keys(self.algo, hash_))
+                month.offset += 1
+            month.merge(force=not month.postings.size)
+            nb_hashs += len(month)
+
+    def add(self, date_ymonth, hash_, segment_size):
+        """
+        Add a hash saved by this worker, without waiting for the next refresh
+
+        :param segment_size: size of the segment after the save of the hash
+        """
+        month = self.months.get(date_ymonth)
+        if month is not None:
+            # hashs added by other workers are read by the next refresh
+            if segment_size == month.offset + 1:
+                month.add(month.offset, get_algo_index_keys(self.algo, hash_))
+                month.offset += 1
+                month.merge()
+
+    def get_candidates(self, hash_):
+        """
+        :return: dict, date_ymonth: hashs of the month that can be similar to hash_, including hash_ if it exists
+        """
+        keys = get_algo_index_keys(self.algo, hash_)
+        offsets = {}
+        for date_ymonth, month in self.months.items():
+            offsets[date_ymonth] = month.get_offsets(keys)
+        candidates = get_segment_hashs_by_offsets(self.algo, offsets)
+        # Exact match of the hashs without index keys (TLSH TNULL, short ssdeep chunks) and in the months not indexed
+        if keys:
+            months = self.skipped
+        else:
+            months = self.get_months() + self.skipped
+        if months:
+            pipe = r_serv_db.pipeline(transaction=False)
+            for date_ymonth in months:
+                pipe.hexists(f'duplicates:hashs:{self.algo}:{date_ymonth}', hash_)
+            for date_ymonth, exists in zip(months, pipe.execute()):
+                if exists:
+                    candidates.setdefault(date_ymonth, set()).add(hash_)
+        return candidates
 
 
 def get_obj_duplicates(obj_type, subtype, obj_id):
@@ -87,16 +385,12 @@ def add_obj_duplicate(algo, similarity, obj_type, subtype, obj_id, id_2):
 
 def add_duplicate(algo, hash_, similarity, obj_type, subtype, obj_id, date_ymonth):
     obj2_id = get_object_id_by_hash(algo, hash_, date_ymonth)
-    # same content
-    if similarity == 100:
-        dups = get_obj_duplicates(obj_type, subtype, obj_id)
-        for dup_id in dups:
-            for algo_dict in dups[dup_id]:
-                if algo_dict['similarity'] == 100 and algo_dict['algo'] == algo:
-                    add_obj_duplicate(algo, similarity, obj_type, subtype, obj_id, dups[dup_id])
-                    add_obj_duplicate(algo, similarity, obj_type, subtype, dups[dup_id], obj_id)
-    add_obj_duplicate(algo, similarity, obj_type, subtype, obj_id, obj2_id)
-    add_obj_duplicate(algo, similarity, obj_type, subtype, obj2_id, obj_id)
+    if not obj2_id or obj2_id == obj_id:
+        return None
+    pipe = r_serv_db.pipeline(transaction=False)
+    pipe.sadd(f'obj:duplicates:{obj_type}:{subtype}:{obj_id}', f'{similarity}:{algo}:{obj2_id}')
+    pipe.sadd(f'obj:duplicates:{obj_type}:{subtype}:{obj2_id}', f'{similarity}:{algo}:{obj_id}')
+    pipe.execute()
 
 # TODO
 def delete_obj_duplicates():
@@ -688,38 +688,109 @@ def get_object_tags(obj_type, obj_id, subtype=''):
     return r_tags.smembers(f'tag:{obj_type}:{subtype}:{obj_id}')
 
 def add_object_tag(tag, obj_type, obj_id, subtype=''):
-    if r_tags.sadd(f'tag:{obj_type}:{subtype}:{obj_id}', tag) == 1:
-        r_tags.sadd('list_tags', tag)
-        r_tags.sadd(f'list_tags:{obj_type}', tag)
-        r_tags.sadd(f'list_tags:{obj_type}:{subtype}', tag)
-        if obj_type == 'item':
-            date = item_basic.get_item_date(obj_id)
-            r_tags.sadd(f'{obj_type}:{subtype}:{tag}:{date}', obj_id)
+    _add_objects_tags([(tag, obj_type, subtype, obj_id)])
 
-            # add domain tag
-            if item_basic.is_crawled(obj_id) and tag != 'infoleak:submission="crawler"' and tag != 'infoleak:submission="manual"':
-                domain = item_basic.get_item_domain(obj_id)
-                add_object_tag(tag, "domain", domain)
+def add_objects_tags(objs_tags):
+    """
+    Tag a batch of objects, the writes are coalesced in pipelines
 
-            update_tag_metadata(tag, date)
-        # MESSAGE
-        elif obj_type == 'message':
-            timestamp = obj_id.split('/')[1]
-            date = datetime.datetime.fromtimestamp(float(timestamp)).strftime('%Y%m%d')
-            r_tags.sadd(f'{obj_type}:{subtype}:{tag}:{date}', obj_id)
+    :param objs_tags: list of (obj, tag)
+    """
+    _add_objects_tags([(tag, obj.type, obj.get_subtype(r_str=True), obj.id) for obj, tag in objs_tags])
 
-            # TODO ADD CHAT TAGS ????
+def _get_object_tag_date(obj_type, obj_id):
+    if obj_type == 'item':
+        return item_basic.get_item_date(obj_id)
+    # MESSAGE
+    elif obj_type == 'message':
+        timestamp = obj_id.split('/')[1]
+        return datetime.datetime.fromtimestamp(float(timestamp)).strftime('%Y%m%d')
 
-            update_tag_metadata(tag, date)
+def _add_objects_tags(objs_tags):
+    """
+    :param objs_tags: list of (tag, obj_type, subtype, obj_id)
+    """
+    # Remove duplicates, keep order
+    objs_tags = list(dict.fromkeys(objs_tags))
+    if not objs_tags:
+        return None
+    pipe = r_tags.pipeline(transaction=False)
+
+    # New objects tags
+    for tag, obj_type, subtype, obj_id in objs_tags:
+        pipe.sadd(f'tag:{obj_type}:{subtype}:{obj_id}', tag)
+    new_tags = [obj_tag for obj_tag, added in zip(objs_tags, pipe.execute()) if added == 1]
+    if not new_tags:
+        return None
+
+    # add domain tag
+    domains_tags = {}
+    for tag, obj_type, subtype, obj_id in new_tags:
+        if obj_type == 'item' and item_basic.is_crawled(obj_id):
+            if tag != 'infoleak:submission="crawler"' and tag != 'infoleak:submission="manual"':
+                domain_tag = (tag, 'domain', '', item_basic.get_item_domain(obj_id))
+                if domain_tag not in domains_tags.values():
+                    domains_tags[(tag, obj_type, subtype, obj_id)] = domain_tag
+                    pipe.sadd(f'tag:domain::{domain_tag[3]}', tag)
+    if domains_tags:
+        added_domains_tags = {}
+        for item_tag, added in zip(domains_tags, pipe.execute()):
+            if added == 1:
+                added_domains_tags[item_tag] = domains_tags[item_tag]
+        # The domain is tagged before the item
+        objs_tags = new_tags
+        new_tags = []
+        for obj_tag in objs_tags:
+            if obj_tag in added_domains_tags:
+                new_tags.append(added_domains_tags[obj_tag])
+            new_tags.append(obj_tag)
+
+    # Items and messages tags first/last seen, by batch
+    dates = {}
+    tags_dates = {}
+    for tag, obj_type, subtype, obj_id in new_tags:
+        if obj_type == 'item' or obj_type == 'message':
+            if (obj_type, obj_id) not in dates:
+                dates[(obj_type, obj_id)] = _get_object_tag_date(obj_type, obj_id)
+            date = int(dates[(obj_type, obj_id)])
+            if tag in tags_dates:
+                tags_dates[tag] = (min(date, tags_dates[tag][0]), max(date, tags_dates[tag][1]))
+            else:
+                tags_dates[tag] = (date, date)
+    tags_metadata = list(tags_dates)
+    for tag in tags_metadata:
+        pipe.hmget(f'tag_metadata:{tag}', 'first_seen', 'last_seen')
+    for tag, (first_seen, last_seen) in zip(tags_metadata, pipe.execute()):
+        first_seen = int(first_seen) if first_seen else 99999999
+        last_seen = int(last_seen) if last_seen else 0
+        if tags_dates[tag][0] < first_seen:
+            pipe.hset(f'tag_metadata:{tag}', 'first_seen', tags_dates[tag][0])
+        if tags_dates[tag][1] > last_seen:
+            pipe.hset(f'tag_metadata:{tag}', 'last_seen', tags_dates[tag][1])
+
+    today = datetime.date.today().strftime("%Y%m%d")
+    now = int(time.time())
+    daily_tags = {}
+    dashboard = []
+    for tag, obj_type, subtype, obj_id in new_tags:
+        pipe.sadd('list_tags', tag)
+        pipe.sadd(f'list_tags:{obj_type}', tag)
+        pipe.sadd(f'list_tags:{obj_type}:{subtype}', tag)
+        if obj_type == 'item' or obj_type == 'message':
+            pipe.sadd(f'{obj_type}:{subtype}:{tag}:{dates[(obj_type, obj_id)]}', obj_id)
         else:
-            r_tags.sadd(f'{obj_type}:{subtype}:{tag}', obj_id)
+            pipe.sadd(f'{obj_type}:{subtype}:{tag}', obj_id)
 
         # STATS
-        r_tags.hincrby(f'daily_tags:{datetime.date.today().strftime("%Y%m%d")}', tag, 1)
-        mess = f'{int(time.time())}:{obj_type}:{subtype}:{obj_id}'
+        daily_tags[tag] = daily_tags.get(tag, 0) + 1
         if tag not in TAGS_TO_EXCLUDE_FROM_DASHBOARD:
-            r_tags.lpush('dashboard:tags', mess)
-            r_tags.ltrim('dashboard:tags', 0, 19)
+            dashboard.append(f'{now}:{obj_type}:{subtype}:{obj_id}')
+    for tag, nb in daily_tags.items():
+        pipe.hincrby(f'daily_tags:{today}', tag, nb)
+    if dashboard:
+        pipe.lpush('dashboard:tags', *dashboard[-20:])
+        pipe.ltrim('dashboard:tags', 0, 19)
+    pipe.execute()
 
 def get_tags_dashboard():
     return r_tags.lrange('dashboard:tags', 0, -1)
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 # -*-coding:UTF-8 -*
+import hashlib
 import json
 import os
 import logging
@@ -25,10 +26,12 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from packages import Date
 from lib.ail_core import get_objects_tracked, get_object_all_subtypes, get_objects_retro_hunted
+from lib.aho_corasick import AhoCorasick
 from lib import ail_logger
 from lib import ail_orgs
 from lib import ConfigLoader
 from lib import item_basic
+from lib import regex_helper
 from lib import Tag
 
 # LOGS
@@ -38,6 +41,10 @@ logger = logging.getLogger()
 config_loader = ConfigLoader.ConfigLoader()
 r_cache = config_loader.get_redis_conn("Redis_Cache")
 r_tracker = config_loader.get_db_conn("Kvrocks_Trackers")
+if config_loader.has_option('Tracker_Yara', 'cache_dir'):
+    YARA_CACHE_DIR = os.path.join(os.environ['AIL_HOME'], config_loader.get_config_str('Tracker_Yara', 'cache_dir'))
+else:
+    YARA_CACHE_DIR = os.path.join(os.environ['AIL_HOME'], 'temp', 'yara')
 config_loader = None
 
 # NLTK tokenizer
@@ -45,9 +52,12 @@ TOKENIZER = None
 
 def init_tokenizer():
     global TOKENIZER
-    TOKENIZER = RegexpTokenizer('[\&\~\:\;\,\.\(\)\{\}\|\[\]\\\\/\-/\=\'\"\%\$\?\@\+\#\_\^\<\>\!\*\n\r\t\s]+',
+    TOKENIZER = RegexpTokenizer(r'[\&\~\:\;\,\.\(\)\{\}\|\[\]\\/\-\=\'\"\%\$\?\@\+\#\_\^\<\>\!\*\n\r\t\s]+',
                                 gaps=True, discard_empty=True)
 
+# Word delimiter, same as TOKENIZER
+TOKEN_SEPARATOR = re.compile(r'[\&\~\:\;\,\.\(\)\{\}\|\[\]\\/\-\=\'\"\%\$\?\@\+\#\_\^\<\>\!\*\n\r\t\s]')
+
 def get_special_characters():
     special_characters = set('[<>~!?@#$%^&*|()_-+={}":;,.\'\n\r\t]/\\')
     special_characters.add('\\s')
@@ -320,7 +330,7 @@ class Tracker:
 
     def get_rule(self):
         yar_path = self.get_tracked()
-        return yara.compile(filepath=os.path.join(get_yara_rules_dir(), yar_path))
+        return compile_yara_rules({'default': os.path.join(get_yara_rules_dir(), yar_path)})
 
     def get_meta(self, options):
         if not options:
@@ -1222,6 +1232,117 @@ def get_text_word_frequency(content, filtering=True):
         words_dict[word] += 1
     return words_dict
 
+class TermMatcher:
+    """
+    Match all the tracked words and sets of an object type in one pass over the content.
+
+    Words and words of sets are compiled in one Aho-Corasick automaton by object type,
+    a match is kept only if it's a full token (delimited by TOKENIZER special characters).
+    Like the tokens matching, a tracked word containing a special character is never matched.
+    """
+
+    def __init__(self, refresh=True):
+        self.words = {}
+        self.sets = {}
+        # obj_type: word: list of set index
+        self.sets_index = {}
+        self.automatons = {}
+        self.last_refresh_word = 0
+        self.last_refresh_set = 0
+        if refresh:
+            self.refresh(force=True)
+
+    def is_tracked_obj_type(self, obj_type):
+        return bool(self.words.get(obj_type) or self.sets.get(obj_type))
+
+    def refresh(self, force=False):
+        """
+        Reload tracked words and/or sets if updated
+        """
+        words = None
+        sets = None
+        if force or self.last_refresh_word < get_tracker_last_updated_by_type('word'):
+            self.last_refresh_word = time.time()
+            words = get_tracked_words()
+        if force or self.last_refresh_set < get_tracker_last_updated_by_type('set'):
+            self.last_refresh_set = time.time()
+            sets = get_tracked_sets()
+        if words is not None or sets is not None:
+            self.load(words=words, sets=sets)
+            return True
+        return False
+
+    def load(self, words=None, sets=None):
+        """
+        Load tracked words and/or sets, only rebuild the automatons of the modified object types
+
+        :param words: dict, obj_type: list of words
+        :param sets: dict, obj_type: list of sets, same format as get_tracked_sets()
+        """
+        if words is not None:
+            self.words = {obj_type: set(obj_words) for obj_type, obj_words in words.items()}
+        if sets is not None:
+            self.sets = sets
+            self.sets_index = {}
+            for obj_type, tracked_sets in self.sets.items():
+                self.sets_index[obj_type] = defaultdict(list)
+                for i, tracked_set in enumerate(tracked_sets):
+                    for word in set(tracked_set['words']):
+                        self.sets_index[obj_type][word].append(i)
+
+        for obj_type in set(self.words) | set(self.sets):
+            patterns = set(self.words.get(obj_type, []))
+            patterns.update(self.sets_index.get(obj_type, {}).keys())
+            # A token doesn't contain special characters
+            patterns = {word for word in patterns if not TOKEN_SEPARATOR.search(word)}
+            automaton = self.automatons.get(obj_type)
+            if automaton is None or set(automaton.patterns) != patterns:
+                self.automatons[obj_type] = AhoCorasick({word: word for word in patterns})
+        for obj_type in list(self.automatons):
+            if obj_type not in self.words and obj_type not in self.sets:
+                self.automatons.pop(obj_type)
+
+    def get_tokens(self, obj_type, content):
+        """
+        :return: set of tracked words found as tokens in the content
+        """
+        automaton = self.automatons.get(obj_type)
+        if not automaton:
+            return set()
+        content = content.lower()
+        len_content = len(content)
+        tokens = set()
+        for start, end, word in automaton.iter(content):
+            if word in tokens:
+                continue
+            if start > 0 and not TOKEN_SEPARATOR.match(content, start - 1):
+                continue
+            if end < len_content and not TOKEN_SEPARATOR.match(content, end):
+                continue
+            tokens.add(word)
+        return tokens
+
+    def match(self, obj_type, content):
+        """
+        :return: (list of tracked words, list of tracked sets) found in the content
+        """
+        tokens = self.get_tokens(obj_type, content)
+        if not tokens:
+            return [], []
+        words = [word for word in tokens if word in self.words.get(obj_type, set())]
+        sets = []
+        sets_index = self.sets_index.get(obj_type)
+        if sets_index:
+            nb_words = defaultdict(int)
+            for word in tokens:
+                for i in sets_index.get(word, []):
+                    nb_words[i] += 1
+            for i, nb in nb_words.items():
+                tracked_set = self.sets[obj_type][i]
+                if nb >= tracked_set['nb']:
+                    sets.append(tracked_set['tracked'])
+        return words, sets
+
 ###############
 #### REGEX ####
 
@@ -1233,6 +1354,59 @@ def get_tracked_regexs():
             to_track[obj_type].append({'regex': re.compile(tracked), 'tracked': tracked})
     return to_track
 
+class RegexMatcher:
+    """
+    Select the tracked regexs to run on a content with a single literal prefilter pass.
+
+    One regex_helper.RegexPrefilter by object type.
+    Only the regexs with a literal found in the content, or without extractable literal, need to be executed.
+    """
+
+    def __init__(self, refresh=True):
+        self.regexs = {}
+        # obj_type: RegexPrefilter
+        self.prefilters = {}
+        self.last_refresh = 0
+        if refresh:
+            self.refresh(force=True)
+
+    def is_tracked_obj_type(self, obj_type):
+        return bool(self.regexs.get(obj_type))
+
+    def refresh(self, force=False):
+        """
+        Reload tracked regexs if updated
+        """
+        if force or self.last_refresh < get_tracker_last_updated_by_type('regex'):
+            self.last_refresh = time.time()
+            self.load(get_tracked_regexs())
+            return True
+        return False
+
+    def load(self, regexs):
+        """
+        :param regexs: dict, obj_type: list of regexs, same format as get_tracked_regexs()
+        """
+        self.regexs = {}
+        self.prefilters = {}
+        for obj_type, tracked_regexs in regexs.items():
+            self.regexs[obj_type] = {}
+            prefilter = regex_helper.RegexPrefilter()
+            for dict_regex in tracked_regexs:
+                self.regexs[obj_type][dict_regex['tracked']] = dict_regex
+                prefilter.add(dict_regex['tracked'], dict_regex['regex'])
+            prefilter.build()
+            self.prefilters[obj_type] = prefilter
+
+    def get_candidates(self, obj_type, content):
+        """
+        :return: list of tracked regexs that can match the content
+        """
+        if obj_type not in self.prefilters:
+            return []
+        tracked_regexs = self.regexs[obj_type]
+        return [tracked_regexs[tracked] for tracked in self.prefilters[obj_type].get_candidates(content)]
+
 ########################
 #### TYPO SQUATTING ####
 
@@ -1285,6 +1459,98 @@ def get_all_tracked_yara_files(filter_disabled=False):
         pass
     return yara_files
 
+## Compiled rules cache ##
+
+# Compiled rules are saved in YARA_CACHE_DIR, keyed by a hash of the rules set content,
+# and loaded by all the modules using the same rules set. A modified rule changes the key.
+
+# Loaded rules, by key
+_yara_rules = {}
+_YARA_RULES_MAX = 64
+# Delete the compiled rules unused since 7 days
+YARA_CACHE_TTL = 7 * 24 * 3600
+
+# include "<filepath>" directive, the path is relative to the including rule file
+YARA_INCLUDE = re.compile(rb'^\s*include\s+"([^"]+)"', re.MULTILINE)
+
+def _update_yara_rule_hash(h, filepath, hashed):
+    """
+    Hash the content of a rule file and of the files it includes
+    """
+    filepath = os.path.realpath(filepath)
+    if filepath in hashed:
+        return None
+    hashed.add(filepath)
+    h.update(f'\x00{filepath}\x00'.encode())
+    try:
+        with open(filepath, 'rb') as f:
+            content = f.read()
+    except OSError:
+        # Missing include, raised by the compilation
+        return None
+    h.update(content)
+    for include in YARA_INCLUDE.findall(content):
+        include = include.decode(errors='replace')
+        _update_yara_rule_hash(h, os.path.join(os.path.dirname(filepath), include), hashed)
+
+def get_yara_rules_key(filepaths):
+    """
+    :param filepaths: dict, namespace: rule filepath
+    :return: hash of the namespaces, paths and content of the rules and of their included files
+    """
+    h = hashlib.sha256(yara.__version__.encode())
+    for namespace in sorted(filepaths):
+        h.update(f'\x00{namespace}\x00{filepaths[namespace]}\x00'.encode())
+        _update_yara_rule_hash(h, filepaths[namespace], set())
+    return h.hexdigest()
+
+def _clean_yara_cache():
+    now = time.time()
+    with os.scandir(YARA_CACHE_DIR) as it:
+        for entry in it:
+            try:
+                if entry.stat().st_mtime < now - YARA_CACHE_TTL:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def compile_yara_rules(filepaths):
+    """
+    Compile a rules set or load it from the compiled rules cache
+
+    :param filepaths: dict, namespace: rule filepath
+    :return: compiled yara.Rules
+    """
+    if not filepaths:
+        return yara.compile(filepaths=filepaths)
+    key = get_yara_rules_key(filepaths)
+    rules = _yara_rules.get(key)
+    if rules:
+        return rules
+
+    filepath = os.path.join(YARA_CACHE_DIR, f'{key}.yarc')
+    try:
+        rules = yara.load(filepath=filepath)
+        os.utime(filepath)
+    except yara.Error:
+        rules = None
+    if not rules:
+        rules = yara.compile(filepaths=filepaths)
+        try:
+            os.makedirs(YARA_CACHE_DIR, exist_ok=True)
+            # Atomic write
+            tmp_filepath = f'{filepath}.{os.getpid()}.tmp'
+            rules.save(filepath=tmp_filepath)
+            os.replace(tmp_filepath, filepath)
+            _clean_yara_cache()
+        except (OSError, yara.Error) as e:
+            logger.warning(f'Yara rules cache: {e}')
+
+    if len(_yara_rules) >= _YARA_RULES_MAX:
+        _yara_rules.clear()
+    _yara_rules[key] = rules
+    return rules
+
 def get_tracked_yara_rules():
     to_track = {}
     for obj_type in get_objects_tracked():
@@ -1295,7 +1561,7 @@ def get_tracked_yara_rules():
                 logger.critical(f"Yara rule don't exists {tracked} : {obj_type}")
             else:
                 rules[tracked] = rule
-        to_track[obj_type] = yara.compile(filepaths=rules)
+        to_track[obj_type] = compile_yara_rules(rules)
     return to_track
 
 def reload_yara_rules():
@@ -1309,7 +1575,7 @@ def reload_yara_rules():
         if not os.path.isfile(rule_dict[tracker_uuid]):
             # TODO IGNORE + LOGS
             raise Exception(f"Error: {rule_dict[tracker_uuid]} doesn't exists")
-    rules = yara.compile(filepaths=rule_dict)
+    rules = compile_yara_rules(rule_dict)
     return rules
 
 def is_valid_yara_rule(yara_rule):
@@ -1502,6 +1768,9 @@ class RetroHunt:
     def set_last_analyzed(self, obj_type, subtype, obj_id):
         return self._set_field('last', f'{obj_type}:{subtype}:{obj_id}')
 
+    def delete_last_analyzed(self):
+        r_tracker.hdel(f'retro_hunt:{self.uuid}', 'last')
+
     def get_last_analyzed_cache(self):
         r_cache.hget(f'retro_hunt:task:{self.uuid}', 'obj')
 
@@ -1553,7 +1822,7 @@ class RetroHunt:
         if r_compile:
             rule = os.path.join(get_yara_rules_dir(), rule)
             rule_dict = {self.uuid: os.path.join(get_yara_rules_dir(), rule)}
-            rule = yara.compile(filepaths=rule_dict)
+            rule = compile_yara_rules(rule_dict)
         return rule
 
     # add timeout ?
@@ -1617,7 +1886,46 @@ class RetroHunt:
     def complete(self):
         self._set_state('completed')
         self.clear_cache()
-        r_tracker.hdel(f'retro_hunt:{self.uuid}', 'last')
+        self.delete_last_analyzed()
+        self.clear_partitions()
+
+    ## PARTITIONS ##
+    # Parallel retro hunt checkpoints, a partition is a subset of the objects to analyze
+
+    def get_partitions_done(self):
+        return r_tracker.smembers(f'retro_hunt:partitions:done:{self.uuid}')
+
+    def add_partition_done(self, partition):
+        r_tracker.sadd(f'retro_hunt:partitions:done:{self.uuid}', partition)
+        r_tracker.hdel(f'retro_hunt:partitions:last:{self.uuid}', partition)
+
+    def get_partition_last(self, partition):
+        return r_tracker.hget(f'retro_hunt:partitions:last:{self.uuid}', partition)
+
+    def set_partition_last(self, partition, obj_id):
+        r_tracker.hset(f'retro_hunt:partitions:last:{self.uuid}', partition, obj_id)
+
+    def has_partitions(self):
+        return r_tracker.exists(f'retro_hunt:partitions:done:{self.uuid}', f'retro_hunt:partitions:last:{self.uuid}') > 0
+
+    def get_nb_done(self):
+        nb_done = self._get_field('nb_done')
+        if nb_done:
+            return int(nb_done)
+        else:
+            return 0
+
+    def incr_nb_done(self, nb):
+        if nb:
+            r_tracker.hincrby(f'retro_hunt:{self.uuid}', 'nb_done', nb)
+
+    def set_nb_done(self, nb):
+        self._set_field('nb_done', nb)
+
+    def clear_partitions(self):
+        r_tracker.delete(f'retro_hunt:partitions:done:{self.uuid}')
+        r_tracker.delete(f'retro_hunt:partitions:last:{self.uuid}')
+        r_tracker.hdel(f'retro_hunt:{self.uuid}', 'nb_done')
 
     def get_progress(self):
         if self.get_state() == 'completed':
@@ -1756,6 +2064,7 @@ class RetroHunt:
         r_tracker.srem('retro_hunts:paused', self.uuid)
         r_tracker.srem('retro_hunts:completed', self.uuid)
 
+        self.clear_partitions()
         self.clear_cache()
         return self.uuid
 
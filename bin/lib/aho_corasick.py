@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+
+"""
+Aho-Corasick Automaton
+======================
+
+Multi-patterns literal search, one linear pass over the content regardless of the number of patterns.
+
+Use the pyahocorasick C extension if installed, a pure python automaton otherwise.
+"""
+
+from collections import deque
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton
+
+    Each pattern is associated to a value, ex: the tracker name.
+    The automaton need to be rebuilt (build()) after adding new patterns.
+    """
+
+    def __init__(self, patterns=None):
+        """
+        :param patterns: dict, pattern: value
+        """
+        self.patterns = {}
+        self._automaton = None
+        # pure python automaton
+        self._goto = []
+        self._fail = []
+        self._out = []
+        if patterns:
+            for pattern, value in patterns.items():
+                self.add(pattern, value)
+            self.build()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def add(self, pattern, value=None):
+        if pattern:
+            self.patterns[pattern] = value if value is not None else pattern
+
+    def build(self):
+        if ahocorasick:
+            self._build_c()
+        else:
+            self._build_py()
+
+    def _build_c(self):
+        automaton = ahocorasick.Automaton()
+        for pattern, value in self.patterns.items():
+            automaton.add_word(pattern, (len(pattern), value))
+        if self.patterns:
+            automaton.make_automaton()
+            self._automaton = automaton
+        else:
+            self._automaton = None
+
+    def _build_py(self):
+        goto = [{}]
+        out = [[]]
+        for pattern, value in self.patterns.items():
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    out.append([])
+                state = next_state
+            out[state].append((len(pattern), value))
+
+        # Breadth-first computation of the failure links
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and char not in goto[f]:
+                    f = fail[f]
+                fail[next_state] = goto[f].get(char, 0)
+                out[next_state] = out[next_state] + out[fail[next_state]]
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def iter(self, content):
+        """
+        Iterate over all the patterns found in content (overlapping matches included)
+
+        :return: iterator of (start, end, value)
+        """
+        if ahocorasick:
+            if self._automaton is None:
+                return
+            for end, (length, value) in self._automaton.iter(content):
+                yield end - length + 1, end + 1, value
+        else:
+            goto = self._goto
+            fail = self._fail
+            out = self._out
+            if len(goto) <= 1:
+                return
+            root = goto[0]
+            state = 0
+            for i, char in enumerate(content):
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0) if state else root.get(char, 0)
+                if out[state]:
+                    for length, value in out[state]:
+                        yield i - length + 1, i + 1, value
+
+    def search(self, content):
+        """
+        :return: set of the values of the patterns found in content
+        """
+        return {value for _, _, value in self.iter(content)}
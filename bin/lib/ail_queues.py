@@ -24,6 +24,36 @@ config_loader = None
 
 MODULES_FILE = os.path.join(os.environ['AIL_HOME'], 'configs', 'modules.cfg')
 
+# Move up to ARGV[1] messages from the module queue to the worker processing list
+# KEYS[1]: module queue, KEYS[2]: worker processing list
+_POP_MESSAGES = r_queues.register_script("""
+local messages = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #messages > 0 then
+    redis.call('LTRIM', KEYS[1], #messages, -1)
+    redis.call('RPUSH', KEYS[2], unpack(messages))
+end
+return {messages, redis.call('LLEN', KEYS[1])}
+""")
+
+# Push messages in a module queue and update the queue stats
+# KEYS[1]: module queue, ARGV[1]: module name, ARGV[2...]: messages
+_PUSH_MESSAGES = r_queues.register_script("""
+local nb = redis.call('RPUSH', KEYS[1], unpack(ARGV, 2))
+redis.call('HSET', 'queues', ARGV[1], nb)
+return nb
+""")
+
+# Put back the messages of a processing list at the head of the module queue
+# KEYS[1]: module queue, KEYS[2]: worker processing list
+_REQUEUE_MESSAGES = r_queues.register_script("""
+local messages = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #messages, 1, -1 do
+    redis.call('LPUSH', KEYS[1], messages[i])
+end
+redis.call('DEL', KEYS[2])
+return #messages
+""")
+
 # # # # # # # #
 #             #
 #  AIL QUEUE  #
@@ -36,12 +66,17 @@ class AILQueue:
         self.name = module_name
         self.pid = module_pid
         self._set_subscriber()
+        # Number of processed messages not yet saved in the stats
+        self.nb_processed = 0
         # Update queue stat
         r_queues.hset('queues', self.name, self.get_nb_messages())
 
         r_queues.sadd('modules', self.name)
         r_queues.hset(f'module:{self.name}', self.pid, -1)
 
+        # Put back the messages popped by the dead workers of this module
+        recover_messages(self.name)
+
     def _set_subscriber(self):
         subscribers = {}
         module_config_loader = ConfigLoader(config_file=MODULES_FILE)  # TODO CHECK IF FILE EXISTS
@@ -68,13 +103,47 @@ class AILQueue:
     def get_nb_messages(self):
         return r_queues.llen(f'queue:{self.name}:in')
 
-    def get_message(self):
+    def _update_stats(self, pipe):
+        pipe.hset(f'module:{self.name}', self.pid, int(time.time()))
+        if self.nb_processed:
+            pipe.hincrby(f'module:processed:{self.name}', self.pid, self.nb_processed)
+            self.nb_processed = 0
+
+    def _get_processing_key(self):
+        return f'queue:{self.name}:processing:{self.pid}'
+
+    def _wait_message(self, timeout, processing=False):
+        """
+        Block until a message is pushed in the queue or until timeout (in seconds)
+
+        :param processing: move the message to the processing list of this worker
+        """
+        if processing:
+            message = r_queues.blmove(f'queue:{self.name}:in', self._get_processing_key(), timeout, 'LEFT', 'RIGHT')
+        else:
+            message = r_queues.blpop(f'queue:{self.name}:in', timeout=timeout)
+            if message:
+                message = message[1]
+        if message:
+            r_queues.hset(f'module:{self.name}', self.pid, int(time.time()))
+        return message
+
+    def get_message(self, timeout=0):
+        """
+        :param timeout: if > 0, block up to timeout seconds if the queue is empty
+        """
+        pipe = r_queues.pipeline(transaction=False)
+        self._update_stats(pipe)
+        pipe.lpop(f'queue:{self.name}:in')
+        pipe.llen(f'queue:{self.name}:in')
+        res = pipe.execute()
+        message, nb_queued = res[-2:]
         # Update queues stats
-        r_queues.hset('queues', self.name, self.get_nb_messages())
-        r_queues.hset(f'module:{self.name}', self.pid, int(time.time()))
+        r_queues.hset('queues', self.name, nb_queued)
 
         # Get Message
-        message = r_queues.lpop(f'queue:{self.name}:in')
+        if not message and timeout:
+            message = self._wait_message(timeout)
         if not message:
             return None
         else:
@@ -88,10 +157,63 @@ class AILQueue:
                 add_processed_obj(obj_global_id, m_hash, module=self.name)
                 return obj_global_id, m_hash, mess
 
-    def rename_message_obj(self, new_id, old_id):
+    def get_messages(self, nb_messages=100, timeout=0):
+        """
+        Pop up to nb_messages messages in one round-trip.
+        The messages are kept in the processing list of this worker until acknowledged by ack_messages,
+        they are put back in the queue if the worker dies.
+
+        :param timeout: if > 0, block up to timeout seconds if the queue is empty
+        :return: list of (obj_global_id, m_hash, message)
+        """
+        pipe = r_queues.pipeline(transaction=False)
+        self._update_stats(pipe)
+        pipe.sadd(f'queue:{self.name}:processing', self.pid)
+        _POP_MESSAGES(keys=[f'queue:{self.name}:in', self._get_processing_key()], args=[nb_messages], client=pipe)
+        messages, nb_queued = pipe.execute()[-1]
+
+        if not messages and timeout:
+            message = self._wait_message(timeout, processing=True)
+            if message:
+                messages = [message]
+                if nb_messages > 1:
+                    next_messages, nb_queued = _POP_MESSAGES(keys=[f'queue:{self.name}:in', self._get_processing_key()],
+                                                             args=[nb_messages - 1])
+                    if next_messages:
+                        messages.extend(next_messages)
+
+        # Update queues stats
+        r_queues.hset('queues', self.name, nb_queued)
+
+        if not messages:
+            return []
+        res = []
+        p_process = r_obj_process.pipeline(transaction=False)
+        for message in messages:
+            row_mess = message.split(';', 1)
+            if len(row_mess) != 2:
+                res.append((None, None, message))
+            else:
+                obj_global_id, mess = row_mess
+                m_hash = xxhash.xxh3_64_hexdigest(message)
+                add_processed_obj(obj_global_id, m_hash, module=self.name, r_pipe=p_process)
+                res.append((obj_global_id, m_hash, mess))
+        p_process.execute()
+        return res
+
+    def ack_messages(self, nb_messages):
+        """
+        Remove the first nb_messages processed messages from the processing list of this worker
+        """
+        r_queues.ltrim(self._get_processing_key(), nb_messages, -1)
+
+    def rename_message_obj(self, new_id, old_id, m_hash=None):
+        """
+        :param m_hash: hash of the message, rename only the message processed by this module
+        """
         # restrict rename function
         if self.name == 'Mixer' or self.name == 'Global':
-            rename_processed_obj(new_id, old_id)
+            rename_processed_obj(new_id, old_id, module=self.name, m_hash=m_hash)
         else:
             raise ModuleQueueError('This Module can\'t rename an object ID')
 
@@ -100,8 +222,16 @@ class AILQueue:
 
     def end_message(self, obj_global_id, m_hash):
         end_processed_obj(obj_global_id, m_hash, module=self.name)
+        self.nb_processed += 1
 
-    def send_message(self, obj_global_id, message='', queue_name=None):
+    def end_messages(self, messages):
+        """
+        :param messages: list of (obj_global_id, m_hash)
+        """
+        end_processed_objs(messages, module=self.name)
+        self.nb_processed += len(messages)
+
+    def _get_queue_subscribers(self, queue_name):
         if not self.subscribers_modules:
             raise ModuleQueueError('This Module don\'t have any subscriber')
         if queue_name:
@@ -111,22 +241,46 @@ class AILQueue:
             if len(self.subscribers_modules) > 1:
                 raise ModuleQueueError('Queue name required. This module push to multiple queues')
             queue_name = list(self.subscribers_modules)[0]
+        return self.subscribers_modules[queue_name]
 
-        message = f'{obj_global_id};{message}'
-        if obj_global_id != '::':
-            m_hash = xxhash.xxh3_64_hexdigest(message)
-        else:
-            m_hash = None
-
-        # Add message to all modules
-        for module_name in self.subscribers_modules[queue_name]:
-            if m_hash:
-                add_processed_obj(obj_global_id, m_hash, queue=module_name)
+    def send_message(self, obj_global_id, message='', queue_name=None):
+        self.send_messages([(obj_global_id, message, queue_name)])
+
+    def send_messages(self, messages):
+        """
+        Push messages and processed objects bookkeeping in one round-trip
+
+        :param messages: list of (obj_global_id, message, queue_name)
+        """
+        to_send = []
+        for obj_global_id, message, queue_name in messages:
+            to_send.append((obj_global_id, f'{obj_global_id};{message}', self._get_queue_subscribers(queue_name)))
+        if not to_send:
+            return None
 
-            r_queues.rpush(f'queue:{module_name}:in', message)
-            # stats
-            nb_mess = r_queues.llen(f'queue:{module_name}:in')
-            r_queues.hset('queues', module_name, nb_mess)
+        # one round-trip by Redis DB
+        p_process = r_obj_process.pipeline(transaction=False)
+        modules = {}
+        for obj_global_id, message, subscribers in to_send:
+            if obj_global_id != '::':
+                m_hash = xxhash.xxh3_64_hexdigest(message)
+            else:
+                m_hash = None
+
+            # Add message to all modules
+            for module_name in subscribers:
+                if m_hash:
+                    add_processed_obj(obj_global_id, m_hash, queue=module_name, r_pipe=p_process)
+                if module_name not in modules:
+                    modules[module_name] = []
+                modules[module_name].append(message)
+        # processed objs need to be registered before any subscriber pop the message
+        p_process.execute()
+
+        pipe = r_queues.pipeline(transaction=False)
+        for module_name, module_messages in modules.items():
+            _PUSH_MESSAGES(keys=[f'queue:{module_name}:in'], args=[module_name] + module_messages, client=pipe)
+        pipe.execute()
 
     def start(self):
         r_queues.hset(f'module:start:{self.name}', self.pid, int(time.time()))
@@ -141,9 +295,17 @@ class AILQueue:
 
     def _stop_module(self):
         r_queues.hdel(f'module:{self.name}', self.pid)
+        r_queues.hdel(f'module:processed:{self.name}', self.pid)
         if r_queues.hlen(f'module:{self.name}') == 0:
             r_queues.srem('modules', self.name)
 
+    def stop(self):
+        """
+        Stop this module worker, the queue is kept
+        """
+        requeue_messages(self.name, self.pid)
+        self._stop_module()
+
     def error(self):
         self._stop_module
 
@@ -152,6 +314,35 @@ class AILQueue:
         self._stop_module()
 
 
+def requeue_messages(name, pid):
+    """
+    Put back the unacknowledged messages of a worker at the head of the module queue
+
+    :return: number of messages put back in the queue
+    """
+    nb = _REQUEUE_MESSAGES(keys=[f'queue:{name}:in', f'queue:{name}:processing:{pid}'])
+    r_queues.srem(f'queue:{name}:processing', pid)
+    return nb
+
+def _is_pid_alive(pid):
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_messages(name):
+    """
+    Put back in the module queue the messages popped by the dead workers of a module
+    """
+    nb = 0
+    for pid in r_queues.smembers(f'queue:{name}:processing'):
+        if not _is_pid_alive(pid):
+            nb += requeue_messages(name, pid)
+    return nb
+
 def get_queues_modules():
     return r_queues.hkeys('queues')
 
@@ -175,15 +366,30 @@ def get_module_start_time(name, pid):
 def get_module_last_time(name, pid):
     return r_queues.hget(f'module:{name}', pid)
 
+def get_module_nb_processed(name):
+    """
+    :return: dict, pid: number of messages processed by this worker
+    """
+    return {pid: int(nb) for pid, nb in r_queues.hgetall(f'module:processed:{name}').items()}
+
+def get_module_throughput(name):
+    return r_queues.hget('queues:throughput', name)
+
+def set_module_throughput(name, nb_by_second):
+    r_queues.hset('queues:throughput', name, nb_by_second)
+
 def get_modules_queues_stats():  # TODO ADD OPTION TO PURGE QUEUES
     stats = {}
     modules_names = sorted(get_modules_names())
     nb_queues_modules = get_nb_queues_modules()
     for name in modules_names:
         modules = {}
+        nb_processed = get_module_nb_processed(name)
         for pid in get_module_pids(name):
-            modules[pid] = {'start': get_module_start_time(name, pid), 'last': get_module_last_time(name, pid)}
-        stats[name] = {'in': nb_queues_modules[name], 'modules': modules}
+            modules[pid] = {'start': get_module_start_time(name, pid), 'last': get_module_last_time(name, pid),
+                            'processed': nb_processed.get(pid, 0)}
+        stats[name] = {'in': nb_queues_modules[name], 'modules': modules,
+                       'processed': sum(nb_processed.values()), 'throughput': get_module_throughput(name)}
 
     # Check if module not started
     for name in nb_queues_modules:
@@ -194,7 +400,9 @@ def get_modules_queues_stats():  # TODO ADD OPTION TO PURGE QUEUES
 def clear_modules_queues_stats():
     for name in get_modules_names():
         r_queues.delete(f'module:{name}')
+        r_queues.delete(f'module:processed:{name}')
     r_queues.delete('modules')
+    r_queues.delete('queues:throughput')
 
 
 # # # # # # # # #
@@ -237,17 +445,23 @@ def get_processed_obj_queues(obj_global_id):
 def get_processed_obj(obj_global_id):
     return {'modules': get_processed_obj_modules(obj_global_id), 'queues': get_processed_obj_queues(obj_global_id)}
 
-def add_processed_obj(obj_global_id, m_hash, module=None, queue=None):
+def add_processed_obj(obj_global_id, m_hash, module=None, queue=None, r_pipe=None):
     obj_type = obj_global_id.split(':', 1)[0]
-    new_obj = r_obj_process.sadd(f'objs:process', obj_global_id)
-    # first process:
-    if new_obj:
-        r_obj_process.zadd(f'objs:process:{obj_type}', {obj_global_id: int(time.time())})
+    if r_pipe:
+        r_pipe.sadd(f'objs:process', obj_global_id)
+        # first process
+        r_pipe.zadd(f'objs:process:{obj_type}', {obj_global_id: int(time.time())}, nx=True)
+    else:
+        r_pipe = r_obj_process
+        new_obj = r_obj_process.sadd(f'objs:process', obj_global_id)
+        # first process:
+        if new_obj:
+            r_obj_process.zadd(f'objs:process:{obj_type}', {obj_global_id: int(time.time())})
     if queue:
-        r_obj_process.zadd(f'obj:queues:{obj_global_id}', {f'{queue}:{m_hash}': int(time.time())})
+        r_pipe.zadd(f'obj:queues:{obj_global_id}', {f'{queue}:{m_hash}': int(time.time())})
     if module:
-        r_obj_process.zadd(f'obj:modules:{obj_global_id}', {f'{module}:{m_hash}': int(time.time())})
-        r_obj_process.zrem(f'obj:queues:{obj_global_id}', f'{module}:{m_hash}')
+        r_pipe.zadd(f'obj:modules:{obj_global_id}', {f'{module}:{m_hash}': int(time.time())})
+        r_pipe.zrem(f'obj:queues:{obj_global_id}', f'{module}:{m_hash}')
 
 def end_processed_obj(obj_global_id, m_hash, module=None, queue=None):
     if queue:
@@ -264,16 +478,57 @@ def end_processed_obj(obj_global_id, m_hash, module=None, queue=None):
 
             r_obj_process.sadd(f'objs:processed', obj_global_id)   # TODO use list ??????
 
-def rename_processed_obj(new_id, old_id):
-    module = get_processed_obj_modules(old_id)
-    # currently in a module
-    if len(module) == 1:
+def end_processed_objs(messages, module):
+    """
+    Batched end_processed_obj, three round-trips for all messages
+
+    :param messages: list of (obj_global_id, m_hash)
+    """
+    obj_gids = []
+    pipe = r_obj_process.pipeline(transaction=False)
+    for obj_global_id, m_hash in messages:
+        pipe.zrem(f'obj:modules:{obj_global_id}', f'{module}:{m_hash}')
+        if obj_global_id not in obj_gids:
+            obj_gids.append(obj_global_id)
+    pipe.execute()
+    if not obj_gids:
+        return None
+
+    for obj_global_id in obj_gids:
+        pipe.exists(f'obj:queues:{obj_global_id}', f'obj:modules:{obj_global_id}')
+    in_process = pipe.execute()
+
+    # process completed
+    for obj_global_id, nb_keys in zip(obj_gids, in_process):
+        if not nb_keys:
+            obj_type = obj_global_id.split(':', 1)[0]
+            pipe.zrem(f'objs:process:{obj_type}', obj_global_id)
+            pipe.srem(f'objs:process', obj_global_id)
+            pipe.sadd(f'objs:processed', obj_global_id)
+    pipe.execute()
+
+def rename_processed_obj(new_id, old_id, module=None, m_hash=None):
+    """
+    :param module: module processing the message
+    :param m_hash: hash of the message, required if the object can be in multiple messages of a batch
+    """
+    if module and m_hash:
+        x_hash = m_hash
+        if not r_obj_process.zrem(f'obj:modules:{old_id}', f'{module}:{x_hash}'):
+            return None
+    else:
+        module = get_processed_obj_modules(old_id)
+        # currently in a module
+        if len(module) != 1:
+            return None
         module, x_hash = module[0].split(':', 1)
-        obj_type = old_id.split(':', 1)[0]
         r_obj_process.zrem(f'obj:modules:{old_id}', f'{module}:{x_hash}')
+    # other messages of this object
+    if not is_processed_obj(old_id):
+        obj_type = old_id.split(':', 1)[0]
         r_obj_process.zrem(f'objs:process:{obj_type}', old_id)
         r_obj_process.srem(f'objs:process', old_id)
-        add_processed_obj(new_id, x_hash, module=module)
+    add_processed_obj(new_id, x_hash, module=module)
 
 def get_last_queue_timeout():
     epoch_update = r_obj_process.get('queue:obj:timeout:last')
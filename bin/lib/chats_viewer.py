@@ -374,7 +374,7 @@ def list_messages_to_dict(l_messages_id, translation_target=None):
 ## Daterange
 def get_messages_iterator(filters={}):
 
-    for instance_uuid in get_chat_service_instances():
+    for instance_uuid in filters.get('instances', get_chat_service_instances()):
 
         for chat_id in ChatServiceInstance(instance_uuid).get_chats():
             chat = Chats.Chat(chat_id, instance_uuid)
@@ -406,7 +406,7 @@ def get_messages_iterator(filters={}):
 
 def get_nb_messages_iterator(filters={}):
     nb_messages = 0
-    for instance_uuid in get_chat_service_instances():
+    for instance_uuid in filters.get('instances', get_chat_service_instances()):
         for chat_id in ChatServiceInstance(instance_uuid).get_chats():
             chat = Chats.Chat(chat_id, instance_uuid)
             # subchannels
@@ -424,7 +424,7 @@ def get_nb_messages_iterator(filters={}):
 
 
 def get_ocrs_iterator(filters={}):
-    for instance_uuid in get_chat_service_instances():
+    for instance_uuid in filters.get('instances', get_chat_service_instances()):
         for chat_id in ChatServiceInstance(instance_uuid).get_chats():
             chat = Chats.Chat(chat_id, instance_uuid)
             for ocr in chat.get_correlation('ocr').get('ocr', []):
@@ -433,7 +433,7 @@ def get_ocrs_iterator(filters={}):
 
 def get_nb_ors_iterator(filters={}):
     nb = 0
-    for instance_uuid in get_chat_service_instances():
+    for instance_uuid in filters.get('instances', get_chat_service_instances()):
         for chat_id in ChatServiceInstance(instance_uuid).get_chats():
             chat = Chats.Chat(chat_id, instance_uuid)
             nb += chat.get_nb_correlation('ocr')
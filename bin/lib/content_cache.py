@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+Objects Content Cache
+=====================
+
+Content access layer shared by the modules processing the same object:
+
+    1. in-process LRU cache, bounded in size, bytes and str forms, keyed by object global id
+    2. shared memory store: decompressed content written once by Global in a tmpfs directory (/dev/shm)
+       and read by the next modules running on the same host
+    3. Redis_Cache / disk (caller)
+
+Configured in core.cfg [Content_Cache]
+"""
+import hashlib
+import logging
+import os
+import sys
+import time
+
+from collections import OrderedDict
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib.ConfigLoader import ConfigLoader
+
+logger = logging.getLogger()
+
+config_loader = ConfigLoader()
+if config_loader.has_section('Content_Cache'):
+    LRU_MAX_SIZE = config_loader.get_config_int('Content_Cache', 'lru_max_size') * 1024 * 1024
+    SHM_ENABLED = config_loader.get_config_boolean('Content_Cache', 'shm')
+    SHM_DIR = config_loader.get_config_str('Content_Cache', 'shm_dir')
+    SHM_TTL = config_loader.get_config_int('Content_Cache', 'shm_ttl')
+else:
+    LRU_MAX_SIZE = 64 * 1024 * 1024
+    SHM_ENABLED = False
+    SHM_DIR = '/dev/shm/ail'
+    SHM_TTL = 300
+config_loader = None
+
+
+class LRUCache:
+    """
+    Least Recently Used cache, bounded by the total size of the values
+
+    :param max_size: maximum size in bytes/chars of the cached values
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        # Larger values are not cached
+        self.max_value_size = max_size // 4
+        self.size = 0
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, key):
+        return key in self._cache
+
+    def get(self, key):
+        value = self._cache.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self._cache.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        size = len(value)
+        if size > self.max_value_size:
+            return False
+        self.delete(key)
+        self._cache[key] = value
+        self.size += size
+        while self.size > self.max_size:
+            _, old_value = self._cache.popitem(last=False)
+            self.size -= len(old_value)
+        return True
+
+    def delete(self, key):
+        value = self._cache.pop(key, None)
+        if value is not None:
+            self.size -= len(value)
+
+    def clear(self):
+        self._cache.clear()
+        self.size = 0
+
+
+class SharedContentStore:
+    """
+    Decompressed content shared between the processes of the same host
+
+    The content is written in a tmpfs directory, one file by object, only readable by the AIL user.
+    The files are deleted SHM_TTL seconds after their creation.
+    """
+
+    def __init__(self, directory, ttl=300):
+        self.directory = directory
+        self.ttl = ttl
+        self.last_cleanup = 0
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # existing directory or umask
+        os.chmod(self.directory, 0o700)
+
+    def _get_filepath(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key):
+        """
+        :return: the content or None
+        """
+        try:
+            with open(self._get_filepath(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, content):
+        filepath = self._get_filepath(key)
+        # Atomic write
+        tmp_filepath = f'{filepath}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_filepath, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_filepath, filepath)
+        except OSError as e:
+            logger.warning(f'Content Cache: {key}, {e}')
+            return False
+        self.cleanup()
+        return True
+
+    def delete(self, key):
+        try:
+            os.remove(self._get_filepath(key))
+        except FileNotFoundError:
+            pass
+
+    def cleanup(self, force=False):
+        now = time.time()
+        if not force and now - self.last_cleanup < self.ttl / 5:
+            return None
+        self.last_cleanup = now
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < now - self.ttl:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+_lru = LRUCache(LRU_MAX_SIZE)
+_store = None
+
+def get_store():
+    global _store
+    if SHM_ENABLED and _store is None:
+        try:
+            _store = SharedContentStore(SHM_DIR, ttl=SHM_TTL)
+        except OSError as e:
+            logger.warning(f'Content Cache: shared store disabled, {e}')
+            return None
+    return _store
+
+def _get_lru_key(obj_gid, r_type):
+    return f'{r_type}:{obj_gid}'
+
+def get_content(obj_gid, r_type='str'):
+    """
+    :param obj_gid: object global id: <type>:<subtype>:<id>
+    :param r_type: str or bytes
+    :return: the cached content or None
+    """
+    content = _lru.get(_get_lru_key(obj_gid, r_type))
+    if content is None and r_type == 'bytes':
+        store = get_store()
+        if store:
+            content = store.get(obj_gid)
+            if content is not None:
+                _lru.set(_get_lru_key(obj_gid, r_type), content)
+    return content
+
+def set_content(obj_gid, content, r_type='str', shared=False):
+    """
+    :param shared: also add the bytes content to the shared store, only used by Global on the item creation
+    """
+    _lru.set(_get_lru_key(obj_gid, r_type), content)
+    if shared and r_type == 'bytes':
+        store = get_store()
+        if store:
+            store.set(obj_gid, content)
+
+def delete_content(obj_gid):
+    _lru.delete(_get_lru_key(obj_gid, 'str'))
+    _lru.delete(_get_lru_key(obj_gid, 'bytes'))
+    store = get_store()
+    if store:
+        store.delete(obj_gid)
+
+def get_stats():
+    return {'lru_size': _lru.size, 'lru_nb': len(_lru), 'lru_hits': _lru.hits, 'lru_misses': _lru.misses}
@@ -12,8 +12,39 @@ from lib.ConfigLoader import ConfigLoader
 
 config_loader = ConfigLoader()
 r_metadata = config_loader.get_db_conn("Kvrocks_Correlations")
+if config_loader.has_option('Correlations', 'hub_threshold'):
+    HUB_THRESHOLD = config_loader.get_config_int('Correlations', 'hub_threshold')
+else:
+    HUB_THRESHOLD = 1000
 config_loader = None
 
+# Add a correlation, increment the counter if the correlation is new and the counter exists
+# KEYS[1]: correlation set, KEYS[2]: correlations counters, ARGV[1]: correlation, ARGV[2]: correlation type
+_ADD_CORRELATION = r_metadata.register_script("""
+local added = redis.call('SADD', KEYS[1], ARGV[1])
+if added == 1 and redis.call('HEXISTS', KEYS[2], ARGV[2]) == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+return added
+""")
+
+# Delete a correlation, decrement the counter if the correlation existed and the counter exists
+# KEYS[1]: correlation set, KEYS[2]: correlations counters, ARGV[1]: correlation, ARGV[2]: correlation type
+_DELETE_CORRELATION = r_metadata.register_script("""
+local removed = redis.call('SREM', KEYS[1], ARGV[1])
+if removed == 1 and redis.call('HEXISTS', KEYS[2], ARGV[2]) == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[2], -1)
+end
+return removed
+""")
+
+# Initialize a missing counter with the correlation set cardinality
+# KEYS[1]: correlation set, KEYS[2]: correlations counters, ARGV[1]: correlation type
+_INIT_NB_CORRELATIONS = r_metadata.register_script("""
+redis.call('HSETNX', KEYS[2], ARGV[1], redis.call('SCARD', KEYS[1]))
+return redis.call('HGET', KEYS[2], ARGV[1])
+""")
+
 ##################################
 # CORRELATION MIGRATION
 ##################################
@@ -82,17 +113,47 @@ def sanityze_obj_correl_types(obj_type, correl_types, sanityze=True):
             return []
     return correl_types
 
+# # # # CORRELATIONS STATS # # # #
+
+# Number of correlations by correlation type: correlation:nb:<obj_type>:<subtype>:<obj_id> <correl_type>: nb
+# Maintained by add_obj_correlation and delete_obj_correlation, missing counters are initialized with SCARD
+# on read
+
+def _get_nb_correlations_counters(obj_type, subtype, obj_id, correl_types):
+    correl_types = list(correl_types)
+    if not correl_types:
+        return {}
+    counters = r_metadata.hmget(f'correlation:nb:{obj_type}:{subtype}:{obj_id}', correl_types)
+    missing = [correl_type for correl_type, nb in zip(correl_types, counters) if nb is None]
+    if missing:
+        pipe = r_metadata.pipeline(transaction=False)
+        for correl_type in missing:
+            _init_nb_correlations(obj_type, subtype, obj_id, correl_type, pipe)
+        backfill = dict(zip(missing, pipe.execute()))
+    else:
+        backfill = {}
+    nb_correlations = {}
+    for correl_type, nb in zip(correl_types, counters):
+        if nb is None:
+            nb = backfill[correl_type]
+        nb_correlations[correl_type] = int(nb)
+    return nb_correlations
+
+def _init_nb_correlations(obj_type, subtype, obj_id, correl_type, r_pipe):
+    _INIT_NB_CORRELATIONS(keys=[f'correlation:obj:{obj_type}:{subtype}:{correl_type}:{obj_id}',
+                                f'correlation:nb:{obj_type}:{subtype}:{obj_id}'],
+                          args=[correl_type], client=r_pipe)
+
 def get_nb_correlation_by_correl_type(obj_type, subtype, obj_id, correl_type):
-    return r_metadata.scard(f'correlation:obj:{obj_type}:{subtype}:{correl_type}:{obj_id}')
+    if subtype is None:
+        subtype = ''
+    return _get_nb_correlations_counters(obj_type, subtype, obj_id, [correl_type])[correl_type]
 
 def get_nb_correlations(obj_type, subtype, obj_id, filter_types=[]):
     if subtype is None:
         subtype = ''
-    obj_correlations = {}
     filter_types = sanityze_obj_correl_types(obj_type, filter_types)
-    for correl_type in filter_types:
-        obj_correlations[correl_type] = get_nb_correlation_by_correl_type(obj_type, subtype, obj_id, correl_type)
-    return obj_correlations
+    return _get_nb_correlations_counters(obj_type, subtype, obj_id, filter_types)
 
 def get_correlation_by_correl_type(obj_type, subtype, obj_id, correl_type, unpack=False):
     correl = r_metadata.smembers(f'correlation:obj:{obj_type}:{subtype}:{correl_type}:{obj_id}')
@@ -133,21 +194,45 @@ def get_obj_inter_correlation(obj_type1, subtype1, obj_id1, obj_type2, subtype2,
     return r_metadata.sinter(f'correlation:obj:{obj_type1}:{subtype1}:{correl_type}:{obj_id1}', f'correlation:obj:{obj_type2}:{subtype2}:{correl_type}:{obj_id2}')
 
 def add_obj_correlation(obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id):
-    if subtype1 is None:
-        subtype1 = ''
-    if subtype2 is None:
-        subtype2 = ''
-    r_metadata.sadd(f'correlation:obj:{obj1_type}:{subtype1}:{obj2_type}:{obj1_id}', f'{subtype2}:{obj2_id}')
-    r_metadata.sadd(f'correlation:obj:{obj2_type}:{subtype2}:{obj1_type}:{obj2_id}', f'{subtype1}:{obj1_id}')
+    add_obj_correlations([(obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id)])
+
+def add_obj_correlations(correlations):
+    """
+    Add multiple correlations in one pipeline round-trip
 
+    :param correlations: list of (obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id)
+    """
+    # both directions, without duplicates
+    links = {}
+    for obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id in correlations:
+        if subtype1 is None:
+            subtype1 = ''
+        if subtype2 is None:
+            subtype2 = ''
+        links[(obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id)] = None
+        links[(obj2_type, subtype2, obj2_id, obj1_type, subtype1, obj1_id)] = None
+    if not links:
+        return None
+    pipe = r_metadata.pipeline(transaction=False)
+    for obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id in links:
+        _ADD_CORRELATION(keys=[f'correlation:obj:{obj1_type}:{subtype1}:{obj2_type}:{obj1_id}',
+                               f'correlation:nb:{obj1_type}:{subtype1}:{obj1_id}'],
+                         args=[f'{subtype2}:{obj2_id}', obj2_type], client=pipe)
+    pipe.execute()
 
 def delete_obj_correlation(obj1_type, subtype1, obj1_id, obj2_type, subtype2, obj2_id):
     if subtype1 is None:
         subtype1 = ''
     if subtype2 is None:
         subtype2 = ''
-    r_metadata.srem(f'correlation:obj:{obj1_type}:{subtype1}:{obj2_type}:{obj1_id}', f'{subtype2}:{obj2_id}')
-    r_metadata.srem(f'correlation:obj:{obj2_type}:{subtype2}:{obj1_type}:{obj2_id}', f'{subtype1}:{obj1_id}')
+    pipe = r_metadata.pipeline(transaction=False)
+    _DELETE_CORRELATION(keys=[f'correlation:obj:{obj1_type}:{subtype1}:{obj2_type}:{obj1_id}',
+                              f'correlation:nb:{obj1_type}:{subtype1}:{obj1_id}'],
+                        args=[f'{subtype2}:{obj2_id}', obj2_type], client=pipe)
+    _DELETE_CORRELATION(keys=[f'correlation:obj:{obj2_type}:{subtype2}:{obj1_type}:{obj2_id}',
+                              f'correlation:nb:{obj2_type}:{subtype2}:{obj2_id}'],
+                        args=[f'{subtype1}:{obj1_id}', obj1_type], client=pipe)
+    pipe.execute()
 
 def delete_obj_correlations(obj_type, subtype, obj_id):
     obj_correlations = get_correlations(obj_type, subtype, obj_id)
@@ -155,6 +240,9 @@ def delete_obj_correlations(obj_type, subtype, obj_id):
         for str_obj in obj_correlations[correl_type]:
             subtype2, obj2_id = str_obj.split(':', 1)
             delete_obj_correlation(obj_type, subtype, obj_id, correl_type, subtype2, obj2_id)
+    if subtype is None:
+        subtype = ''
+    r_metadata.delete(f'correlation:nb:{obj_type}:{subtype}:{obj_id}')
 
 # # bypass max result/objects ???
 # def get_correlation_depht(obj_type, subtype, obj_id, filter_types=[], level=1, nb_max=300):
@@ -190,43 +278,92 @@ def get_obj_str_id(obj_type, subtype, obj_id):
     return f'{obj_type}:{subtype}:{obj_id}'
 
 def get_correlations_graph_nodes_links(obj_type, subtype, obj_id, filter_types=[], max_nodes=300, level=1, objs_hidden=set(), flask_context=False):
+    """
+    Breadth-first expansion of the correlation graph, the correlations of each level are fetched in one pipeline
+
+    :param level: depth of the graph, the root object is expanded at level 0
+    :param max_nodes: maximum number of nodes, 0: no limit
+    :return: root object str id, nodes, links, meta
+
+    The correlations of hubs, more than HUB_THRESHOLD or max_nodes correlations of a type, are randomly sampled
+    """
     links = set()
     nodes = set()
     meta = {'complete': True, 'objs': set()}
 
+    if subtype is None:
+        subtype = ''
     obj_str_id = get_obj_str_id(obj_type, subtype, obj_id)
+    nodes.add(obj_str_id)
+    meta['objs'].add(obj_str_id)
 
-    _get_correlations_graph_node(links, nodes, meta, obj_type, subtype, obj_id, level, max_nodes, filter_types=filter_types, objs_hidden=objs_hidden, previous_str_obj='')
-    return obj_str_id, nodes, links, meta
-
+    if max_nodes:
+        sample_size = min(HUB_THRESHOLD, max_nodes)
+    else:
+        sample_size = HUB_THRESHOLD
 
-def _get_correlations_graph_node(links, nodes, meta, obj_type, subtype, obj_id, level, max_nodes, filter_types=[], objs_hidden=set(), previous_str_obj=''):
-    obj_str_id = get_obj_str_id(obj_type, subtype, obj_id)
-    meta['objs'].add(obj_str_id)
-    nodes.add(obj_str_id)
+    frontier = [(obj_type, subtype, obj_id)]
+    for _ in range(level + 1):
+        if not frontier:
+            break
+        # Number of correlations of the frontier objects
+        pipe = r_metadata.pipeline(transaction=False)
+        frontier_types = []
+        for node_type, node_subtype, node_id in frontier:
+            correl_types = list(sanityze_obj_correl_types(node_type, filter_types))
+            frontier_types.append(correl_types)
+            if correl_types:
+                pipe.hmget(f'correlation:nb:{node_type}:{node_subtype}:{node_id}', correl_types)
+        res = iter(pipe.execute())
+        frontier_nb = [next(res) if correl_types else [] for correl_types in frontier_types]
+        # Missing counters
+        missing = []
+        for (node_type, node_subtype, node_id), correl_types, counters in zip(frontier, frontier_types, frontier_nb):
+            for i, nb in enumerate(counters):
+                if nb is None:
+                    missing.append((counters, i))
+                    _init_nb_correlations(node_type, node_subtype, node_id, correl_types[i], pipe)
+        if missing:
+            for (counters, i), nb in zip(missing, pipe.execute()):
+                counters[i] = nb
 
-    obj_correlations = get_correlations(obj_type, subtype, obj_id, filter_types=filter_types)
-    # print(obj_correlations)
-    for correl_type in obj_correlations:
-        for str_obj in obj_correlations[correl_type]:
-            subtype2, obj2_id = str_obj.split(':', 1)
-            obj2_str_id = get_obj_str_id(correl_type, subtype2, obj2_id)
-            # filter objects to hide
-            if obj2_str_id in objs_hidden:
-                continue
+        # Fetch the correlations of all the frontier objects
+        keys = []
+        for (node_type, node_subtype, node_id), correl_types, counters in zip(frontier, frontier_types, frontier_nb):
+            for correl_type, nb in zip(correl_types, counters):
+                key = f'correlation:obj:{node_type}:{node_subtype}:{correl_type}:{node_id}'
+                # Hub: random sample
+                if int(nb) > sample_size:
+                    pipe.srandmember(key, sample_size)
+                    meta['complete'] = False
+                else:
+                    pipe.smembers(key)
+                keys.append((get_obj_str_id(node_type, node_subtype, node_id), correl_type))
+        res = pipe.execute()
 
-            meta['objs'].add(obj2_str_id)
+        next_frontier = []
+        for (node_str_id, correl_type), correlations in zip(keys, res):
+            for str_obj in correlations:
+                subtype2, obj2_id = str_obj.split(':', 1)
+                obj2_str_id = get_obj_str_id(correl_type, subtype2, obj2_id)
+                # filter objects to hide
+                if obj2_str_id in objs_hidden:
+                    continue
 
-            if obj2_str_id == previous_str_obj:
-                continue
+                meta['objs'].add(obj2_str_id)
 
-            if len(nodes) > max_nodes != 0:
-                meta['complete'] = False
-                break
-            nodes.add(obj2_str_id)
-            links.add((obj_str_id, obj2_str_id))
+                if obj2_str_id in nodes:
+                    if (obj2_str_id, node_str_id) not in links and obj2_str_id != node_str_id:
+                        links.add((node_str_id, obj2_str_id))
+                    continue
 
-            if level > 0:
-                next_level = level - 1
-                _get_correlations_graph_node(links, nodes, meta, correl_type, subtype2, obj2_id, next_level, max_nodes, filter_types=filter_types, objs_hidden=objs_hidden, previous_str_obj=obj_str_id)
+                # Node budget
+                if len(nodes) > max_nodes != 0:
+                    meta['complete'] = False
+                    continue
+                nodes.add(obj2_str_id)
+                links.add((node_str_id, obj2_str_id))
+                next_frontier.append((correl_type, subtype2, obj2_id))
+        frontier = next_frontier
+    return obj_str_id, nodes, links, meta
 
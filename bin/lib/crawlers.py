@@ -6,6 +6,7 @@ API Helper
 
 
 """
+import asyncio
 import base64
 import gzip
 import hashlib
@@ -18,6 +19,7 @@ import sys
 import time
 import uuid
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import IntEnum, unique
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
@@ -467,8 +469,11 @@ def _reprocess_all_hars_etag():
 def extract_hhhash_by_id(har_id, domain, date):
     return extract_hhhash(get_har_content(har_id), domain, date)
 
-def extract_hhhash(har, domain, date):
-    hhhashs = set()
+def get_hhhashs_from_har(har, domain):
+    """
+    :return: dict, hhhash: hhhash header, of the responses of the domain
+    """
+    hhhashs = {}
     urls = set()
     for entrie in har.get('log', {}).get('entries', []):
         url = entrie.get('request').get('url')
@@ -489,19 +494,21 @@ def extract_hhhash(har, domain, date):
 
                     if hhhash not in hhhashs:
                         print('', url, hhhash)
-
-                        # -----
-                        obj = HHHashs.create(hhhash_header, hhhash)
-                        obj.add(date, Domain(domain))
-
-                    hhhashs.add(hhhash)
+                        hhhashs[hhhash] = hhhash_header
                     urls.add(url)
+    return hhhashs
+
+def extract_hhhash(har, domain, date):
+    hhhashs = get_hhhashs_from_har(har, domain)
+    for hhhash, hhhash_header in hhhashs.items():
+        obj = HHHashs.create(hhhash_header, hhhash)
+        obj.add(date, Domain(domain))
     print()
     print()
     print('HHHASH:')
     for hhhash in hhhashs:
         print(hhhash)
-    return hhhashs
+    return set(hhhashs)
 
 def _reprocess_all_hars_hhhashs():
     for har_id in get_all_har_ids():
@@ -1572,6 +1579,20 @@ def get_crawler_capture():
         capture = None
     return capture
 
+def get_crawler_captures_to_check():
+    """
+    :return: captures launched, not yet completed, by last check
+    """
+    return [CrawlerCapture(capture_uuid) for capture_uuid in r_cache.zrange('crawler:captures', 0, -1)]
+
+def pop_crawler_capture(capture_uuid):
+    """
+    Remove a completed capture from the captures to check
+
+    :return: True if the capture was removed by this call
+    """
+    return r_cache.zrem('crawler:captures', capture_uuid) == 1
+
 # TODO add capture times
 def get_captures_status():
     status = []
@@ -1617,6 +1638,8 @@ class CrawlerTask:
 
     def __init__(self, task_uuid):
         self.uuid = task_uuid
+        # Fields of the task, loaded with load()
+        self._fields = None
 
     def exists(self):
         return r_crawler.exists(f'crawler:task:{self.uuid}')
@@ -1627,35 +1650,47 @@ class CrawlerTask:
         else:
             return False
 
+    def load(self):
+        """
+        Load all the fields of the task in one round-trip, the getters read the loaded fields
+        """
+        self._fields = r_crawler.hgetall(f'crawler:task:{self.uuid}')
+        return self._fields
+
+    def _get_field(self, field):
+        if self._fields is not None:
+            return self._fields.get(field)
+        return r_crawler.hget(f'crawler:task:{self.uuid}', field)
+
     def get_url(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'url')
+        return self._get_field('url')
 
     def get_domain(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'domain')
+        return self._get_field('domain')
 
     def get_depth(self):
-        depth = r_crawler.hget(f'crawler:task:{self.uuid}', 'depth')
+        depth = self._get_field('depth')
         if not depth:
             depth = 1
         return int(depth)
 
     def get_har(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'har') == '1'
+        return self._get_field('har') == '1'
 
     def get_screenshot(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'screenshot') == '1'
+        return self._get_field('screenshot') == '1'
 
     def get_queue(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'queue')
+        return self._get_field('queue')
 
     def get_user_agent(self):
-        user_agent = r_crawler.hget(f'crawler:task:{self.uuid}', 'user_agent')
+        user_agent = self._get_field('user_agent')
         if not user_agent:
             user_agent = get_default_user_agent()
         return user_agent
 
     def get_cookiejar(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'cookiejar')
+        return self._get_field('cookiejar')
 
     def get_cookies(self):
         cookiejar = self.get_cookiejar()
@@ -1666,26 +1701,26 @@ class CrawlerTask:
             return []
 
     def get_header(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'header')
+        return self._get_field('header')
 
     def get_proxy(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'proxy')
+        return self._get_field('proxy')
 
     def get_parent(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'parent')
+        return self._get_field('parent')
 
     def get_hash(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'hash')
+        return self._get_field('hash')
 
     def get_start_time(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'start_time')
+        return self._get_field('start_time')
 
     # TODO
     def get_status(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'status') #######################################
+        return self._get_field('status') #######################################
 
     def get_capture(self):
-        return r_crawler.hget(f'crawler:task:{self.uuid}', 'capture')
+        return self._get_field('capture')
 
     def is_ongoing(self):
         capture_uuid = self.get_capture()
@@ -1694,6 +1729,8 @@ class CrawlerTask:
         return False
 
     def _set_field(self, field, value):
+        if self._fields is not None:
+            self._fields[field] = str(value)
         return r_crawler.hset(f'crawler:task:{self.uuid}', field, value)
 
     def get_tags(self):
@@ -1705,6 +1742,7 @@ class CrawlerTask:
             # Tag.create_custom_tag(tag)
 
     def get_meta(self):
+        self.load()
         meta = {
             'uuid': self.uuid,
             'url': self.get_url(),
@@ -1800,6 +1838,8 @@ class CrawlerTask:
     def reset(self):
         priority = 49
         r_crawler.hdel(f'crawler:task:{self.uuid}', 'start_time')
+        if self._fields is not None:
+            self._fields.pop('start_time', None)
         self.add_to_db_crawler_queue(priority)
 
     # Crawler
@@ -1816,6 +1856,7 @@ class CrawlerTask:
             r_crawler.hdel('crawler:queue:hash', task_hash)
         # meta
         r_crawler.delete(f'crawler:task:{self.uuid}')
+        self._fields = None
 
     # Manual
     def delete(self):
@@ -2210,6 +2251,86 @@ def api_set_crawler_max_captures(data):
     save_nb_max_captures(nb_captures)
     return nb_captures, 200
 
+class LacusCaptureManager:
+    """
+    Run the Lacus requests of multiple captures concurrently, up to the Lacus concurrency limit
+
+    The blocking Lacus client calls are run in a thread pool and scheduled with asyncio.
+    """
+
+    def __init__(self, lacus, concurrency=None):
+        self.lacus = lacus
+        if concurrency is None:
+            concurrency = get_crawler_max_captures()
+        self.concurrency = concurrency
+        self._loop = asyncio.new_event_loop()
+        self._executor = None
+        self._executor_size = 0
+
+    def set_concurrency(self, concurrency):
+        self.concurrency = max(int(concurrency), 1)
+
+    def _get_executor(self):
+        if self._executor is None or self._executor_size != self.concurrency:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+            self._executor_size = self.concurrency
+        return self._executor
+
+    async def _call(self, executor, key, func, *args):
+        try:
+            result = await self._loop.run_in_executor(executor, func, *args)
+        except Exception as e:
+            result = e
+        return key, result
+
+    def iter_map(self, func, items, args=lambda item: (item,)):
+        """
+        Call func on all the items concurrently
+
+        :return: iterator of (item, result) in completion order, an exception is returned instead of raised
+        """
+        items = list(items)
+        if not items:
+            return
+        # The executor workers bound the number of concurrent calls
+        executor = self._get_executor()
+        pending = {self._loop.create_task(self._call(executor, i, func, *args(item)))
+                   for i, item in enumerate(items)}
+        try:
+            while pending:
+                done, pending = self._loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done:
+                    i, result = task.result()
+                    yield items[i], result
+        finally:
+            # iterator closed: cancel the calls not started
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._loop.run_until_complete(asyncio.wait(pending))
+
+    def map(self, func, items, args=lambda item: (item,)):
+        """
+        :return: list of (item, result), an exception is returned instead of raised
+        """
+        return list(self.iter_map(func, items, args=args))
+
+    def iter_captures_status(self, captures):
+        """
+        Get the status of the captures concurrently
+
+        :return: iterator of (capture, status), as soon as the status is received
+        """
+        return self.iter_map(self.lacus.get_capture_status, captures, args=lambda capture: (capture.uuid,))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._loop.close()
+
 ## TEST ##
 
 def is_test_ail_crawlers_successful():
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+DNS Resolver
+============
+
+Asynchronous DNS resolution of a batch of queries:
+    - bounded concurrency
+    - in-flight deduplication: a query is sent once, even if requested multiple times
+    - positive and negative answers are cached in Redis_Cache with a TTL
+
+Configured in core.cfg [DNS_Resolver]
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+import dns.asyncresolver
+import dns.exception
+import dns.name
+import dns.resolver
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib.ConfigLoader import ConfigLoader
+
+logger = logging.getLogger()
+
+config_loader = ConfigLoader()
+r_cache = config_loader.get_redis_conn("Redis_Cache")
+if config_loader.has_section('DNS_Resolver'):
+    CONCURRENCY = config_loader.get_config_int('DNS_Resolver', 'concurrency')
+    TIMEOUT = float(config_loader.get_config_str('DNS_Resolver', 'timeout'))
+    POSITIVE_TTL = config_loader.get_config_int('DNS_Resolver', 'positive_ttl')
+    NEGATIVE_TTL = config_loader.get_config_int('DNS_Resolver', 'negative_ttl')
+else:
+    CONCURRENCY = 50
+    TIMEOUT = 2.0
+    POSITIVE_TTL = 86400
+    NEGATIVE_TTL = 3600
+config_loader = None
+
+# Negative answers, cached
+NEGATIVE_EXCEPTIONS = (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.name.EmptyLabel, dns.name.LabelTooLong)
+
+
+class DNSResolver:
+    """
+    Resolve a batch of DNS queries
+
+    An answer is a list of records: [ttl, rdclass, rdtype, rdata], an empty list for a negative answer
+    """
+
+    def __init__(self, nameservers, port=53, concurrency=CONCURRENCY, timeout=TIMEOUT,
+                 positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL, cache=True):
+        self.nameservers = nameservers
+        self.port = port
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.cache = cache
+
+        self._loop = None
+        self._resolver = None
+        self._semaphore = None
+        self._inflight = {}
+
+    def _init_loop(self):
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._resolver = dns.asyncresolver.Resolver(configure=False)
+            self._resolver.nameservers = self.nameservers
+            self._resolver.port = self.port
+            self._resolver.timeout = self.timeout
+            self._resolver.lifetime = self.timeout
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    # # # # CACHE # # # #
+
+    def _get_cache_key(self, query):
+        return f'dns:{query[1]}:{query[0]}'
+
+    def get_cached_answers(self, queries):
+        """
+        :return: dict, query: answer
+        """
+        if not self.cache or not queries:
+            return {}
+        answers = {}
+        for query, cached in zip(queries, r_cache.mget([self._get_cache_key(query) for query in queries])):
+            if cached is not None:
+                answers[query] = json.loads(cached)
+        return answers
+
+    def cache_answers(self, answers):
+        if not self.cache or not answers:
+            return None
+        pipe = r_cache.pipeline(transaction=False)
+        for query, answer in answers.items():
+            if answer is None:  # error, not cached
+                continue
+            if answer:
+                ttl = min(self.positive_ttl, max(int(answer[0][0]), 60))
+            else:
+                ttl = self.negative_ttl
+            pipe.setex(self._get_cache_key(query), ttl, json.dumps(answer))
+        pipe.execute()
+
+    # # # # RESOLVER # # # #
+
+    async def _query(self, query):
+        name, rdtype = query
+        async with self._semaphore:
+            try:
+                answers = await self._resolver.resolve(name, rdtype, search=False)
+            except NEGATIVE_EXCEPTIONS:
+                return []
+            except (dns.exception.Timeout, dns.resolver.NoNameservers) as e:
+                logger.debug(f'DNS resolver: {name} {rdtype}, {type(e).__name__}')
+                return None
+            except Exception as e:
+                logger.debug(f'DNS resolver: {name} {rdtype}, {e}')
+                return None
+        records = []
+        for record in answers.rrset.to_text().splitlines():
+            record = record.split(None, 4)
+            if len(record) == 5:
+                records.append(record[1:])
+        return records
+
+    async def _resolve(self, query):
+        # in-flight deduplication
+        task = self._inflight.get(query)
+        if task is None:
+            task = asyncio.ensure_future(self._query(query))
+            self._inflight[query] = task
+            task.add_done_callback(lambda _: self._inflight.pop(query, None))
+        return await task
+
+    async def _resolve_all(self, queries):
+        return await asyncio.gather(*(self._resolve(query) for query in queries))
+
+    def resolve_batch(self, queries):
+        """
+        :param queries: iterable of (name, rdtype)
+        :return: dict, (name, rdtype): list of records, empty list: negative answer, None: error
+        """
+        queries = list(dict.fromkeys((name.lower(), rdtype) for name, rdtype in queries))
+        answers = self.get_cached_answers(queries)
+        to_resolve = [query for query in queries if query not in answers]
+        if to_resolve:
+            self._init_loop()
+            resolved = dict(zip(to_resolve, self._loop.run_until_complete(self._resolve_all(to_resolve))))
+            self.cache_answers(resolved)
+            answers.update(resolved)
+        return answers
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.close()
+            self._loop = None
+
+def get_passive_dns_records(name, answer, nameserver):
+    """
+    Passive DNS output: timestamp||dns-client||dns-server||RR class||Query||Query Type||Answer||TTL||Count
+
+    :param answer: list of records [ttl, rdclass, rdtype, rdata]
+    """
+    timestamp = int(time.time())
+    records = []
+    for ttl, rdclass, rdtype, rdata in answer:
+        records.append(f'{timestamp}||127.0.0.1||{nameserver}||{rdclass}||{name}||{rdtype}||{rdata}||{ttl}||1\n')
+    return records
@@ -2,10 +2,18 @@
 # -*-coding:UTF-8 -*
 
 import os
+import sqlite3
 import sys
+import time
 
+from abc import ABC, abstractmethod
 from shutil import rmtree
 
+from whoosh.fields import Schema, TEXT, ID
+from whoosh.index import create_in, exists_in, open_dir
+from whoosh.qparser import QueryParser
+from whoosh.writing import BufferedWriter
+
 sys.path.append(os.environ['AIL_BIN'])
 ##################################
 # Import Project packages
@@ -14,6 +22,15 @@ from lib import ConfigLoader
 
 config_loader = ConfigLoader.ConfigLoader()
 INDEX_PATH = os.path.join(os.environ['AIL_HOME'], config_loader.get_config_str("Indexer", "path"))
+INDEX_TYPE = config_loader.get_config_str("Indexer", "type")
+if config_loader.has_option("Indexer", "batch_size"):
+    BATCH_SIZE = config_loader.get_config_int("Indexer", "batch_size")
+else:
+    BATCH_SIZE = 1
+if config_loader.has_option("Indexer", "batch_time"):
+    BATCH_TIME = config_loader.get_config_int("Indexer", "batch_time")
+else:
+    BATCH_TIME = 0
 all_index_file = os.path.join(INDEX_PATH, 'all_index.txt')
 config_loader = None
 
@@ -78,6 +95,214 @@ def delete_last_index():
     index_name = get_last_index_name()
     delete_index_by_name(index_name)
 
+#### BACKENDS ####
+
+class IndexBackend(ABC):
+    """
+    Full-text index backend
+
+    Documents are added by batch: committed every batch_size documents or batch_time seconds.
+
+    :param index_path: index directory
+    """
+
+    def __init__(self, index_path, batch_size=BATCH_SIZE, batch_time=BATCH_TIME):
+        self.index_path = index_path
+        self.batch_size = max(batch_size, 1)
+        self.batch_time = batch_time
+
+    @abstractmethod
+    def add_document(self, doc_id, content):
+        pass
+
+    @abstractmethod
+    def commit(self):
+        pass
+
+    @abstractmethod
+    def optimize(self):
+        """
+        Merge the index segments, full rewrite of the index: don't call it while indexing
+        """
+        pass
+
+    @abstractmethod
+    def search(self, query, nb=50):
+        """
+        :return: list of documents ids matching the query, best match first
+        """
+        pass
+
+    def get_size(self):
+        """
+        :return: index size in bytes
+        """
+        size = 0
+        with os.scandir(self.index_path) as it:
+            for entry in it:
+                if entry.is_file():
+                    size += entry.stat().st_size
+        return size
+
+    def close(self):
+        self.commit()
+
+
+class WhooshBackend(IndexBackend):
+    """
+    Whoosh index, asynchronous batched commits (BufferedWriter) with segments merge
+    """
+
+    def __init__(self, index_path, batch_size=BATCH_SIZE, batch_time=BATCH_TIME):
+        super().__init__(index_path, batch_size=batch_size, batch_time=batch_time)
+        self.schema = Schema(title=TEXT(stored=True), path=ID(stored=True, unique=True), content=TEXT)
+        if not exists_in(self.index_path):
+            self.ix = create_in(self.index_path, self.schema)
+        else:
+            self.ix = open_dir(self.index_path)
+        self.writer = None
+
+    def _get_writer(self):
+        if self.writer is None:
+            # The BufferedWriter thread commit the documents every period seconds
+            self.writer = BufferedWriter(self.ix, period=self.batch_time or None, limit=self.batch_size,
+                                         commitargs={'merge': True})
+        return self.writer
+
+    def add_document(self, doc_id, content):
+        self._get_writer().update_document(title=doc_id, path=doc_id, content=content)
+
+    def commit(self):
+        if self.writer is not None:
+            self.writer.commit()
+
+    def optimize(self):
+        self.close()
+        self.ix.optimize()
+
+    def search(self, query, nb=50):
+        with self.ix.searcher() as searcher:
+            query = QueryParser('content', self.ix.schema).parse(query)
+            return [hit['path'] for hit in searcher.search(query, limit=nb)]
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class SqliteFTSBackend(IndexBackend):
+    """
+    SQLite FTS5 index, one database file by index
+    """
+
+    def __init__(self, index_path, batch_size=BATCH_SIZE, batch_time=BATCH_TIME):
+        super().__init__(index_path, batch_size=batch_size, batch_time=batch_time)
+        self.db_path = os.path.join(self.index_path, 'index.db')
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(path UNINDEXED, content)')
+        # path: rowid of the document, the UNINDEXED path column can't be used to find a document
+        if not self.conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='paths'").fetchone():
+            self.conn.execute('CREATE TABLE paths (path TEXT PRIMARY KEY, doc_rowid INTEGER)')
+            self.conn.execute('INSERT OR REPLACE INTO paths (path, doc_rowid) SELECT path, rowid FROM documents')
+            self.conn.commit()
+        self.nb_pending = 0
+        self.last_commit = time.time()
+
+    def add_document(self, doc_id, content):
+        row = self.conn.execute('SELECT doc_rowid FROM paths WHERE path = ?', (doc_id,)).fetchone()
+        if row:
+            self.conn.execute('DELETE FROM documents WHERE rowid = ?', (row[0],))
+        cursor = self.conn.execute('INSERT INTO documents (path, content) VALUES (?, ?)', (doc_id, content))
+        self.conn.execute('INSERT OR REPLACE INTO paths (path, doc_rowid) VALUES (?, ?)', (doc_id, cursor.lastrowid))
+        self.nb_pending += 1
+        if self.nb_pending >= self.batch_size or (self.batch_time and time.time() - self.last_commit > self.batch_time):
+            self.commit()
+
+    def commit(self):
+        if self.nb_pending:
+            self.conn.commit()
+            self.nb_pending = 0
+        self.last_commit = time.time()
+
+    def optimize(self):
+        self.commit()
+        self.conn.execute("INSERT INTO documents (documents) VALUES ('optimize')")
+        self.conn.commit()
+
+    def search(self, query, nb=50):
+        sql = 'SELECT path FROM documents WHERE documents MATCH ? ORDER BY rank LIMIT ?'
+        try:
+            rows = self.conn.execute(sql, (query, nb)).fetchall()
+        except sqlite3.OperationalError:  # Invalid query syntax, search the query as a phrase
+            query = query.replace('"', '""')
+            rows = self.conn.execute(sql, (f'"{query}"', nb)).fetchall()
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+INDEX_BACKENDS = {'whoosh': WhooshBackend, 'sqlite': SqliteFTSBackend}
+
+def get_index_type(index_path):
+    """
+    :return: type of an existing index, None if the directory is not an index
+    """
+    if os.path.isfile(os.path.join(index_path, 'index.db')):
+        return 'sqlite'
+    elif exists_in(index_path):
+        return 'whoosh'
+
+def get_index_backend(index_path, index_type=INDEX_TYPE, batch_size=BATCH_SIZE, batch_time=BATCH_TIME):
+    backend = INDEX_BACKENDS.get(index_type)
+    if not backend:
+        raise Exception(f'Unknown indexer type: {index_type}')
+    return backend(index_path, batch_size=batch_size, batch_time=batch_time)
+
+def optimize_index(index_path):
+    """
+    Merge the segments of a closed index, the index must not be updated during the merge
+    """
+    index_type = get_index_type(index_path)
+    if index_type:
+        backend = get_index_backend(index_path, index_type=index_type, batch_size=1)
+        try:
+            backend.optimize()
+        finally:
+            backend.close()
+
+#### SEARCH ####
+
+def search(query, index_name=None, nb=50):
+    """
+    Search the full-text indexes, most recent index first
+
+    :param index_name: search in this index only
+    :return: list of items ids
+    """
+    if index_name:
+        all_index = [index_name]
+    else:
+        all_index = reversed(get_all_index())
+    items = []
+    for index_name in all_index:
+        index_path = get_index_full_path(index_name)
+        index_type = get_index_type(index_path)
+        if not index_type:
+            continue
+        backend = get_index_backend(index_path, index_type=index_type, batch_size=1)
+        try:
+            items.extend(backend.search(query, nb=nb - len(items)))
+        finally:
+            backend.close()
+        if len(items) >= nb:
+            break
+    return items
+
 #### DATA RETENTION ####
 
 #keep time most recent index
@@ -13,6 +13,7 @@ sys.path.append(os.environ['AIL_BIN'])
 # Import Project packages
 ##################################
 from lib import ConfigLoader
+from lib import content_cache
 from lib import Tag
 
 logger = logging.getLogger()
@@ -54,17 +55,43 @@ def is_crawled(item_id):
 def get_item_domain(item_id):
     return item_id[19:-36]
 
-def get_item_content_binary(item_id):
+def _get_item_gid(item_id):
+    return f'item::{item_id}'
+
+def _read_item_content(item_id):
     item_full_path = os.path.join(ConfigLoader.get_items_dir(), item_id)
+    with gzip.open(item_full_path, 'rb') as f:
+        return f.read()
+
+def _decode_item_content(item_content):
     try:
-        with gzip.open(item_full_path, 'rb') as f:
-            item_content = f.read()
-    except Exception as e:
-        print(e)
-        item_content = b''
+        item_content = item_content.decode()
+    except UnicodeDecodeError:
+        item_content = str(item_content)
+        if len(item_content) > 2:
+            item_content = item_content[2:-1]
+            item_content = item_content.replace(r'\r\n', '\r\n')
+        item_content = item_content.replace(r'\n', '\n')
+    return item_content
+
+def get_item_content_binary(item_id):
+    item_gid = _get_item_gid(item_id)
+    item_content = content_cache.get_content(item_gid, r_type='bytes')
+    if item_content is None:
+        try:
+            item_content = _read_item_content(item_id)
+            content_cache.set_content(item_gid, item_content, r_type='bytes')
+        except Exception as e:
+            print(e)
+            item_content = b''
     return item_content
 
 def get_item_content(item_id):
+    item_gid = _get_item_gid(item_id)
+    item_content = content_cache.get_content(item_gid)
+    if item_content is not None:
+        return item_content
+
     item_full_path = os.path.join(ConfigLoader.get_items_dir(), item_id)
     try:
         item_content = r_cache.get(item_full_path)
@@ -74,23 +101,24 @@ def get_item_content(item_id):
         item_content = None
     if item_content is None:
         try:
-            with gzip.open(item_full_path, 'r') as f:
-                item_content = f.read()
-                try:
-                    item_content = item_content.decode()
-                except UnicodeDecodeError:
-                    item_content = str(item_content)
-                    if len(item_content) > 2:
-                        item_content = item_content[2:-1]
-                        item_content = item_content.replace(r'\r\n', '\r\n')
-                    item_content = item_content.replace(r'\n', '\n')
-                r_cache.set(item_full_path, item_content)
-                r_cache.expire(item_full_path, 300)
+            # decompressed content shared by Global
+            binary_content = content_cache.get_content(item_gid, r_type='bytes')
+            if binary_content is None:
+                binary_content = _read_item_content(item_id)
+                content_cache.set_content(item_gid, binary_content, r_type='bytes')
+            item_content = _decode_item_content(binary_content)
+            r_cache.set(item_full_path, item_content)
+            r_cache.expire(item_full_path, 300)
         except Exception as e:
             print(e)
             logger.error(f'{e}: item {item_id}')
-            item_content = ''
-    return str(item_content)
+            return ''
+    item_content = str(item_content)
+    content_cache.set_content(item_gid, item_content)
+    return item_content
+
+def delete_item_content_cache(item_id):
+    content_cache.delete_content(_get_item_gid(item_id))
 
 def get_item_mimetype(item_id):
     return magic.from_buffer(get_item_content(item_id), mime=True)
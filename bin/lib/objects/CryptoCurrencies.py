@@ -24,6 +24,9 @@ config_loader = None
 digits58 = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 digits58_ripple = 'rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz'
 digits32 = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+# char: value lookup tables
+values58 = {char: i for i, char in enumerate(digits58)}
+values58_ripple = {char: i for i, char in enumerate(digits58_ripple)}
 
 
 def decode_bech32(address):
@@ -51,10 +54,10 @@ def check_bech32_address(address):
     return True
 
 # http://rosettacode.org/wiki/Bitcoin/address_validation#Python
-def decode_base58(bc, length):
+def decode_base58(bc, length, values=values58):
     n = 0
     for char in bc:
-        n = n * 58 + digits58.index(char)
+        n = n * 58 + values[char]
     return n.to_bytes(length, 'big')
 
 # http://rosettacode.org/wiki/Bitcoin/address_validation#Python
@@ -66,10 +69,7 @@ def check_base58_address(bc):
         return False
 
 def decode_base58_ripple(bc, length):
-    n = 0
-    for char in bc:
-        n = n * 58 + digits58_ripple.index(char)
-    return n.to_bytes(length, 'big')
+    return decode_base58(bc, length, values=values58_ripple)
 
 def check_base58_ripple_address(bc):
     try:
@@ -78,6 +78,27 @@ def check_base58_ripple_address(bc):
     except Exception:
         return False
 
+def is_valid_address(subtype, address):
+    if subtype == 'bitcoin':
+        if address.startswith('bc'):
+            if check_bech32_address(address):
+                return True
+        return check_base58_address(address)
+    elif subtype == 'dash' or subtype == 'litecoin' or subtype == 'tron':
+        return check_base58_address(address)
+    elif subtype == 'ripple':
+        return check_base58_ripple_address(address)
+    else:
+        return True
+
+def get_valid_addresses(subtype, addresses):
+    """
+    Validate a batch of addresses of the same cryptocurrency, each address is checked once
+
+    :return: set of valid addresses
+    """
+    return {address for address in set(addresses) if is_valid_address(subtype, address)}
+
 
 class CryptoCurrency(AbstractSubtypeObject):
     """
@@ -98,17 +119,7 @@ class CryptoCurrency(AbstractSubtypeObject):
         pass
 
     def is_valid_address(self):
-        if self.subtype == 'bitcoin':
-            if self.id.startswith('bc'):
-                if check_bech32_address(self.id):
-                    return True
-            return check_base58_address(self.id)
-        elif self.subtype == 'dash' or self.subtype == 'litecoin' or self.subtype == 'tron':
-            return check_base58_address(self.id)
-        elif self.subtype == 'ripple':
-            return check_base58_ripple_address(self.id)
-        else:
-            return True
+        return is_valid_address(self.subtype, self.id)
 
     def get_currency_symbol(self):
         if self.subtype == 'bitcoin':
@@ -93,14 +93,18 @@ class DomHash(AbstractDaterangeObject):
         self._create()
 
 
-def _compute_dom_hash(html_content):
+def compute_dom_hash(html_content):
     soup = BeautifulSoup(html_content, "lxml")
     to_hash = "|".join(t.name for t in soup.findAll()).encode()
     return sha256(to_hash).hexdigest()[:32]
 
 
-def create(content):
-    obj_id = _compute_dom_hash(content)
+def create(content, obj_id=None):
+    """
+    :param obj_id: dom hash of the content, computed if None
+    """
+    if obj_id is None:
+        obj_id = compute_dom_hash(content)
     obj = DomHash(obj_id)
     if not obj.exists():
         obj.create()
@@ -433,9 +433,11 @@ class Domain(AbstractObject):
 
     # add root_item to history
     # if domain down -> root_item = epoch
-    def _add_history_root_item(self, root_item, epoch):
+    def _add_history_root_item(self, root_item, epoch, pipe=None):
         # Create/Update crawler history
-        r_crawler.zadd(f'domain:history:{self.id}', {root_item: epoch})
+        if pipe is None:
+            pipe = r_crawler
+        pipe.zadd(f'domain:history:{self.id}', {root_item: epoch})
 
     # if domain down -> root_item = epoch
     def add_history(self, epoch, root_item=None, date=None):
@@ -452,19 +454,21 @@ class Domain(AbstractObject):
                 status = True
 
         update_obj_date(date, 'domain', self.domain_type)
-        # UP
+        # UP: history writes sent in one round-trip
+        pipe = r_crawler.pipeline(transaction=False)
         if status:
-            r_crawler.srem(f'full_{self.domain_type}_down', self.id)
-            r_crawler.sadd(f'full_{self.domain_type}_up', self.id)
-            r_crawler.sadd(f'{self.domain_type}_up:{date}', self.id) # # TODO:  -> store first day
-            r_crawler.sadd(f'month_{self.domain_type}_up:{date[0:6]}', self.id) # # TODO:  -> store first month
-            self._add_history_root_item(root_item, epoch)
+            pipe.srem(f'full_{self.domain_type}_down', self.id)
+            pipe.sadd(f'full_{self.domain_type}_up', self.id)
+            pipe.sadd(f'{self.domain_type}_up:{date}', self.id) # # TODO:  -> store first day
+            pipe.sadd(f'month_{self.domain_type}_up:{date[0:6]}', self.id) # # TODO:  -> store first month
+            self._add_history_root_item(root_item, epoch, pipe=pipe)
         else:
-            r_crawler.sadd(f'{self.domain_type}_down:{date}', self.id)
+            pipe.sadd(f'{self.domain_type}_down:{date}', self.id)
             if self.was_up():
-                self._add_history_root_item(epoch, epoch)
+                self._add_history_root_item(epoch, epoch, pipe=pipe)
             else:
-                r_crawler.sadd(f'full_{self.domain_type}_down', self.id)
+                pipe.sadd(f'full_{self.domain_type}_down', self.id)
+        pipe.execute()
 
 ############################################################################
 # In memory zipfile
@@ -23,7 +23,7 @@ from lib.objects.abstract_object import AbstractObject
 from lib.ConfigLoader import ConfigLoader
 from lib import item_basic
 from lib.Language import LanguagesDetector
-from lib.data_retention_engine import update_obj_date, get_obj_date_first
+from lib.data_retention_engine import update_obj_date
 from packages import Date
 
 
@@ -209,8 +209,10 @@ class Item(AbstractObject):
     # TODO: DELETE ITEM CORRELATION + TAGS + METADATA + ...
     def delete(self):
         self._delete()
+        item_basic.delete_item_content_cache(self.id)
         try:
             os.remove(self.get_filename())
+            remove_item_from_count_index(self.id)
             return True
         except FileNotFoundError:
             return False
@@ -416,117 +418,150 @@ def _manual_set_items_date_first_last():
 ################################################################################
 ################################################################################
 
-def get_nb_items_objects(filters={}):
-    nb = 0
-    date_from = filters.get('date_from')
-    date_to = filters.get('date_to')
+# # # # ITEMS DIRECTORIES # # # #
+
+# Items are saved in <source>/<YYYY>/<MM>/<DD>/<filename>, the directories are walked with os.scandir
+
+def _get_date_subdirs(dirpath, length):
+    try:
+        with os.scandir(dirpath) as it:
+            return sorted(entry.name for entry in it if len(entry.name) == length and entry.name.isdigit() and entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+
+def get_items_dirs(filters={}):
+    """
+    :return: list of the (source, YYYY/MM/DD) items directories matching the filters, sorted
+    """
+    date_from = filters.get('date_from', '00000000')
+    date_to = filters.get('date_to', Date.get_today_date_str())
     if 'sources' in filters:
         sources = filters['sources']
     else:
         sources = get_all_sources()
-    sources = sorted(sources)
-
-    # date
-    if date_from and date_to:
-        daterange = Date.get_daterange(date_from, date_to)
-    elif date_from:
-        daterange = Date.get_daterange(date_from, Date.get_today_date_str())
-    elif date_to:
-        date_from = get_obj_date_first('item')
-        daterange = Date.get_daterange(date_from, date_to)
-    else:
-        date_from = get_obj_date_first('item')
-        daterange = Date.get_daterange(date_from, Date.get_today_date_str())
 
-    for source in sources:
-        for date in daterange:
-            date = f'{date[0:4]}/{date[4:6]}/{date[6:8]}'
-            full_dir = os.path.join(ITEMS_FOLDER, source, date)
-            if not os.path.isdir(full_dir):
+    items_dirs = []
+    for source in sorted(sources):
+        source_dir = os.path.join(ITEMS_FOLDER, source)
+        for year in _get_date_subdirs(source_dir, 4):
+            if not date_from[0:4] <= year <= date_to[0:4]:
                 continue
-            nb += len(os.listdir(full_dir))
-    return nb
+            for month in _get_date_subdirs(os.path.join(source_dir, year), 2):
+                if not date_from[0:6] <= f'{year}{month}' <= date_to[0:6]:
+                    continue
+                for day in _get_date_subdirs(os.path.join(source_dir, year, month), 2):
+                    if date_from <= f'{year}{month}{day}' <= date_to:
+                        items_dirs.append((source, f'{year}/{month}/{day}'))
+    return items_dirs
+
+def get_items_by_dir(source, date, start_id=None):
+    """
+    :param date: YYYY/MM/DD
+    :param start_id: return the items after this item
+    :return: sorted list of items ids
+    """
+    s_dir = os.path.join(source, date)
+    try:
+        with os.scandir(os.path.join(ITEMS_FOLDER, s_dir)) as it:
+            items = sorted(os.path.join(s_dir, entry.name) for entry in it if entry.is_file())
+    except FileNotFoundError:
+        return []
+    if start_id:
+        items = [item_id for item_id in items if item_id > start_id]
+    return items
 
-def get_all_items_objects(filters={}):
-    date_from = filters.get('date_from')
-    date_to = filters.get('date_to')
-    if 'sources' in filters:
-        sources = filters['sources']
+def get_items_iterator(filters={}, start_id=None):
+    """
+    Stream the items ids, sorted by source, date and filename. Only one directory is listed at a time.
+
+    :param start_id: resume token, the last item id processed: resume after this item
+    :return: iterator of items ids
+    """
+    if start_id:
+        start_dir = (get_source(start_id), get_item_date(start_id, add_separator=True))
     else:
-        sources = get_all_sources()
-    sources = sorted(sources)
+        start_dir = None
+    for source, date in get_items_dirs(filters):
+        if start_dir:
+            if (source, date) < start_dir:
+                continue
+            elif (source, date) == start_dir:
+                yield from get_items_by_dir(source, date, start_id=start_id)
+                continue
+        yield from get_items_by_dir(source, date)
+
+def get_all_items_objects(filters={}):
+    start_id = None
     if filters.get('start'):
         if filters['start']['type'] == 'item':
             start_id = filters['start']['id']
-            item = Item(start_id)
-            if not item.exists():
-                start_id = None
-                start_date = None
-            # remove sources
-            start_source = item.get_source()
-            i = 0
-            while start_source and len(sources) > i:
-                if sources[i] == start_source:
-                    sources = sources[i:]
-                    start_source = None
-                i += 1
-            start_date = item.get_date()
-        else:
-            start_id = None
-            start_date = None
-    else:
-        start_id = None
-        start_date = None
-
-    # date
-    if date_from and date_to:
-        daterange = Date.get_daterange(date_from, date_to)
-    elif date_from:
-        daterange = Date.get_daterange(date_from, Date.get_today_date_str())
-    elif date_to:
-        date_from = get_obj_date_first('item')
-        daterange = Date.get_daterange(date_from, date_to)
-    else:
-        date_from = get_obj_date_first('item')
-        if date_from:
-            daterange = Date.get_daterange(date_from, Date.get_today_date_str())
-        else:
-            daterange = []
-    if start_date:
-        if int(start_date) > int(date_from):
-            i = 0
-            while start_date and len(daterange) > i:
-                if daterange[i] == start_date:
-                    daterange = daterange[i:]
-                    start_date = None
-                i += 1
+    for item_id in get_items_iterator(filters, start_id=start_id):
+        yield Item(item_id)
 
-    for source in sources:
-        for date in daterange:
-            date = f'{date[0:4]}/{date[4:6]}/{date[6:8]}'
-            full_dir = os.path.join(ITEMS_FOLDER, source, date)
-            s_dir = os.path.join(source, date)
-            if not os.path.isdir(full_dir):
-                continue
+# # # # ITEMS COUNT # # # #
+
+# Number of items by source and day, maintained by the Global module: items:nb:<source> YYYYMMDD: nb
+
+# Decrement an existing counter
+# KEYS[1]: items:nb:<source>, ARGV[1]: YYYYMMDD
+_DECR_ITEMS_COUNT = r_object.register_script("""
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+end
+return nil
+""")
+
+def _count_items_by_dir(source, date):
+    """
+    :param date: YYYY/MM/DD
+    """
+    try:
+        with os.scandir(os.path.join(ITEMS_FOLDER, source, date)) as it:
+            return sum(1 for entry in it if entry.is_file())
+    except FileNotFoundError:
+        return 0
+
+def add_item_to_count_index(item_id):
+    """
+    Count a new item, called after the item is saved on disk
+    """
+    source = get_source(item_id)
+    date = get_item_date(item_id)
+    nb = r_object.hincrby(f'items:nb:{source}', date, 1)
+    # Day missing from the index (first item of the day or deleted index): count the items already saved.
+    # Only the process creating the counter seeds it
+    if nb == 1:
+        nb_items = _count_items_by_dir(source, get_item_date(item_id, add_separator=True))
+        if nb_items > 1:
+            r_object.hincrby(f'items:nb:{source}', date, nb_items - 1)
+
+def remove_item_from_count_index(item_id):
+    source = get_source(item_id)
+    date = get_item_date(item_id)
+    _DECR_ITEMS_COUNT(keys=[f'items:nb:{source}'], args=[date])
 
-            # TODO replace by os.scandir() ????
-            all_items = sorted([os.path.join(s_dir, f)
-                                for f in os.listdir(full_dir)
-                                if os.path.isfile(os.path.join(full_dir, f))])
-            # start obj id
-            if start_id:
-                i = 0
-                while start_id and len(all_items) > i:
-                    if all_items[i] == start_id:
-                        if i == len(all_items):
-                            all_items = []
-                        else:
-                            all_items = all_items[i+1:]
-                        start_id = None
-                    i += 1
-            for obj_id in all_items:
-                if obj_id:
-                    yield Item(obj_id)
+def get_nb_items_objects(filters={}):
+    """
+    :return: number of items, read from the count index. Days missing from the index are counted and indexed
+    """
+    today = Date.get_today_date_str()
+    items_dirs = {}
+    for source, date in get_items_dirs(filters):
+        if source not in items_dirs:
+            items_dirs[source] = []
+        items_dirs[source].append(date)
+
+    nb = 0
+    for source, dates in items_dirs.items():
+        days = [date.replace('/', '') for date in dates]
+        for date, day, nb_items in zip(dates, days, r_object.hmget(f'items:nb:{source}', days)):
+            if nb_items is None:
+                nb_items = _count_items_by_dir(source, date)
+                # Today can still be written by a Global process without the index
+                if day != today:
+                    r_object.hsetnx(f'items:nb:{source}', day, nb_items)
+            nb += int(nb_items)
+    return nb
 
 ################################################################################
 ################################################################################
@@ -141,7 +141,7 @@ class AbstractDaterangeObject(AbstractObject, ABC):
             self.set_first_seen(first_seen)
             self.set_last_seen(last_seen)
 
-    def _add(self, date, obj): # TODO OBJ=None
+    def _add(self, date, obj, nb=1): # TODO OBJ=None
         if not self.exists():
             self._add_create()
             self.set_first_seen(date)
@@ -150,7 +150,7 @@ class AbstractDaterangeObject(AbstractObject, ABC):
             self.update_daterange(date)
         update_obj_date(date, self.type)
 
-        r_object.zincrby(f'{self.type}:date:{date}', 1, self.id)
+        r_object.zincrby(f'{self.type}:date:{date}', nb, self.id)
 
         if obj:
             # Correlations
@@ -163,8 +163,11 @@ class AbstractDaterangeObject(AbstractObject, ABC):
                     domain = get_item_domain(item_id)
                     self.add_correlation('domain', '', domain)
 
-    def add(self, date, obj):
-        self._add(date, obj)
+    def add(self, date, obj, nb=1):
+        """
+        :param nb: number of times the object was seen
+        """
+        self._add(date, obj, nb=nb)
 
     # TODO:ADD objects + Stats
     def _create(self, first_seen=None, last_seen=None):
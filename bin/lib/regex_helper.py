@@ -3,15 +3,32 @@
 
 """
 Regex Helper
+============
+
+Timeout-bounded regex execution.
+
+Regexes are executed by a regex engine:
+    - process: a pool of persistent worker processes, results are sent back over pipes.
+               A worker is killed and respawned if a regex exceeds its max execution time.
+    - thread:  in-process execution with the timeout-capable `regex` package.
+               Falls back to the process engine if `regex` is not installed.
+
+The engine is selected in configs/core.cfg, section [Regex_Helper].
 """
 
 import os
 import logging.config
+import multiprocessing
 import re
 import sys
 import uuid
 
-from multiprocessing import Process as Proc
+from collections import defaultdict
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # python < 3.11
+    import sre_parse
 
 sys.path.append(os.environ['AIL_BIN'])
 ##################################
@@ -19,13 +36,21 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from lib import ail_logger
 from lib import ConfigLoader
+from lib.aho_corasick import AhoCorasick
 
 logging.config.dictConfig(ail_logger.get_config())
 logger = logging.getLogger()
 
 ## LOAD CONFIG ##
 config_loader = ConfigLoader.ConfigLoader()
-r_serv_cache = config_loader.get_redis_conn("Redis_Cache")
+if config_loader.has_option('Regex_Helper', 'engine'):
+    REGEX_ENGINE = config_loader.get_config_str('Regex_Helper', 'engine')
+else:
+    REGEX_ENGINE = 'process'
+if config_loader.has_option('Regex_Helper', 'workers'):
+    NB_REGEX_WORKERS = config_loader.get_config_int('Regex_Helper', 'workers')
+else:
+    NB_REGEX_WORKERS = 1
 config_loader = None
 ## -- ##
 
@@ -33,174 +58,502 @@ def generate_redis_cache_key(module_name):
     new_uuid = str(uuid.uuid4())
     return f'{module_name}_extracted:{new_uuid}'
 
-def _regex_findall(redis_key, regex, item_content, r_set):
-    all_items = re.findall(regex, item_content)
+# # # # # # # # # # # #
+#                     #
+#   REGEX FUNCTIONS   #
+#                     #
+# # # # # # # # # # # #
+
+def _regex_findall(regex, content, r_set):
+    all_items = re.findall(regex, content)
     if r_set:
-        if len(all_items) > 1:
-            for item in all_items:
-                r_serv_cache.sadd(redis_key, str(item))
-            r_serv_cache.expire(redis_key, 360)
-        elif all_items:
-            r_serv_cache.sadd(redis_key, str(all_items[0]))
-            r_serv_cache.expire(redis_key, 360)
+        return {str(item) for item in all_items}
     else:
-        if len(all_items) > 1:
-            for item in all_items:
-                r_serv_cache.lpush(redis_key, str(item))
-            r_serv_cache.expire(redis_key, 360)
-        elif all_items:
-            r_serv_cache.lpush(redis_key, str(all_items[0]))
-            r_serv_cache.expire(redis_key, 360)
+        # keep the previous ordering: lpush
+        return [str(item) for item in reversed(all_items)]
 
-def regex_findall(module_name, redis_key, regex, item_id, item_content, max_time=30, r_set=True):
+def _regex_finditer(regex, content):
+    all_match = []
+    for match in re.finditer(regex, content):
+        all_match.append((match.start(), match.end(), match.group()))
+    return all_match
 
-    proc = Proc(target=_regex_findall, args=(redis_key, regex, item_content, r_set, ))
-    try:
-        proc.start()
-        proc.join(max_time)
-        if proc.is_alive():
-            proc.terminate()
-            # Statistics.incr_module_timeout_statistic(module_name)
-            err_mess = f"{module_name}: processing timeout: {item_id}"
-            logger.info(err_mess)
-            return []
+def _regex_match(regex, content):
+    return bool(re.match(regex, content))
+
+def _regex_search(regex, content):
+    return bool(re.search(regex, content))
+
+def _regex_finditer_multi(regexs, content):
+    for regex in regexs:
+        try:
+            yield True, _regex_finditer(regex, content)
+        except Exception as e:
+            yield False, f'{type(e).__name__}: {e}'
+
+## Phone Regexs ##
+def _regex_phone_iter(country_code, content):
+    import phonenumbers
+    all_match = []
+    for match in phonenumbers.PhoneNumberMatcher(content, country_code):
+        # PhoneNumberFormat.E164
+        # value = phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.INTERNATIONAL)
+        all_match.append((match.start, match.end, match.raw_string))
+    return all_match
+
+REGEX_FUNCTIONS = {
+    'findall': _regex_findall,
+    'finditer': _regex_finditer,
+    'match': _regex_match,
+    'search': _regex_search,
+    'phone_iter': _regex_phone_iter,
+}
+
+# Functions executed on a list of regexs, one result is returned by regex
+REGEX_MULTI_FUNCTIONS = {
+    'finditer': _regex_finditer_multi,
+}
+
+# # # # # # # # # # # #
+#                     #
+#   PROCESS ENGINE    #
+#                     #
+# # # # # # # # # # # #
+
+def _regex_worker(conn):
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+        func_name, args, multi = task
+        if multi:
+            for res in REGEX_MULTI_FUNCTIONS[func_name](*args):
+                conn.send(res)
+            continue
+        try:
+            conn.send((True, REGEX_FUNCTIONS[func_name](*args)))
+        except Exception as e:
+            conn.send((False, f'{type(e).__name__}: {e}'))
+
+class RegexWorker:
+    """
+    Persistent regex worker process
+    """
+
+    def __init__(self):
+        self.conn = None
+        self.proc = None
+
+    def _start(self):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=_regex_worker, args=(child_conn,), daemon=True)
+        self.proc.start()
+        child_conn.close()
+
+    def is_alive(self):
+        return self.proc is not None and self.proc.is_alive()
+
+    def kill(self):
+        if self.proc:
+            self.proc.terminate()
+            self.proc.join(1)
+            if self.proc.is_alive():
+                self.proc.kill()
+                self.proc.join()
+        if self.conn:
+            self.conn.close()
+        self.proc = None
+        self.conn = None
+
+    def stop(self):
+        if self.is_alive():
+            try:
+                self.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            self.proc.join(1)
+        self.kill()
+
+    def execute(self, func_name, args, max_time):
+        """
+        Execute a regex function in the worker process.
+        Return (True, result) or (False, error); raise TimeoutError if max_time is exceeded
+        """
+        if not self.is_alive():
+            self.kill()
+            self._start()
+        try:
+            self.conn.send((func_name, args, False))
+            if not self.conn.poll(max_time):
+                self.kill()
+                raise TimeoutError
+            return self.conn.recv()
+        except (EOFError, BrokenPipeError, ConnectionResetError):
+            # worker crashed, respawned on next call
+            self.kill()
+            return False, 'regex worker died'
+
+    def execute_multi(self, func_name, regexs, content, max_time):
+        """
+        Execute a regex function for each regex, the content is sent once.
+        max_time is applied by regex, regexs following a timeout are executed in a new worker
+
+        :return: list of (True, result), (False, error) or (None, None) if timeout
+        """
+        results = []
+        while len(results) < len(regexs):
+            if not self.is_alive():
+                self.kill()
+                self._start()
+            try:
+                self.conn.send((func_name, (regexs[len(results):], content), True))
+                for _ in range(len(regexs) - len(results)):
+                    if not self.conn.poll(max_time):
+                        self.kill()
+                        results.append((None, None))
+                        break
+                    results.append(self.conn.recv())
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self.kill()
+                results.append((False, 'regex worker died'))
+        return results
+
+class ProcessRegexEngine:
+    """
+    Pool of persistent worker processes
+    """
+
+    def __init__(self, nb_workers=1):
+        self.workers = [RegexWorker() for _ in range(max(nb_workers, 1))]
+        self.idle = list(self.workers)
+
+    def _get_worker(self):
+        # modules are single threaded, a worker is always idle unless the engine is shared by threads
+        return self.idle.pop() if self.idle else RegexWorker()
+
+    def _release_worker(self, worker):
+        if worker in self.workers:
+            self.idle.append(worker)
         else:
-            if r_set:
-                all_items = r_serv_cache.smembers(redis_key)
-            else:
-                all_items = r_serv_cache.lrange(redis_key, 0, -1)
-            r_serv_cache.delete(redis_key)
-            proc.terminate()
-            return all_items
-    except KeyboardInterrupt:
-        print("Caught KeyboardInterrupt, terminating workers")
-        proc.terminate()
-        sys.exit(0)
+            worker.stop()
 
-def _regex_finditer(r_key, regex, content):
-    iterator = re.finditer(regex, content)
-    for match in iterator:
-        value = match.group()
-        start = match.start()
-        end = match.end()
-        r_serv_cache.rpush(r_key, f'{start}:{end}:{value}')
-    r_serv_cache.expire(r_key, 360)
+    def execute(self, func_name, args, max_time):
+        worker = self._get_worker()
+        try:
+            return worker.execute(func_name, args, max_time)
+        finally:
+            self._release_worker(worker)
 
-def regex_finditer(r_key, regex, item_id, content, max_time=30):
-    proc = Proc(target=_regex_finditer, args=(r_key, regex, content))
-    try:
-        proc.start()
-        proc.join(max_time)
-        if proc.is_alive():
-            proc.terminate()
-            # Statistics.incr_module_timeout_statistic(r_key)
-            err_mess = f"{r_key}: processing timeout: {item_id}"
-            logger.info(err_mess)
-            return []
+    def execute_multi(self, func_name, regexs, content, max_time):
+        worker = self._get_worker()
+        try:
+            return worker.execute_multi(func_name, regexs, content, max_time)
+        finally:
+            self._release_worker(worker)
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+# # # # # # # # # # # #
+#                     #
+#    THREAD ENGINE    #
+#                     #
+# # # # # # # # # # # #
+
+class ThreadRegexEngine:
+    """
+    In-process engine, use the timeout argument of the `regex` package
+    """
+
+    def __init__(self, fallback):
+        import regex
+        self.regex = regex
+        self.fallback = fallback
+        self.compiled = {}
+
+    def _compile(self, pattern):
+        if isinstance(pattern, re.Pattern):
+            key = (pattern.pattern, pattern.flags)
         else:
-            res = r_serv_cache.lrange(r_key, 0, -1)
-            r_serv_cache.delete(r_key)
-            proc.terminate()
-            all_match = []
-            for match in res:
-                start, end, value = match.split(':', 2)
-                all_match.append((int(start), int(end), value))
-            return all_match
-    except KeyboardInterrupt:
-        print("Caught KeyboardInterrupt, terminating regex worker")
-        proc.terminate()
-        sys.exit(0)
+            key = (pattern, 0)
+        compiled = self.compiled.get(key)
+        if compiled is None:
+            # re.UNICODE is set by default on str patterns
+            compiled = self.regex.compile(key[0], key[1] & ~re.UNICODE)
+            if len(self.compiled) > 1024:
+                self.compiled.clear()
+            self.compiled[key] = compiled
+        return compiled
 
-def _regex_match(r_key, regex, content):
-    if re.match(regex, content):
-        r_serv_cache.set(r_key, 1)
-        r_serv_cache.expire(r_key, 360)
+    def execute(self, func_name, args, max_time):
+        # phonenumbers can't be interrupted
+        if func_name == 'phone_iter':
+            return self.fallback.execute(func_name, args, max_time)
+        try:
+            pattern = self._compile(args[0])
+            content = args[1]
+            if func_name == 'findall':
+                all_items = pattern.findall(content, timeout=max_time)
+                if args[2]:
+                    return True, {str(item) for item in all_items}
+                else:
+                    return True, [str(item) for item in reversed(all_items)]
+            elif func_name == 'finditer':
+                return True, [(m.start(), m.end(), m.group()) for m in pattern.finditer(content, timeout=max_time)]
+            elif func_name == 'match':
+                return True, bool(pattern.match(content, timeout=max_time))
+            elif func_name == 'search':
+                return True, bool(pattern.search(content, timeout=max_time))
+        except TimeoutError:
+            raise
+        except self.regex.error:
+            # syntax not supported by regex, use the re module
+            return self.fallback.execute(func_name, args, max_time)
+        except Exception as e:
+            return False, f'{type(e).__name__}: {e}'
+        return False, f'Unknown regex function: {func_name}'
 
-def regex_match(r_key, regex, item_id, content, max_time=30):
-    proc = Proc(target=_regex_match, args=(r_key, regex, content))
+    def execute_multi(self, func_name, regexs, content, max_time):
+        results = []
+        for regex in regexs:
+            try:
+                results.append(self.execute(func_name, (regex, content), max_time))
+            except TimeoutError:
+                results.append((None, None))
+        return results
+
+    def stop(self):
+        self.fallback.stop()
+
+def _create_engine(engine_name=REGEX_ENGINE):
+    process_engine = ProcessRegexEngine(nb_workers=NB_REGEX_WORKERS)
+    if engine_name == 'thread':
+        try:
+            return ThreadRegexEngine(process_engine)
+        except ImportError:
+            logger.warning('regex_helper: regex package not installed, fallback to the process engine')
+    elif engine_name != 'process':
+        logger.warning(f'regex_helper: Unknown regex engine {engine_name}, fallback to the process engine')
+    return process_engine
+
+_engine = None
+_engine_pid = None
+
+def get_engine():
+    global _engine
+    global _engine_pid
+    # workers and pipes can't be shared with a forked process
+    if _engine is None or _engine_pid != os.getpid():
+        _engine = _create_engine()
+        _engine_pid = os.getpid()
+    return _engine
+
+def _execute(func_name, args, r_key, item_id, max_time, default):
     try:
-        proc.start()
-        proc.join(max_time)
-        if proc.is_alive():
-            proc.terminate()
-            # Statistics.incr_module_timeout_statistic(r_key)
-            err_mess = f"{r_key}: processing timeout: {item_id}"
-            logger.info(err_mess)
-            return False
-        else:
-            if r_serv_cache.exists(r_key):
-                r_serv_cache.delete(r_key)
-                return True
-            else:
-                r_serv_cache.delete(r_key)
-                return False
+        success, res = get_engine().execute(func_name, args, max_time)
+    except TimeoutError:
+        # Statistics.incr_module_timeout_statistic(r_key)
+        logger.info(f"{r_key}: processing timeout: {item_id}")
+        return default
     except KeyboardInterrupt:
         print("Caught KeyboardInterrupt, terminating regex worker")
-        proc.terminate()
+        get_engine().stop()
         sys.exit(0)
+    if not success:
+        logger.error(f'{r_key}: regex error: {item_id}: {res}')
+        return default
+    return res
+
+# # # # # # # # # # # #
+#                     #
+#     REGEX HELPER    #
+#                     #
+# # # # # # # # # # # #
+
+def regex_findall(module_name, redis_key, regex, item_id, item_content, max_time=30, r_set=True):
+    return _execute('findall', (regex, item_content, r_set), module_name, item_id, max_time, [])
+
+def regex_finditer(r_key, regex, item_id, content, max_time=30):
+    return _execute('finditer', (regex, content), r_key, item_id, max_time, [])
 
-def _regex_search(r_key, regex, content):
-    if re.search(regex, content):
-        r_serv_cache.set(r_key, 1)
-        r_serv_cache.expire(r_key, 360)
+def regex_match(r_key, regex, item_id, content, max_time=30):
+    return _execute('match', (regex, content), r_key, item_id, max_time, False)
 
 def regex_search(r_key, regex, item_id, content, max_time=30):
-    proc = Proc(target=_regex_search, args=(r_key, regex, content))
+    return _execute('search', (regex, content), r_key, item_id, max_time, False)
+
+def regex_phone_iter(r_key, country_code, item_id, content, max_time=30):
+    return _execute('phone_iter', (country_code, content), r_key, item_id, max_time, [])
+
+def regex_finditer_multi(r_key, regexs, item_id, content, max_time=30):
+    """
+    regex_finditer on a list of regexs, the content is sent once to the regex engine
+
+    :param max_time: max execution time by regex
+    :return: list of matches, one by regex
+    """
     try:
-        proc.start()
-        proc.join(max_time)
-        if proc.is_alive():
-            proc.terminate()
-            # Statistics.incr_module_timeout_statistic(r_key)
-            err_mess = f"{r_key}: processing timeout: {item_id}"
-            logger.info(err_mess)
-            return False
-        else:
-            if r_serv_cache.exists(r_key):
-                r_serv_cache.delete(r_key)
-                return True
-            else:
-                r_serv_cache.delete(r_key)
-                return False
+        results = get_engine().execute_multi('finditer', regexs, content, max_time)
     except KeyboardInterrupt:
         print("Caught KeyboardInterrupt, terminating regex worker")
-        proc.terminate()
+        get_engine().stop()
         sys.exit(0)
+    all_matches = []
+    for regex, (success, res) in zip(regexs, results):
+        if success is None:
+            # Statistics.incr_module_timeout_statistic(r_key)
+            logger.info(f"{r_key}: processing timeout: {item_id}")
+            res = []
+        elif not success:
+            logger.error(f'{r_key}: regex error: {item_id}: {res}')
+            res = []
+        all_matches.append(res)
+    return all_matches
 
-## Phone Regexs ##
-def _regex_phone_iter(r_key, country_code, content):
-    import phonenumbers
-    iterator = phonenumbers.PhoneNumberMatcher(content, country_code)
-    for match in iterator:
-        value = match.raw_string
-        # PhoneNumberFormat.E164
-        # value = phonenumbers.format_number(match.number, phonenumbers.PhoneNumberFormat.INTERNATIONAL)
-        start = match.start
-        end = match.end
-        r_serv_cache.rpush(r_key, f'{start}:{end}:{value}')
-    r_serv_cache.expire(r_key, 360)
+# # # # # # # # # # # #
+#                     #
+#   LITERAL PREFILTER #
+#                     #
+# # # # # # # # # # # #
 
-def regex_phone_iter(r_key, country_code, item_id, content, max_time=30):
-    proc = Proc(target=_regex_phone_iter, args=(r_key, country_code, content))
+def _get_required_literals(parsed, min_length):
+    """
+    :return: set of literals, at least one of them is in any string matched, or None if unknown
+    """
+    candidates = []
+    literal = []
+    for op, av in parsed:
+        if op is sre_parse.LITERAL:
+            literal.append(chr(av))
+            continue
+        if literal:
+            candidates.append({''.join(literal)})
+            literal = []
+        if op is sre_parse.SUBPATTERN:
+            literals = _get_required_literals(av[-1], min_length)
+            if literals:
+                candidates.append(literals)
+        elif op is sre_parse.BRANCH:
+            literals = set()
+            for branch in av[1]:
+                branch_literals = _get_required_literals(branch, min_length)
+                if not branch_literals:
+                    literals = None
+                    break
+                literals.update(branch_literals)
+            if literals:
+                candidates.append(literals)
+        elif op is sre_parse.MAX_REPEAT or op is sre_parse.MIN_REPEAT:
+            if av[0] >= 1:
+                literals = _get_required_literals(av[2], min_length)
+                if literals:
+                    candidates.append(literals)
+        elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+            literals = _get_required_literals(av, min_length)
+            if literals:
+                candidates.append(literals)
+    if literal:
+        candidates.append({''.join(literal)})
+
+    best = None
+    best_length = 0
+    for literals in candidates:
+        length = min(len(lit) for lit in literals)
+        if length >= min_length and length > best_length:
+            best = literals
+            best_length = length
+    return best
+
+def get_regex_literals(regex, min_length=3):
+    """
+    Extract literals required by a regex, a string matched by the regex contains at least one of them.
+    Literals are casefolded, they need to be searched in the casefolded content.
+
+    :param regex: str or compiled regex
+    :param min_length: min length of the literals
+    :return: set of literals or None if no literal can be extracted
+    """
+    if isinstance(regex, re.Pattern):
+        pattern, flags = regex.pattern, regex.flags
+    else:
+        pattern, flags = regex, 0
+    if isinstance(pattern, bytes):
+        return None
     try:
-        proc.start()
-        proc.join(max_time)
-        if proc.is_alive():
-            proc.terminate()
-            # Statistics.incr_module_timeout_statistic(r_key)
-            err_mess = f"{r_key}: processing timeout: {item_id}"
-            logger.info(err_mess)
-            return []
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return None
+    literals = _get_required_literals(parsed, min_length)
+    if literals:
+        literals = {lit.casefold() for lit in literals}
+    return literals
+
+class RegexPrefilter:
+    """
+    Select the regexs that can match a content with a single literal prefilter pass.
+
+    Literals required by each regex are extracted and compiled in one Aho-Corasick automaton.
+    Only the regexs with a literal found in the content, or without extractable literal, need to be executed.
+    """
+
+    def __init__(self, regexs=None):
+        """
+        :param regexs: dict, key: regex
+        """
+        self.regexs = {}
+        # keys of the regexs without literal
+        self.always = []
+        # literal: list of keys
+        self.literals = defaultdict(list)
+        self.automaton = AhoCorasick()
+        if regexs:
+            for key, regex in regexs.items():
+                self.add(key, regex)
+            self.build()
+
+    def __len__(self):
+        return len(self.regexs)
+
+    def add(self, key, regex):
+        literals = get_regex_literals(regex)
+        self.regexs[key] = literals
+        if literals:
+            for literal in literals:
+                self.literals[literal].append(key)
+                self.automaton.add(literal, literal)
         else:
-            res = r_serv_cache.lrange(r_key, 0, -1)
-            r_serv_cache.delete(r_key)
-            proc.terminate()
-            all_match = []
-            for match in res:
-                start, end, value = match.split(':', 2)
-                all_match.append((int(start), int(end), value))
-            return all_match
-    except KeyboardInterrupt:
-        print("Caught KeyboardInterrupt, terminating regex worker")
-        proc.terminate()
-        sys.exit(0)
\ No newline at end of file
+            self.always.append(key)
+
+    def build(self):
+        self.automaton.build()
+
+    def get_candidates(self, content):
+        """
+        :return: list of the keys of the regexs that can match the content
+        """
+        candidates = list(self.always)
+        if len(self.automaton):
+            selected = set()
+            for literal in self.automaton.search(content.casefold()):
+                for key in self.literals[literal]:
+                    if key not in selected:
+                        selected.add(key)
+                        candidates.append(key)
+        return candidates
+
+    def is_candidate(self, key, content):
+        """
+        :return: True if the regex can match the content
+        """
+        literals = self.regexs.get(key)
+        if not literals:
+            return True
+        content = content.casefold()
+        for literal in literals:
+            if literal in content:
+                return True
+        return False
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+Retro Hunt Engine
+=================
+
+Run a Retro Hunt task in parallel.
+
+The objects to analyze are split in partitions:
+    item:       one partition by source and date directory: item:<source>:<YYYY/MM/DD>
+    message/ocr: one partition by chat service instance:     message:<instance_uuid>
+    others:     one partition by object type:               <obj_type>:
+
+Each partition is analyzed by a worker of a process pool, the YARA rule is compiled once by worker.
+A partition is checkpointed every CHECKPOINT objects and when completed, a paused task is resumed
+from the checkpoints. The items matched are sent to the engine at each checkpoint, to be tagged.
+
+A task paused by a previous version (single checkpoint: last object analyzed) is converted to
+partitions checkpoints on its first run.
+"""
+import gzip
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+
+import yara
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib.ail_core import get_objects_retro_hunted
+from lib.ConfigLoader import ConfigLoader
+from lib.objects import ail_objects
+from lib.objects import Items
+from lib import chats_viewer
+from lib import Tracker
+
+config_loader = ConfigLoader()
+NB_WORKERS = config_loader.get_config_int('Retro_Hunt', 'nb_workers') if config_loader.has_option('Retro_Hunt', 'nb_workers') else 0
+config_loader = None
+
+# Number of objects analyzed between two checkpoints
+CHECKPOINT = 100
+# Items read buffer size
+BUFFER_SIZE = 1024 * 1024
+
+logger = logging.getLogger()
+
+# # # # PARTITIONS # # # #
+
+def get_partitions(filters):
+    """
+    :param filters: dict, obj_type: obj_type filters
+    :return: list of partitions
+    """
+    partitions = []
+    for obj_type in filters:
+        obj_filters = filters.get(obj_type) or {}
+        if obj_type == 'item':
+            for source, date in Items.get_items_dirs(obj_filters):
+                partitions.append(f'item:{source}:{date}')
+        elif obj_type == 'message' or obj_type == 'ocr':
+            for instance_uuid in obj_filters.get('instances', chats_viewer.get_chat_service_instances()):
+                partitions.append(f'{obj_type}:{instance_uuid}')
+        else:
+            partitions.append(f'{obj_type}:')
+    return partitions
+
+def _read_item_content(item_id):
+    try:
+        with open(os.path.join(Items.ITEMS_FOLDER, item_id), 'rb', buffering=BUFFER_SIZE) as f:
+            return gzip.decompress(f.read())
+    except Exception as e:
+        logger.warning(f'Retro Hunt: {item_id}, {e}')
+        return b''
+
+def get_partition_objs(partition, filters, start_id=None):
+    """
+    :param start_id: resume the partition after this object
+    :return: iterator of (object, content)
+    """
+    obj_type, key = partition.split(':', 1)
+    if obj_type == 'item':
+        source, date = key.rsplit(':', 1)
+        for item_id in Items.get_items_by_dir(source, date, start_id=start_id):
+            yield Items.Item(item_id), _read_item_content(item_id)
+    else:
+        obj_filters = dict(filters.get(obj_type) or {})
+        if key:
+            obj_filters['instances'] = [key]
+        objs = iter(ail_objects.obj_iterator(obj_type, obj_filters))
+        # Resume: skip the objects already analyzed
+        if start_id:
+            for obj in objs:
+                if obj.get_id() == start_id:
+                    break
+            else:
+                # The last object analyzed was deleted: analyze the whole partition again
+                logger.warning(f'Retro Hunt: {partition}, {start_id} not found, partition analyzed again')
+                objs = ail_objects.obj_iterator(obj_type, obj_filters)
+        for obj in objs:
+            yield obj, obj.get_content(r_type='bytes')
+
+# # # # WORKERS # # # #
+
+class RetroHuntWorker:
+    """
+    Analyze the partitions of a Retro Hunt task, run in a pool process
+    """
+
+    def __init__(self, task_uuid, matches):
+        self.retro_hunt = Tracker.RetroHunt(task_uuid)
+        # Queue of the items matched, tagged by the engine
+        self.matches = matches
+        self.rule = self.retro_hunt.get_rule(r_compile=True)
+        self.timeout = self.retro_hunt.get_timeout()
+        self.tags = self.retro_hunt.get_tags()
+        self.filters = get_filters(self.retro_hunt)
+
+    def match(self, obj, content):
+        try:
+            return self.rule.match(data=content, timeout=self.timeout)
+        except yara.TimeoutError:
+            logger.warning(f'Retro Hunt {self.retro_hunt.uuid}: timeout {obj.get_type()} {obj.get_id()}')
+            return []
+
+    def analyze_partition(self, partition):
+        """
+        :return: (partition, paused)
+        """
+        if self.retro_hunt.to_pause():
+            return partition, True
+
+        items = []
+        nb_done = 0
+        obj_id = self.retro_hunt.get_partition_last(partition)
+        for obj, content in get_partition_objs(partition, self.filters, start_id=obj_id):
+            obj_id = obj.get_id()
+            if content and self.match(obj, content):
+                obj_type = obj.get_type()
+                self.retro_hunt.add(obj_type, obj.get_subtype(r_str=True), obj_id)
+                # Items are tagged by the Tags module
+                if obj_type == 'item':
+                    items.append(obj_id)
+                else:
+                    for tag in self.tags:
+                        obj.add_tag(tag)
+
+            nb_done += 1
+            if nb_done % CHECKPOINT == 0:
+                # Send the items matched before the checkpoint
+                if items:
+                    self.matches.put(items)
+                    items = []
+                self.retro_hunt.set_partition_last(partition, obj_id)
+                self.retro_hunt.incr_nb_done(CHECKPOINT)
+                # PAUSE
+                if self.retro_hunt.to_pause():
+                    return partition, True
+
+        if items:
+            self.matches.put(items)
+        self.retro_hunt.incr_nb_done(nb_done % CHECKPOINT)
+        self.retro_hunt.add_partition_done(partition)
+        return partition, False
+
+_worker = None
+
+def _init_worker(task_uuid, matches):
+    global _worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker = RetroHuntWorker(task_uuid, matches)
+
+def _analyze_partition(partition):
+    return _worker.analyze_partition(partition)
+
+# # # # ENGINE # # # #
+
+def get_filters(retro_hunt):
+    filters = retro_hunt.get_filters()
+    if not filters:
+        filters = {}
+        for obj_type in get_objects_retro_hunted():
+            filters[obj_type] = {}
+    return filters
+
+def convert_last_analyzed(retro_hunt, filters):
+    """
+    Convert the checkpoint of a task paused by a previous version, the last object analyzed,
+    to partitions checkpoints. The objects were analyzed by type, in the filters order, and
+    the items sorted by source, date and filename.
+    """
+    last = retro_hunt.get_last_analyzed()
+    if not last:
+        return None
+    if not retro_hunt.has_partitions():
+        last_type, _, last_id = last.split(':', 2)
+        if last_type in filters:
+            obj_types = list(filters)
+            done = []
+            for partition in get_partitions(filters):
+                obj_type, key = partition.split(':', 1)
+                # Objects types analyzed before the last object type
+                if obj_types.index(obj_type) < obj_types.index(last_type):
+                    done.append(partition)
+                elif obj_type == last_type:
+                    if obj_type == 'item':
+                        last_dir = (Items.get_source(last_id), Items.get_item_date(last_id, add_separator=True))
+                        source, date = key.rsplit(':', 1)
+                        if (source, date) < last_dir:
+                            done.append(partition)
+                        elif (source, date) == last_dir:
+                            retro_hunt.set_partition_last(partition, last_id)
+                    elif not key:
+                        retro_hunt.set_partition_last(partition, last_id)
+                    # message/ocr: the instances order is unknown, the partitions are analyzed again
+            for partition in done:
+                retro_hunt.add_partition_done(partition)
+            # Progress of the previous version
+            progress = retro_hunt.get_progress()
+            if progress:
+                retro_hunt.set_nb_done(int(float(progress) * ail_objects.card_objs_iterators(filters) / 100))
+    retro_hunt.delete_last_analyzed()
+
+class RetroHuntEngine:
+    """
+    Run a Retro Hunt task with a pool of workers
+    """
+
+    def __init__(self, task_uuid, nb_workers=None):
+        self.retro_hunt = Tracker.RetroHunt(task_uuid)
+        if not nb_workers:
+            nb_workers = NB_WORKERS or os.cpu_count() or 1
+        self.nb_workers = nb_workers
+
+        # Time in seconds between two progress updates
+        self.refresh_time = 2
+
+        self.nb_objs = 0
+        self.progress = 0
+
+    def update_progress(self):
+        if self.nb_objs == 0:
+            new_progress = 100
+        else:
+            new_progress = min(self.retro_hunt.get_nb_done() * 100 / self.nb_objs, 100)
+        if int(self.progress) != int(new_progress):
+            self.retro_hunt.set_progress(new_progress)
+            self.progress = new_progress
+
+    def run(self, callback_items=None):
+        """
+        :param callback_items: function called with the list of items ids matched by a partition
+        :return: True if the task is completed, False if paused
+        """
+        filters = get_filters(self.retro_hunt)
+        convert_last_analyzed(self.retro_hunt, filters)
+        self.nb_objs = ail_objects.card_objs_iterators(filters)
+        self.progress = 0
+        self.update_progress()
+
+        done = self.retro_hunt.get_partitions_done()
+        partitions = [partition for partition in get_partitions(filters) if partition not in done]
+        logger.debug(f'Retro Hunt {self.retro_hunt.uuid}: {len(partitions)} partitions, {self.nb_workers} workers')
+
+        paused = False
+        if partitions:
+            # Check the rule before starting the workers
+            self.retro_hunt.get_rule(r_compile=True)
+            nb_workers = min(self.nb_workers, len(partitions))
+            # Items matched, sent by the workers at each checkpoint
+            with multiprocessing.Manager() as manager:
+                matches = manager.Queue()
+                with multiprocessing.Pool(nb_workers, initializer=_init_worker, initargs=(self.retro_hunt.uuid, matches)) as pool:
+                    results = pool.imap_unordered(_analyze_partition, partitions)
+                    while True:
+                        try:
+                            partition, partition_paused = results.next(timeout=self.refresh_time)
+                        except multiprocessing.TimeoutError:
+                            self.send_matches(matches, callback_items)
+                            self.update_progress()
+                            continue
+                        except StopIteration:
+                            break
+                        if partition_paused:
+                            paused = True
+                        self.send_matches(matches, callback_items)
+                        self.update_progress()
+                # All workers are stopped
+                self.send_matches(matches, callback_items)
+
+        if paused:
+            self.retro_hunt.pause()
+            return False
+        else:
+            self.retro_hunt.complete()
+            return True
+
+    def send_matches(self, matches, callback_items):
+        while True:
+            try:
+                items = matches.get_nowait()
+            except queue.Empty:
+                break
+            if callback_items:
+                callback_items(items)
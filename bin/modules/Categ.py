@@ -64,6 +64,9 @@ class Categ(AbstractModule):
         # default = 1 string
         self.matchingThreshold = config_loader.get_config_int("Categ", "matchingThreshold")
 
+        # Number of messages consumed in one round-trip
+        self.batch_size = 50
+
         self.reload_categ_words()
         self.logger.info("Script Categ started")
 
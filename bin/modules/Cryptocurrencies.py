@@ -6,6 +6,9 @@ The Cryptocurrency Module
 
 It trying to extract cryptocurrencies address and secret key from items
 
+All the currencies addresses are extracted in one pass with a combined regex,
+the addresses are then validated by currency.
+
     ..seealso:: Paste method (get_regex)
 
 Requirements
@@ -19,15 +22,17 @@ Requirements
 # Import External packages
 ##################################
 import os
+import re
 import sys
 from abc import ABC
+from collections import defaultdict
 
 sys.path.append(os.environ['AIL_BIN'])
 ##################################
 # Import Project packages
 ##################################
 from modules.abstract_module import AbstractModule
-from lib.objects.CryptoCurrencies import CryptoCurrency
+from lib.objects.CryptoCurrencies import CryptoCurrency, get_valid_addresses
 
 ##################################
 ##################################
@@ -108,6 +113,23 @@ CURRENCIES = {
 ##################################
 ##################################
 
+def get_addresses_regex():
+    """
+    Combine all the currencies addresses regexs in one regex.
+    The leading word boundary is factored: checked once by position instead of once by currency.
+    """
+    bounded = []
+    others = []
+    for curr in CURRENCIES:
+        regex = CURRENCIES[curr]['regex']
+        if regex.startswith(r'\b'):
+            bounded.append(f'(?:{regex[2:]})')
+        else:
+            others.append(f'(?:{regex})')
+    if bounded:
+        others.append(r'\b(?:' + '|'.join(bounded) + ')')
+    return '|'.join(others)
+
 class Cryptocurrencies(AbstractModule, ABC):
     """
     Cve module for AIL framework
@@ -117,6 +139,9 @@ class Cryptocurrencies(AbstractModule, ABC):
         super(Cryptocurrencies, self).__init__()
 
         # regexs
+        # The addresses regexs start with distinct prefixes: a match is matched by a single currency regex
+        self.addresses_regex = re.compile(get_addresses_regex())
+        self.currencies_regexs = {curr: re.compile(CURRENCIES[curr]['regex']) for curr in CURRENCIES}
 
         # Waiting time in seconds between to message processed
         self.pending_seconds = 1
@@ -124,42 +149,50 @@ class Cryptocurrencies(AbstractModule, ABC):
         # Send module state to logs
         self.logger.info(f'Module {self.module_name} initialized')
 
+    def get_address_currency(self, address):
+        for curr, regex in self.currencies_regexs.items():
+            if regex.fullmatch(address):
+                return curr
+        return None
+
     def compute(self, message):
         item = self.get_obj()
         item_id = item.get_id()
         date = item.get_date()
         content = item.get_content()
 
-        for curr in CURRENCIES:
+        # One pass for all the currencies
+        currencies_addresses = defaultdict(set)
+        for address in self.regex_findall(self.addresses_regex, item_id, content, r_set=True):
+            curr = self.get_address_currency(address)
+            if curr:
+                currencies_addresses[curr].add(address)
+
+        tags = set()
+        private_keys_regexs = {}
+        for curr, addresses in currencies_addresses.items():
             currency = CURRENCIES[curr]
-            addresses = self.regex_findall(currency['regex'], item_id, content)
-            if addresses:
-                is_valid_address = False
-                for address in addresses:
-                    crypto = CryptoCurrency(address, currency['name'])
-                    # Verify Address
-                    if crypto.is_valid_address():
-                        # print(address)
-                        is_valid_address = True
-                        crypto.add(date, item)
-
-                # Check private key
-                if is_valid_address:
-                    msg = f'{currency["tag"]}'
-                    self.add_message_to_queue(message=msg, queue='Tags')
-
-                    if currency.get('private_key'):
-                        private_keys = self.regex_findall(currency['private_key']['regex'], item_id, content)
-                        if private_keys:
-                            msg = f'{currency["private_key"]["tag"]}'
-                            self.add_message_to_queue(message=msg, queue='Tags')
-
-                            # debug
-                            print(private_keys)
-                    else:
-                        private_keys = []
-
-                    print(f"{currency['name']} found: {len(addresses)} address and {len(private_keys)} private Keys {self.obj.get_global_id()}")
+            # Verify Addresses
+            valid_addresses = get_valid_addresses(currency['name'], addresses)
+            for address in valid_addresses:
+                CryptoCurrency(address, currency['name']).add(date, item)
+
+            if valid_addresses:
+                tags.add(currency['tag'])
+                if currency.get('private_key'):
+                    private_keys_regexs[currency['private_key']['regex']] = currency['private_key']['tag']
+                print(f"{currency['name']} found: {len(valid_addresses)} address {self.obj.get_global_id()}")
+
+        # Check private keys
+        for regex, tag in private_keys_regexs.items():
+            private_keys = self.regex_findall(regex, item_id, content)
+            if private_keys:
+                tags.add(tag)
+                # debug
+                print(private_keys)
+
+        for tag in tags:
+            self.add_message_to_queue(message=tag, queue='Tags')
 
 
 if __name__ == '__main__':
@@ -24,6 +24,7 @@ sys.path.append(os.environ['AIL_BIN'])
 from modules.abstract_module import AbstractModule
 from lib.ConfigLoader import ConfigLoader
 from lib import d4
+from lib.dns_resolver import DNSResolver, get_passive_dns_records
 
 
 class DomClassifier(AbstractModule):
@@ -40,6 +41,10 @@ class DomClassifier(AbstractModule):
         self.pending_seconds = 1
 
         addr_dns = config_loader.get_config_str("DomClassifier", "dns")
+        self.dns_server = addr_dns
+        # Async resolver, answers cached in Redis_Cache
+        self.resolver = DNSResolver([addr_dns])
+        self.rtypes = ['A', 'AAAA', 'SOA', 'MX', 'CNAME']
 
         redis_host = config_loader.get_config_str('Redis_Cache', 'host')
         redis_port = config_loader.get_config_int('Redis_Cache', 'port')
@@ -55,6 +60,23 @@ class DomClassifier(AbstractModule):
         # Send module state to logs
         self.logger.info(f"Module: {self.module_name} Launched")
 
+    def validdomain(self):
+        """
+        Resolve all the extracted domains in one batch, replace DomainClassifier validdomain()
+
+        Set the DomainClassifier valid domains to the passive DNS records of the answers
+        """
+        domains = self.dom_classifier.domain
+        answers = self.resolver.resolve_batch((domain, rtype) for domain in domains for rtype in self.rtypes)
+        vdomain = set()
+        for domain in domains:
+            for rtype in self.rtypes:
+                answer = answers.get((domain.lower(), rtype))
+                if answer:
+                    vdomain.update(get_passive_dns_records(domain, answer, self.dns_server))
+        self.dom_classifier.vdomain = vdomain
+        return vdomain
+
     def compute(self, message, r_result=False):
         host = message
 
@@ -64,7 +86,7 @@ class DomClassifier(AbstractModule):
             if not self.dom_classifier.domain:
                 return
             print(self.dom_classifier.domain)
-            self.dom_classifier.validdomain(passive_dns=True, extended=False)
+            self.validdomain()
             # self.logger.debug(self.dom_classifier.vdomain)
 
             print(self.dom_classifier.vdomain)
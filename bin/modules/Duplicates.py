@@ -46,6 +46,15 @@ class Duplicates(AbstractModule):
                         "tlsh": {"threshold": THRESHOLD_TLSH}
                      }
 
+        # In-memory similarity index of the last months hashs
+        for algo in self.algos:
+            cache = Duplicate.HashsCache(algo, self.maximum_month_range)
+            cache.refresh(force=True)
+            self.algos[algo]['cache'] = cache
+            self.logger.info(f'{algo} index: {cache.get_nb_hashs()} hashs, {cache.get_memory_size() // 1048576} MB')
+            if cache.skipped:
+                self.logger.warning(f'{algo} index: cache_max_hashs reached, months not indexed: {cache.skipped}')
+
         self.logger.info(f"Module: {self.module_name} Launched")
 
     def compute(self, message):
@@ -59,7 +68,6 @@ class Duplicates(AbstractModule):
 
         # one month
         curr_date_ymonth = datetime.datetime.now().strftime("%Y%m")
-        last_month_dates = Duplicate.get_last_x_month_dates(self.maximum_month_range)
 
         x = time.time()
 
@@ -74,21 +82,25 @@ class Duplicates(AbstractModule):
 
         for algo in self.algos:
             obj_hash = self.algos[algo]['hash']
-            for date_ymonth in last_month_dates:
-                if Duplicate.exists_algo_hash_by_month(algo, obj_hash, date_ymonth):
+            cache = self.algos[algo]['cache']
+            cache.refresh()
+            for date_ymonth, hashs in cache.get_candidates(obj_hash).items():
+                if obj_hash in hashs:
                     Duplicate.add_duplicate(algo, obj_hash, 100, 'item', '', item.get_id(), date_ymonth)
                     nb_duplicates += 1
                 else:
-                    for hash in Duplicate.get_algo_hashs_by_month(algo, date_ymonth):
+                    # Only compare the hashs retrieved from the similarity index
+                    for hash in hashs:
                         # # FIXME:  try - catch 'hash not comparable, bad hash: '+dico_hash+' , current_hash: '+paste_hash
                         similarity = Duplicate.get_algo_similarity(algo, obj_hash, hash)
-                        print(f'[{algo}] comparing: {obj_hash} and {hash} similarity: {similarity}')  # DEBUG:
+                        self.logger.debug(f'[{algo}] comparing: {obj_hash} and {hash} similarity: {similarity}')
                         if similarity >= self.algos[algo]['threshold']:
                             Duplicate.add_duplicate(algo, hash, similarity, 'item', '', item.get_id(), date_ymonth)
                             nb_duplicates += 1
 
             # Save Hashs
-            Duplicate.save_object_hash(algo, curr_date_ymonth, self.algos[algo]['hash'], item.get_id())
+            segment_size = Duplicate.save_object_hash(algo, curr_date_ymonth, self.algos[algo]['hash'], item.get_id())
+            cache.add(curr_date_ymonth, self.algos[algo]['hash'], segment_size)
 
         if nb_duplicates:
             self.logger.info(f'Duplicates {nb_duplicates};{self.obj.get_global_id()}')
@@ -40,8 +40,9 @@ sys.path.append(os.environ['AIL_BIN'])
 from modules.abstract_module import AbstractModule
 from lib.ail_core import get_ail_uuid
 from lib.ConfigLoader import ConfigLoader
+from lib import content_cache
 from lib.data_retention_engine import update_obj_date
-from lib.objects.Items import Item
+from lib.objects.Items import Item, add_item_to_count_index
 
 # from lib import Statistics
 
@@ -66,6 +67,9 @@ class Global(AbstractModule):
         # Waiting time in seconds between to message processed
         self.pending_seconds = 0.5
 
+        # Number of messages consumed in one round-trip
+        self.batch_size = 100
+
         # Send module state to logs
         self.logger.info(f"Module {self.module_name} initialized")
 
@@ -115,8 +119,11 @@ class Global(AbstractModule):
 
                             with open(filename, 'wb') as f:
                                 f.write(decoded)
+                            # Share the decompressed content with the next modules
+                            content_cache.set_content(self.obj.get_global_id(), new_file_content, r_type='bytes', shared=True)
 
                             update_obj_date(self.obj.get_date(), 'item')
+                            add_item_to_count_index(self.obj.id)
 
                             self.add_message_to_queue(obj=self.obj, queue='Item')
                             self.processed_item += 1
@@ -5,7 +5,12 @@
 The Indexer Module
 ============================
 
-each file with a full-text indexer (Whoosh until now).
+each file with a full-text indexer (Whoosh or SQLite FTS5, see lib/index_whoosh.py).
+
+Documents are committed by batch: every batch_size documents or batch_time seconds.
+
+A full index is closed and a new one is created. If [Indexer] optimize is enabled, the segments
+of the closed index are merged in a background thread.
 
 """
 ##################################
@@ -15,9 +20,8 @@ import time
 import shutil
 import os
 import sys
-from os.path import join, getsize
-from whoosh.index import create_in, exists_in, open_dir
-from whoosh.fields import Schema, TEXT, ID
+import threading
+from os.path import join
 
 
 sys.path.append(os.environ['AIL_BIN'])
@@ -26,7 +30,7 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from modules.abstract_module import AbstractModule
 from lib.ConfigLoader import ConfigLoader
-from lib.objects.Items import Item
+from lib import index_whoosh
 
 
 class Indexer(AbstractModule):
@@ -50,13 +54,15 @@ class Indexer(AbstractModule):
         self.indexRegister_path = join(os.environ['AIL_HOME'], config_loader.get_config_str("Indexer", "register"))
         self.indexertype = config_loader.get_config_str("Indexer", "type")
         self.INDEX_SIZE_THRESHOLD = config_loader.get_config_int("Indexer", "index_max_size")
+        if config_loader.has_option("Indexer", "optimize"):
+            self.optimize = config_loader.get_config_boolean("Indexer", "optimize")
+        else:
+            self.optimize = False
 
         self.indexname = None
-        self.schema = None
-        self.ix = None
+        self.backend = None
 
-        if self.indexertype == "whoosh":
-            self.schema = Schema(title=TEXT(stored=True), path=ID(stored=True, unique=True), content=TEXT)
+        if self.indexertype in index_whoosh.INDEX_BACKENDS:
             if not os.path.exists(self.baseindexpath):
                 os.mkdir(self.baseindexpath)
 
@@ -85,13 +91,39 @@ class Indexer(AbstractModule):
                     self.indexname = time_now
 
                 self.indexpath = join(self.baseindexpath, str(self.indexname))
-                if not exists_in(self.indexpath):
-                    self.ix = create_in(self.indexpath, self.schema)
+                # Don't mix index types
+                index_type = index_whoosh.get_index_type(self.indexpath)
+                if index_type and index_type != self.indexertype:
+                    self.create_index()
                 else:
-                    self.ix = open_dir(self.indexpath)
+                    self.backend = index_whoosh.get_index_backend(self.indexpath, index_type=self.indexertype)
 
             self.last_refresh = time_now
 
+    def create_index(self):
+        timestamp = int(time.time())
+        self.logger.debug(f"Creating new index {timestamp}")
+        print(f"Creating new index {timestamp}")
+        if self.backend:
+            self.backend.close()
+            # Merge the segments of the full index: full rewrite of the index, off the indexing path
+            if self.optimize:
+                threading.Thread(target=index_whoosh.optimize_index, args=(self.indexpath,),
+                                 name=f'optimize_index_{self.indexname}').start()
+        self.indexpath = join(self.baseindexpath, str(timestamp))
+        self.indexname = str(timestamp)
+        # update all_index
+        with open(self.indexRegister_path, "a") as f:
+            f.write('\n'+str(timestamp))
+        # create new dir
+        os.mkdir(self.indexpath)
+        self.backend = index_whoosh.get_index_backend(self.indexpath, index_type=self.indexertype)
+
+    def computeNone(self):
+        # Commit the pending documents
+        if self.backend:
+            self.backend.commit()
+
     def compute(self, message):
         item = self.get_obj()
         item_id = item.get_id()
@@ -100,32 +132,16 @@ class Indexer(AbstractModule):
         docpath = item_id
 
         self.logger.debug(f"Indexing - {self.indexname}: {docpath}")
-        print(f"Indexing - {self.indexname}: {docpath}")
 
         try:
             # Avoid calculating the index's size at each message
             if time.time() - self.last_refresh > self.TIME_WAIT:
                 self.last_refresh = time.time()
                 if self.check_index_size() >= self.INDEX_SIZE_THRESHOLD*(1000*1000):
-                    timestamp = int(time.time())
-                    self.logger.debug(f"Creating new index {timestamp}")
-                    print(f"Creating new index {timestamp}")
-                    self.indexpath = join(self.baseindexpath, str(timestamp))
-                    self.indexname = str(timestamp)
-                    # update all_index
-                    with open(self.indexRegister_path, "a") as f:
-                        f.write('\n'+str(timestamp))
-                    # create new dir
-                    os.mkdir(self.indexpath)
-                    self.ix = create_in(self.indexpath, self.schema)
-
-            if self.indexertype == "whoosh":
-                indexwriter = self.ix.writer()
-                indexwriter.update_document(
-                    title=docpath,
-                    path=docpath,
-                    content=item_content)
-                indexwriter.commit()
+                    self.create_index()
+
+            if self.backend:
+                self.backend.add_document(docpath, item_content)
 
         except IOError:
             self.logger.debug(f"CRC Checksum Failed on: {item_id}")
@@ -136,11 +152,8 @@ class Indexer(AbstractModule):
         """
         return in bytes
         """
-        the_index_name = join(self.baseindexpath, self.indexname)
-        cur_sum = 0
-        for root, dirs, files in os.walk(the_index_name):
-            cur_sum += sum(getsize(join(root, name)) for name in files)
-        return cur_sum
+        self.backend.commit()
+        return self.backend.get_size()
 
     def move_index_into_old_index_folder(self):
         for cur_file in os.listdir(self.baseindexpath):
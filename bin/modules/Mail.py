@@ -14,10 +14,6 @@ It apply mail regexes on item content and warn if above a threshold.
 import os
 import re
 import sys
-import datetime
-
-import dns.resolver
-import dns.exception
 
 from pyfaup.faup import Faup
 
@@ -27,6 +23,7 @@ sys.path.append(os.environ['AIL_BIN'])
 ##################################
 from modules.abstract_module import AbstractModule
 from lib.ConfigLoader import ConfigLoader
+from lib.dns_resolver import DNSResolver
 # from lib import Statistics
 
 
@@ -39,9 +36,10 @@ class Mail(AbstractModule):
         super(Mail, self).__init__(queue=queue)
 
         config_loader = ConfigLoader()
-        self.r_cache = config_loader.get_redis_conn("Redis_Cache")
 
         self.dns_server = config_loader.get_config_str('Mail', 'dns')
+        # Async resolver, MX answers cached in Redis_Cache
+        self.resolver = DNSResolver([self.dns_server])
 
         self.faup = Faup()
 
@@ -52,12 +50,6 @@ class Mail(AbstractModule):
         self.email_regex = r"[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,6}"
         re.compile(self.email_regex)
 
-    def is_mxdomain_in_cache(self, mxdomain):
-        return self.r_cache.exists(f'mxdomain:{mxdomain}')
-
-    def save_mxdomain_in_cache(self, mxdomain):
-        self.r_cache.setex(f'mxdomain:{mxdomain}', datetime.timedelta(days=1), 1)
-
     def check_mx_record(self, set_mxdomains):
         """Check if emails MX domains are responding.
 
@@ -65,56 +57,11 @@ class Mail(AbstractModule):
         :return: (int) Number of address with a responding and valid MX domains
 
         """
-        resolver = dns.resolver.Resolver()
-        resolver.nameservers = [self.dns_server]
-        resolver.timeout = 5.0
-        resolver.lifetime = 2.0
-
+        answers = self.resolver.resolve_batch((mxdomain, 'MX') for mxdomain in set_mxdomains)
         valid_mxdomain = []
         for mxdomain in set_mxdomains:
-
-            # check if is in cache
-            # # TODO:
-            if self.is_mxdomain_in_cache(mxdomain):
+            if answers.get((mxdomain.lower(), 'MX')):
                 valid_mxdomain.append(mxdomain)
-            else:
-
-                # DNS resolution
-                try:
-                    answers = resolver.query(mxdomain, rdtype=dns.rdatatype.MX)
-                    if answers:
-                        self.save_mxdomain_in_cache(mxdomain)
-                        valid_mxdomain.append(mxdomain)
-                        # DEBUG
-                        # print('---')
-                        # print(answers.response)
-                        # print(answers.qname)
-                        # print(answers.rdtype)
-                        # print(answers.rdclass)
-                        # print(answers.nameserver)
-                        # print()
-
-                except dns.resolver.NoNameservers:
-                    self.logger.debug('NoNameserver, No non-broken nameservers are available to answer the query.')
-                    print('NoNameserver, No non-broken nameservers are available to answer the query.')
-                except dns.resolver.NoAnswer:
-                    self.logger.debug('NoAnswer, The response did not contain an answer to the question.')
-                    print('NoAnswer, The response did not contain an answer to the question.')
-                except dns.name.EmptyLabel:
-                    self.logger.debug('SyntaxError: EmptyLabel')
-                    print('SyntaxError: EmptyLabel')
-                except dns.resolver.NXDOMAIN:
-                    # save_mxdomain_in_cache(mxdomain)
-                    self.logger.debug('The query name does not exist.')
-                    print('The query name does not exist.')
-                except dns.name.LabelTooLong:
-                    self.logger.debug('The Label is too long')
-                    print('The Label is too long')
-                except dns.exception.Timeout:
-                    print('dns timeout')
-                    # save_mxdomain_in_cache(mxdomain)
-                except Exception as e:
-                    print(e)
         return valid_mxdomain
 
     def extract(self, obj, content, tag, check_mx_record=False):
@@ -54,6 +54,7 @@ class Mixer(AbstractModule):
         self.r_cache = config_loader.get_redis_conn("Redis_Mixer_Cache")
 
         self.pending_seconds = 1
+        self.batch_size = 100
 
         self.refresh_time = 30
         timestamp = int(time.time())
@@ -114,10 +115,10 @@ class Mixer(AbstractModule):
         if self.obj.type == 'item':
             # Remove ITEMS_FOLDER from item path (crawled item + submitted)
             # Limit basename length
-            obj_id = self.obj.id
+            obj_id = self.obj.get_global_id()
             self.obj.sanitize_id()
-            if self.obj.id != obj_id:
-                self.queue.rename_message_obj(self.obj.id, obj_id)
+            if self.obj.get_global_id() != obj_id:
+                self.queue.rename_message_obj(self.obj.get_global_id(), obj_id, m_hash=self.sha256_mess)
 
 
         # # TODO only work for item object
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+"""
+The Pipeline Module
+===================
+
+Fused pipeline: run a list of lightweight analyzer modules in sequence, in one process,
+on each object of the Item queue.
+
+The object is popped and resolved once, the processed object bookkeeping is done once
+and the content is read once (the analyzers share the in-process content cache,
+[Content_Cache] lru_max_size in core.cfg: a content larger than a quarter of the cache is read by each analyzer).
+The analyzers keep their compute() and their output queues.
+
+tools/benchmarks/benchmark_pipeline.py measures the queue and content overhead saved.
+
+Configured in configs/modules.cfg:
+    [Pipeline]
+    subscribe = Item
+    analyzers = modules.Tools,modules.Iban,trackers.Tracker_Term
+
+The fused analyzers must not subscribe to the Item queue anymore (comment their subscribe option),
+their section is still used for their output queues.
+
+"""
+
+##################################
+# Import External packages
+##################################
+import importlib
+import os
+import sys
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from modules.abstract_module import AbstractModule
+from lib import ail_queues
+from lib import content_cache
+from lib.ConfigLoader import ConfigLoader
+from lib.exceptions import ModuleQueueError
+
+
+def _get_module_class(module_path):
+    if ':' in module_path:
+        module_path, class_name = module_path.split(':', 1)
+    else:
+        class_name = module_path.rsplit('.', 1)[-1]
+    return getattr(importlib.import_module(module_path), class_name)
+
+
+class Pipeline(AbstractModule):
+    """
+    Pipeline module for AIL framework
+    """
+
+    def __init__(self):
+        super(Pipeline, self).__init__()
+
+        config_loader = ConfigLoader(config_file=ail_queues.MODULES_FILE)
+        if not config_loader.has_option(self.module_name, 'analyzers'):
+            raise ModuleQueueError(f'No analyzers defined for this module: {self.module_name}. Please add them in configs/module.cfg')
+        analyzers = config_loader.get_config_str(self.module_name, 'analyzers')
+
+        self.analyzers = []
+        for module_path in analyzers.split(','):
+            module_path = module_path.strip()
+            if module_path:
+                analyzer = _get_module_class(module_path)()
+                if config_loader.has_option(analyzer.module_name, 'subscribe'):
+                    self.logger.warning(f'{self.module_name}: {analyzer.module_name} is still subscribed to a queue, objects are analyzed twice')
+                self.analyzers.append(analyzer)
+
+        # The content is shared by the analyzers through the content cache
+        if content_cache.LRU_MAX_SIZE <= 0:
+            self.logger.warning(f'{self.module_name}: Content Cache disabled, the content is read by each analyzer')
+
+        self.pending_seconds = 1
+        self.batch_size = 50
+        self._batch_running = False
+
+        # Send module state to logs
+        self.logger.info(f'Module {self.module_name} initialized: {", ".join(a.module_name for a in self.analyzers)}')
+
+    def compute(self, message):
+        obj = self.get_obj()
+        if obj:
+            # Read the content once, next reads hit the content cache
+            obj.get_content()
+
+        for analyzer in self.analyzers:
+            analyzer.obj = obj
+            analyzer.sha256_mess = self.sha256_mess
+            analyzer._compute_message(message)
+            analyzer.obj = None
+            analyzer.sha256_mess = None
+
+    def computeNone(self):
+        for analyzer in self.analyzers:
+            analyzer.computeNone()
+
+    def _run_batch(self):
+        # Buffer the output messages of the analyzers
+        self._batch_running = True
+        for analyzer in self.analyzers:
+            analyzer._out_messages = []
+        try:
+            return super()._run_batch()
+        finally:
+            self._batch_running = False
+            for analyzer in self.analyzers:
+                analyzer._out_messages = None
+
+    def _send_out_messages(self):
+        super()._send_out_messages()
+        for analyzer in self.analyzers:
+            analyzer._send_out_messages()
+            # Intermediate flush, keep buffering until the end of the batch
+            if self._batch_running:
+                analyzer._out_messages = []
+
+
+if __name__ == '__main__':
+    module = Pipeline()
+    module.run()
@@ -20,6 +20,7 @@ sys.path.append(os.environ['AIL_BIN'])
 # Import Project packages
 ##################################
 from modules.abstract_module import AbstractModule
+from lib import Tag
 
 class Tags(AbstractModule):
     """
@@ -32,6 +33,11 @@ class Tags(AbstractModule):
         # Waiting time in seconds between to message processed
         self.pending_seconds = 10
 
+        # Number of messages consumed in one round-trip
+        self.batch_size = 100
+        # Objects tags of the current batch, written at the end of the batch
+        self.objs_tags = []
+
         # Send module state to logs
         self.logger.info(f'Module {self.module_name} initialized')
 
@@ -40,12 +46,23 @@ class Tags(AbstractModule):
         tag = message
 
         # Create a new tag
-        obj.add_tag(tag)
+        if self._out_messages is not None:  # batch
+            self.objs_tags.append((obj, tag))
+        else:
+            obj.add_tag(tag)
         print(f'{self.obj.get_global_id()}: Tagged {tag}')
 
         # Forward message to channel
         self.add_message_to_queue(message=tag, queue='Tag_feed')
 
+    def _send_out_messages(self):
+        # Tag the objects of the batch before forwarding the messages
+        if self.objs_tags:
+            objs_tags = self.objs_tags
+            self.objs_tags = []
+            Tag.add_objects_tags(objs_tags)
+        super()._send_out_messages()
+
 if __name__ == '__main__':
     module = Tags()
     module.run()
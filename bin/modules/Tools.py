@@ -6,6 +6,9 @@ Tools Module
 
 Search tools outpout
 
+The tools regexs are prefiltered with a single literal pass over the content,
+only the regexs of the tools with a required literal found in the content are executed.
+
 """
 
 import os
@@ -16,7 +19,7 @@ sys.path.append(os.environ['AIL_BIN'])
 # Import Project packages
 ##################################
 from modules.abstract_module import AbstractModule
-from lib.objects.Items import Item
+from lib.regex_helper import RegexPrefilter
 
 
 TOOLS = {
@@ -399,6 +402,7 @@ class Tools(AbstractModule):
         super(Tools, self).__init__(queue=queue)
 
         self.max_execution_time = 30
+        self.prefilter = RegexPrefilter({tool_name: TOOLS[tool_name]['regex'] for tool_name in TOOLS})
         # Waiting time in seconds between to message processed
         self.pending_seconds = 10
         # Send module state to logs
@@ -410,6 +414,8 @@ class Tools(AbstractModule):
     def extract(self, obj_id, content, tag):
         extracted = []
         tool_name = tag.rsplit('"', 2)[1][:-5]
+        if not self.prefilter.is_candidate(tool_name, content):
+            return extracted
         tools = self.regex_finditer(TOOLS[tool_name]['regex'], obj_id, content)
         for tool in tools:
             extracted.append([tool[0], tool[1], tool[2], f'tag:{tag}'])
@@ -419,7 +425,7 @@ class Tools(AbstractModule):
         item = self.get_obj()
         content = item.get_content()
 
-        for tool_name in TOOLS:
+        for tool_name in self.prefilter.get_candidates(content):
             tool = TOOLS[tool_name]
             match = self.regex_search(tool['regex'], item.id, content)
             if match:
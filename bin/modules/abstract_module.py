@@ -19,6 +19,7 @@ sys.path.append(os.environ['AIL_BIN'])
 # Import Project packages
 ##################################
 from lib import ail_logger
+from lib import ConfigLoader
 from lib.ail_queues import AILQueue
 from lib import regex_helper
 from lib.exceptions import ModuleQueueError, TimeoutException
@@ -60,9 +61,24 @@ class AbstractModule(ABC):
         # Waiting time in seconds between two processed messages
         self.pending_seconds = 10
 
+        # Block on the queue instead of sleeping, up to pending_seconds
+        # computeNone is still called when no message is received during pending_seconds
+        self.blocking = True
+
+        # Number of messages consumed in one round-trip, 1: no batch
+        self.batch_size = 1
+        # Messages to send at the end of the current batch
+        self._out_messages = None
+        # Max time in seconds before sending the output messages of the current batch
+        self.batch_flush_interval = 1
+
         # Debug Mode
         self.debug = False
 
+        # Interval in seconds between two saves of the Redis/Kvrocks connection pools metrics
+        self.pools_metrics_interval = 60
+        self._last_pools_metrics = 0
+
         if queue:
             self.queue.start()
 
@@ -71,9 +87,9 @@ class AbstractModule(ABC):
 
     def set_obj(self, new_obj):
         if self.obj:
-            old_id = self.obj.id
+            old_id = self.obj.get_global_id()
             self.obj = new_obj
-            self.queue.rename_message_obj(self.obj.id, old_id)
+            self.queue.rename_message_obj(self.obj.get_global_id(), old_id, m_hash=self.sha256_mess)
         else:
             self.obj = new_obj
 
@@ -83,7 +99,10 @@ class AbstractModule(ABC):
         Input message can change between modules
         ex: '<item id>'
         """
-        message = self.queue.get_message()
+        if self.blocking:
+            message = self.queue.get_message(timeout=self.pending_seconds)
+        else:
+            message = self.queue.get_message()
         if message:
             obj_global_id, sha256_mess, mess = message
             if obj_global_id:
@@ -97,6 +116,16 @@ class AbstractModule(ABC):
         self.obj = None
         return None
 
+    def get_messages(self):
+        """
+        Get up to batch_size messages from the Redis Queue (QueueIn)
+        :return: list of (obj_global_id, sha256_mess, message)
+        """
+        if self.blocking:
+            return self.queue.get_messages(self.batch_size, timeout=self.pending_seconds)
+        else:
+            return self.queue.get_messages(self.batch_size)
+
     # TODO ADD META OBJ ????
     def add_message_to_queue(self, obj=None, message='', queue=None):
         """
@@ -113,7 +142,10 @@ class AbstractModule(ABC):
             obj_global_id = self.obj.get_global_id()
         else:
             obj_global_id = '::'
-        self.queue.send_message(obj_global_id, message, queue)
+        if self._out_messages is not None:
+            self._out_messages.append((obj_global_id, message, queue))
+        else:
+            self.queue.send_message(obj_global_id, message, queue)
 
     def get_available_queues(self):
         return self.queue.get_out_queues()
@@ -127,6 +159,13 @@ class AbstractModule(ABC):
     def regex_finditer(self, regex, obj_id, content):
         return regex_helper.regex_finditer(self.r_cache_key, regex, obj_id, content, max_time=self.max_execution_time)
 
+    def regex_finditer_multi(self, regexs, obj_id, content):
+        """
+        regex finditer helper on a list of regexs (force timeout by regex)
+        :return: list of matches, one by regex
+        """
+        return regex_helper.regex_finditer_multi(self.r_cache_key, regexs, obj_id, content, max_time=self.max_execution_time)
+
     def regex_findall(self, regex, obj_id, content, r_set=False):
         """
         regex findall helper (force timeout)
@@ -149,6 +188,111 @@ class AbstractModule(ABC):
         return regex_helper.regex_phone_iter(self.r_cache_key, country_code, obj_id, content,
                                              max_time=self.max_execution_time)
 
+    def _compute_message(self, message):
+        try:
+            # Module processing with the message from the queue
+            self.compute(message)
+        except Exception as err:
+            if self.debug:
+                self.queue.error()
+                raise err
+
+            # LOG ERROR
+            trace = traceback.format_tb(err.__traceback__)
+            trace = ''.join(trace)
+            self.logger.critical(f"Error in module {self.module_name}: {__name__} : {err}")
+            if message:
+                self.logger.critical(f"Module {self.module_name} input message: {message}")
+            if self.obj:
+                self.logger.critical(f"{self.module_name} Obj: {self.obj.get_global_id()}")
+            self.logger.critical(trace)
+
+            if isinstance(err, ModuleQueueError):
+                self.queue.error()
+                raise err
+
+    def _run_message(self):
+        """
+        Process one message, return False if the queue is empty
+        """
+        # Get one message (ex:item id) from the Redis Queue (QueueIn)
+        message = self.get_message()
+
+        if message or self.obj:
+            self._compute_message(message)
+            # remove from set_module
+            ## check if item process == completed
+
+            if self.obj:
+                self.queue.end_message(self.obj.get_global_id(), self.sha256_mess)
+                self.obj = None
+                self.sha256_mess = None
+            return True
+        return False
+
+    def _run_batch(self):
+        """
+        Process up to batch_size messages, return False if the queue is empty.
+        Output messages and processed objects bookkeeping are sent at the end of the batch,
+        or every batch_flush_interval seconds.
+        The input messages are acknowledged once their output messages are sent
+        """
+        messages = self.get_messages()
+        if not messages:
+            return False
+
+        ended = []
+        nb_done = 0
+        last_flush = time.time()
+        self._out_messages = []
+        try:
+            for obj_global_id, sha256_mess, message in messages:
+                if obj_global_id:
+                    self.sha256_mess = sha256_mess
+                    self.obj = get_obj_from_global_id(obj_global_id)
+                else:
+                    self.sha256_mess = None
+                    self.obj = None
+
+                if message or self.obj:
+                    self._compute_message(message)
+                if self.obj:
+                    ended.append((self.obj.get_global_id(), self.sha256_mess))
+                self.obj = None
+                self.sha256_mess = None
+                nb_done += 1
+
+                if time.time() - last_flush > self.batch_flush_interval and nb_done < len(messages):
+                    self._flush_batch(ended, nb_done)
+                    ended = []
+                    nb_done = 0
+                    last_flush = time.time()
+                    self._out_messages = []
+        finally:
+            # If the batch is interrupted, the messages not processed stay in the processing list
+            self._flush_batch(ended, nb_done)
+        return True
+
+    def _flush_batch(self, ended, nb_done):
+        """
+        Send the output messages, end the processed objects and acknowledge the nb_done processed messages
+        """
+        # output messages need to be queued before ending the processed objects
+        self._send_out_messages()
+        if ended:
+            self.queue.end_messages(ended)
+        if nb_done:
+            self.queue.ack_messages(nb_done)
+
+    def _send_out_messages(self):
+        """
+        Send the output messages of the current batch
+        """
+        out_messages = self._out_messages
+        self._out_messages = None
+        if out_messages:
+            self.queue.send_messages(out_messages)
+
     def run(self):
         """
         Run Module endless process
@@ -156,41 +300,20 @@ class AbstractModule(ABC):
 
         # Endless loop processing messages from the input queue
         while self.proceed:
-            # Get one message (ex:item id) from the Redis Queue (QueueIn)
-            message = self.get_message()
-
-            if message or self.obj:
-                try:
-                    # Module processing with the message from the queue
-                    self.compute(message)
-                except Exception as err:
-                    if self.debug:
-                        self.queue.error()
-                        raise err
-
-                    # LOG ERROR
-                    trace = traceback.format_tb(err.__traceback__)
-                    trace = ''.join(trace)
-                    self.logger.critical(f"Error in module {self.module_name}: {__name__} : {err}")
-                    if message:
-                        self.logger.critical(f"Module {self.module_name} input message: {message}")
-                    if self.obj:
-                        self.logger.critical(f"{self.module_name} Obj: {self.obj.get_global_id()}")
-                    self.logger.critical(trace)
-
-                    if isinstance(err, ModuleQueueError):
-                        self.queue.error()
-                        raise err
-                # remove from set_module
-                ## check if item process == completed
-
-                if self.obj:
-                    self.queue.end_message(self.obj.get_global_id(), self.sha256_mess)
-                    self.obj = None
-                    self.sha256_mess = None
+            if time.time() - self._last_pools_metrics > self.pools_metrics_interval:
+                self._last_pools_metrics = time.time()
+                ConfigLoader.save_pools_metrics(self.module_name)
 
+            if self.batch_size > 1:
+                processed = self._run_batch()
             else:
+                processed = self._run_message()
+
+            if not processed:
                 self.computeNone()
+                # Already waited pending_seconds on the queue
+                if self.blocking:
+                    continue
                 # Wait before next process
                 self.logger.debug(f"{self.module_name}, waiting for new message, Idling {self.pending_seconds}s")
                 try:
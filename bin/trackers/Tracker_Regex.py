@@ -10,7 +10,6 @@ It processes every item coming from the global module and test the regex
 """
 import os
 import sys
-import time
 
 sys.path.append(os.environ['AIL_BIN'])
 ##################################
@@ -38,8 +37,7 @@ class Tracker_Regex(AbstractModule):
         self.max_execution_time = config_loader.get_config_int(self.module_name, "max_execution_time")
 
         # refresh Tracked Regex
-        self.tracked_regexs = Tracker.get_tracked_regexs()
-        self.last_refresh = time.time()
+        self.matcher = Tracker.RegexMatcher()
 
         self.obj = None
 
@@ -51,9 +49,7 @@ class Tracker_Regex(AbstractModule):
 
     def compute(self, message):
         # refresh Tracked regex
-        if self.last_refresh < Tracker.get_tracker_last_updated_by_type('regex'):
-            self.tracked_regexs = Tracker.get_tracked_regexs()
-            self.last_refresh = time.time()
+        if self.matcher.refresh():
             print('Tracked regex refreshed')
 
         obj = self.get_obj()
@@ -61,13 +57,18 @@ class Tracker_Regex(AbstractModule):
         obj_type = obj.get_type()
 
         # Object Filter
-        if obj_type not in self.tracked_regexs:
+        if not self.matcher.is_tracked_obj_type(obj_type):
             return None
 
         content = obj.get_content()
 
-        for dict_regex in self.tracked_regexs[obj_type]:
-            matches = self.regex_finditer(dict_regex['regex'], obj_id, content)
+        # literal prefilter
+        candidates = self.matcher.get_candidates(obj_type, content)
+        if not candidates:
+            return None
+
+        all_matches = self.regex_finditer_multi([dict_regex['regex'] for dict_regex in candidates], obj_id, content)
+        for dict_regex, matches in zip(candidates, all_matches):
             if matches:
                 self.new_tracker_found(dict_regex['tracked'], 'regex', obj, matches)
 
@@ -11,7 +11,6 @@ The Tracker_Term Module
 ##################################
 import os
 import sys
-import time
 import signal
 
 
@@ -52,11 +51,8 @@ class Tracker_Term(AbstractModule):
 
         self.max_execution_time = config_loader.get_config_int('Tracker_Term', "max_execution_time")
 
-        # loads tracked words
-        self.tracked_words = Tracker.get_tracked_words()
-        self.last_refresh_word = time.time()
-        self.tracked_sets = Tracker.get_tracked_sets()
-        self.last_refresh_set = time.time()
+        # loads tracked words and sets
+        self.matcher = Tracker.TermMatcher()
 
         # Exporter
         self.exporters = {'mail': MailExporterTracker(),
@@ -66,50 +62,35 @@ class Tracker_Term(AbstractModule):
 
     def compute(self, message):
         # refresh Tracked term
-        if self.last_refresh_word < Tracker.get_tracker_last_updated_by_type('word'):
-            self.tracked_words = Tracker.get_tracked_words()
-            self.last_refresh_word = time.time()
-            print('Tracked word refreshed')
-
-        if self.last_refresh_set < Tracker.get_tracker_last_updated_by_type('set'):
-            self.tracked_sets = Tracker.get_tracked_sets()
-            self.last_refresh_set = time.time()
-            print('Tracked set refreshed')
+        if self.matcher.refresh():
+            print('Tracked words/sets refreshed')
 
         obj = self.get_obj()
         obj_type = obj.get_type()
 
         # Object Filter
-        if obj_type not in self.tracked_words and obj_type not in self.tracked_sets:
+        if not self.matcher.is_tracked_obj_type(obj_type):
             return None
 
         content = obj.get_content()
 
         signal.alarm(self.max_execution_time)
 
-        dict_words_freq = None
+        words, sets = [], []
         try:
-            dict_words_freq = Tracker.get_text_word_frequency(content)
+            words, sets = self.matcher.match(obj_type, content)
         except TimeoutException:
             self.logger.warning(f"{self.obj.get_global_id()} processing timeout")
         else:
             signal.alarm(0)
 
-        if dict_words_freq:
-
-            # check solo words
-            for word in self.tracked_words[obj_type]:
-                if word in dict_words_freq:
-                    self.new_tracker_found(word, 'word', obj)
-
-            # check words set
-            for tracked_set in self.tracked_sets[obj_type]:
-                nb_uniq_word = 0
-                for word in tracked_set['words']:
-                    if word in dict_words_freq:
-                        nb_uniq_word += 1
-                if nb_uniq_word >= tracked_set['nb']:
-                    self.new_tracker_found(tracked_set['tracked'], 'set', obj)
+        # check solo words
+        for word in words:
+            self.new_tracker_found(word, 'word', obj)
+
+        # check words set
+        for tracked_set in sets:
+            self.new_tracker_found(tracked_set, 'set', obj)
 
     def new_tracker_found(self, tracker_name, tracker_type, obj):  # TODO FILTER
         obj_id = obj.get_id()
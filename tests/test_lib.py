@@ -0,0 +1,1024 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import datetime
+import json
+import os
+import re
+import sys
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+
+from unittest.mock import patch
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from core import ail_2_ail_transport
+from core import Module_Runner
+from lib import ConfigLoader
+from lib import correlations_engine
+from lib import crawlers
+from lib import dns_resolver
+from lib import Duplicate
+from lib import index_whoosh
+from lib import regex_helper
+from lib import retro_hunt_engine
+from lib import Tag
+from lib import Tracker
+from lib.objects import Items
+from modules import Pipeline
+from modules import Tools
+from modules.abstract_module import AbstractModule
+
+
+class FakeWebsocket:
+    """
+    Websocket of the peer: records the sent messages and replays the received ones
+    """
+
+    def __init__(self, compression, messages=None, ack=True, closed=False):
+        self.compression = compression
+        self.sent = []
+        self.messages = asyncio.Queue()
+        self.ack = ack
+        # the peer closes the connection once all the messages are received
+        self.closed = closed
+        self.close_code = None
+        for message in messages or []:
+            self.messages.put_nowait(message)
+
+    async def send(self, message):
+        self.sent.append(message)
+        if self.ack and isinstance(message, bytes):
+            seq, _ = ail_2_ail_transport.unpack_frame(self.compression, message)
+            self.messages.put_nowait(json.dumps({'ack': seq}))
+
+    async def close(self, code=1000, reason=''):
+        self.close_code = code
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.messages.empty() and self.closed:
+            raise StopAsyncIteration
+        return await self.messages.get()
+
+
+class TestAIL2AILTransport(unittest.TestCase):
+
+    def test_subprotocols(self):
+        for subprotocol in ail_2_ail_transport.get_subprotocols():
+            self.assertIn(ail_2_ail_transport.get_subprotocol_compression(subprotocol),
+                          ail_2_ail_transport.get_compressions())
+        self.assertIsNone(ail_2_ail_transport.get_subprotocol_compression(None))
+        self.assertIsNone(ail_2_ail_transport.get_subprotocol_compression('ail-sync-batch.lz4'))
+
+    def test_frame(self):
+        ail_streams = [{'format': 'ail', 'version': 1, 'meta': {'ail:uuid': 'test'}, 'payload': {'raw': 'a' * 1000}}]
+        for compression in ail_2_ail_transport.get_compressions():
+            frame = ail_2_ail_transport.pack_frame(compression, 3, ail_streams)
+            self.assertLess(len(frame), 1000)
+            self.assertEqual(ail_2_ail_transport.unpack_frame(compression, frame), (3, ail_streams))
+
+    def test_frame_size(self):
+        for compression in ail_2_ail_transport.get_compressions():
+            data = ail_2_ail_transport.compress(compression, b'0' * 1000)
+            self.assertEqual(ail_2_ail_transport.decompress(compression, data, max_size=1000), b'0' * 1000)
+            # decompression bomb
+            data = ail_2_ail_transport.compress(compression, b'\0' * 10 * 1024 * 1024)
+            self.assertLess(len(data), 1024 * 1024)
+            with self.assertRaises(ail_2_ail_transport.FrameSizeError):
+                ail_2_ail_transport.decompress(compression, data, max_size=1024 * 1024)
+
+    def test_receive_batches_too_big(self):
+        compression = ail_2_ail_transport.get_compressions()[0]
+        frame = ail_2_ail_transport.compress(compression, b'\0' * (ail_2_ail_transport.MAX_FRAME_SIZE + 1))
+        websocket = FakeWebsocket(compression, messages=[frame], closed=True)
+        received = []
+        with self.assertRaises(ail_2_ail_transport.FrameSizeError):
+            asyncio.run(ail_2_ail_transport.receive_batches(websocket, compression, received.extend))
+        self.assertEqual(websocket.close_code, ail_2_ail_transport.CLOSE_CODE_TOO_BIG)
+        self.assertFalse(received)
+
+    def test_receive_batches(self):
+        compression = ail_2_ail_transport.get_compressions()[0]
+        frames = [ail_2_ail_transport.pack_frame(compression, seq, [{'id': seq}]) for seq in range(1, 4)]
+        websocket = FakeWebsocket(compression, messages=frames, closed=True)
+        received = []
+        asyncio.run(ail_2_ail_transport.receive_batches(websocket, compression, received.extend))
+        self.assertEqual(received, [{'id': 1}, {'id': 2}, {'id': 3}])
+        self.assertEqual([json.loads(ack)['ack'] for ack in websocket.sent], [1, 2, 3])
+
+    def test_batch_sender(self):
+        compression = ail_2_ail_transport.get_compressions()[0]
+
+        async def send(websocket, batches):
+            sender = ail_2_ail_transport.BatchSender(websocket, compression, window=2,
+                                                     create_ail_stream=lambda obj: {'id': obj})
+            try:
+                for objs in batches:
+                    await sender.send(objs)
+                await sender.flush()
+            except ConnectionError:
+                pass
+            finally:
+                sender.close()
+            return sender
+
+        batches = [[(i, 'queue_uuid')] for i in range(5)]
+        # acknowledged frames
+        websocket = FakeWebsocket(compression)
+        sender = asyncio.run(send(websocket, batches))
+        self.assertEqual(len(websocket.sent), 5)
+        self.assertFalse(sender.get_unacked())
+
+        # receiver closed without acknowledging: the window is full, the objects are returned
+        websocket = FakeWebsocket(compression, ack=False, closed=True)
+        sender = asyncio.run(send(websocket, batches))
+        self.assertEqual(len(websocket.sent), 2)
+        self.assertEqual(sender.get_unacked(), [(0, 'queue_uuid'), (1, 'queue_uuid'), (2, 'queue_uuid')])
+
+
+class TestConfigLoader(unittest.TestCase):
+
+    def test_pools_metrics(self):
+        r_cache = ConfigLoader.ConfigLoader().get_redis_conn('Redis_Cache')
+        r_cache2 = ConfigLoader.ConfigLoader().get_redis_conn('Redis_Cache')
+        self.assertIs(r_cache.connection_pool, r_cache2.connection_pool)
+        r_cache.ping()
+        ConfigLoader.save_pools_metrics('test_lib')
+        process_name = f'test_lib:{os.getpid()}'
+        all_metrics = ConfigLoader.get_all_processes_pools_metrics()
+        self.assertIn(process_name, all_metrics)
+        servers = {metrics['server']: metrics for metrics in all_metrics[process_name]}
+        kwargs = r_cache.connection_pool.connection_kwargs
+        metrics = servers[f'{kwargs["host"]}:{kwargs["port"]}/{kwargs["db"]}']
+        self.assertIn('Redis_Cache', metrics['names'])
+        self.assertGreater(metrics['round_trips'], 0)
+        r_cache.zrem('redis:pools:metrics', process_name)
+        r_cache.delete(f'redis:pools:metrics:{process_name}')
+
+    def test_batch(self):
+        r_cache = ConfigLoader.ConfigLoader().get_redis_conn('Redis_Cache')
+        key = f'test_lib:batch:{uuid.uuid4()}'
+        try:
+            with ConfigLoader.batch(r_cache) as pipe:
+                pipe.sadd(key, 'a')
+                # Nested batch, same pipeline
+                with ConfigLoader.batch(r_cache) as pipe2:
+                    self.assertIs(pipe2, pipe)
+                    pipe2.sadd(key, 'b')
+                self.assertFalse(r_cache.exists(key))
+            self.assertEqual(r_cache.smembers(key), {'a', 'b'})
+
+            # Nothing sent if the block raises
+            with self.assertRaises(ValueError):
+                with ConfigLoader.batch(r_cache) as pipe:
+                    pipe.sadd(key, 'c')
+                    with ConfigLoader.batch(r_cache) as pipe2:
+                        pipe2.sadd(key, 'd')
+                        raise ValueError()
+            self.assertEqual(r_cache.smembers(key), {'a', 'b'})
+
+            # New pipeline after a batch
+            with ConfigLoader.batch(r_cache, transaction=True) as pipe3:
+                self.assertIsNot(pipe3, pipe)
+                pipe3.sadd(key, 'e')
+            self.assertEqual(r_cache.smembers(key), {'a', 'b', 'e'})
+        finally:
+            r_cache.delete(key)
+
+
+class TestCorrelationsEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.domain = f'{uuid.uuid4()}.onion'
+        self.items = [f'crawled/2024/01/01/{self.domain}{uuid.uuid4()}' for _ in range(3)]
+
+    def tearDown(self):
+        correlations_engine.delete_obj_correlations('domain', '', self.domain)
+        for item_id in self.items:
+            correlations_engine.delete_obj_correlations('item', '', item_id)
+
+    def test_add_obj_correlations(self):
+        correlations_engine.add_obj_correlations([('domain', '', self.domain, 'item', '', item_id) for item_id in self.items])
+        self.assertEqual(correlations_engine.get_nb_correlations('domain', None, self.domain, filter_types=['item']), {'item': 3})
+        self.assertEqual(correlations_engine.get_correlations('item', None, self.items[0], filter_types=['domain']),
+                         {'domain': {f':{self.domain}'}})
+
+        # existing correlations, duplicates
+        correlations_engine.add_obj_correlations([('domain', None, self.domain, 'item', None, self.items[0]),
+                                                  ('item', None, self.items[0], 'domain', None, self.domain)])
+        self.assertEqual(correlations_engine.get_nb_correlation_by_correl_type('domain', '', self.domain, 'item'), 3)
+
+        # the counter exists: updated
+        correlations_engine.add_obj_correlation('domain', '', self.domain, 'item', '', self.items[0] + '0')
+        self.assertEqual(correlations_engine.get_nb_correlation_by_correl_type('domain', '', self.domain, 'item'), 4)
+        correlations_engine.delete_obj_correlation('domain', '', self.domain, 'item', '', self.items[0] + '0')
+        correlations_engine.delete_obj_correlation('domain', '', self.domain, 'item', '', self.items[0] + '0')
+        self.assertEqual(correlations_engine.get_nb_correlation_by_correl_type('domain', '', self.domain, 'item'), 3)
+        self.assertFalse(correlations_engine.is_obj_correlated('item', '', self.items[0] + '0', 'domain', '', self.domain))
+
+    def test_correlations_graph(self):
+        correlations_engine.add_obj_correlations([('domain', '', self.domain, 'item', '', item_id) for item_id in self.items])
+        obj_str_id, nodes, links, meta = correlations_engine.get_correlations_graph_nodes_links('domain', '', self.domain, level=2)
+        self.assertEqual(obj_str_id, f'domain::{self.domain}')
+        self.assertEqual(nodes, {obj_str_id} | {f'item::{item_id}' for item_id in self.items})
+        self.assertEqual(len(links), 3)
+        self.assertTrue(meta['complete'])
+
+        # node budget
+        obj_str_id, nodes, links, meta = correlations_engine.get_correlations_graph_nodes_links('domain', '', self.domain, max_nodes=1)
+        self.assertEqual(len(nodes), 2)
+        self.assertFalse(meta['complete'])
+
+    def test_no_correlation_types(self):
+        self.assertEqual(correlations_engine.get_nb_correlations('unknown', '', self.domain), {})
+        obj_str_id, nodes, links, meta = correlations_engine.get_correlations_graph_nodes_links('unknown', '', self.domain)
+        self.assertEqual(nodes, {obj_str_id})
+        self.assertFalse(links)
+
+
+class TestTermMatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.matcher = Tracker.TermMatcher(refresh=False)
+        self.matcher.load(words={'item': ['password', 'leak', 'e-mail', 'pass'], 'message': ['leak']},
+                          sets={'item': [{'words': ['dump', 'credentials', 'combo'], 'nb': 2, 'tracked': 'dump,credentials,combo;2'}]})
+
+    def test_match(self):
+        content = 'New LEAK: Password dump (credentials) ... e-mail:passwords'
+        words, sets = self.matcher.match('item', content)
+        self.assertEqual(sorted(words), ['leak', 'password'])
+        self.assertEqual(sets, ['dump,credentials,combo;2'])
+        self.assertEqual(self.matcher.match('message', content), (['leak'], []))
+        self.assertEqual(self.matcher.match('domain', content), ([], []))
+        self.assertFalse(self.matcher.is_tracked_obj_type('domain'))
+
+    def test_tokens(self):
+        # Same tokens as the tokenizer
+        content = 'leak_password leakpassword [leak]\npassword/pass pass-word e-mail dump'
+        tokens = Tracker.get_text_word_frequency(content)
+        tracked = {'password', 'leak', 'e-mail', 'pass', 'dump', 'credentials', 'combo'}
+        self.assertEqual(self.matcher.get_tokens('item', content), tracked.intersection(tokens))
+
+
+class TestYaraRulesCache(unittest.TestCase):
+
+    def setUp(self):
+        self.rules_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.rules_dir.name, 'common'))
+        self.rule = os.path.join(self.rules_dir.name, 'rule.yar')
+        with open(self.rule, 'w') as f:
+            f.write('include "common/strings.yar"\nrule test_rule { condition: test_string }\n')
+        self.set_include('test1')
+
+    def tearDown(self):
+        self.rules_dir.cleanup()
+
+    def set_include(self, string):
+        with open(os.path.join(self.rules_dir.name, 'common', 'strings.yar'), 'w') as f:
+            f.write(f'rule test_string {{ strings: $s = "{string}" condition: $s }}\n')
+
+    def test_included_rules(self):
+        filepaths = {'test': self.rule}
+        key = Tracker.get_yara_rules_key(filepaths)
+        self.assertEqual(Tracker.get_yara_rules_key(filepaths), key)
+        self.assertTrue(Tracker.compile_yara_rules(filepaths).match(data=b'--test1--'))
+
+        # Modified included file: new rules
+        self.set_include('test2')
+        self.assertNotEqual(Tracker.get_yara_rules_key(filepaths), key)
+        rules = Tracker.compile_yara_rules(filepaths)
+        self.assertFalse(rules.match(data=b'--test1--'))
+        self.assertTrue(rules.match(data=b'--test2--'))
+
+
+class TestItemsCountIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.items_dir = tempfile.TemporaryDirectory()
+        self.source = f'test_{uuid.uuid4()}'
+        os.makedirs(os.path.join(self.items_dir.name, self.source, '2024', '01', '01'))
+        self.patch = patch.object(Items, 'ITEMS_FOLDER', self.items_dir.name)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.items_dir.cleanup()
+        Items.r_object.delete(f'items:nb:{self.source}')
+
+    def save_item(self, name):
+        item_id = f'{self.source}/2024/01/01/{name}.gz'
+        with open(os.path.join(self.items_dir.name, item_id), 'wb') as f:
+            f.write(b'')
+        Items.add_item_to_count_index(item_id)
+        return item_id
+
+    def get_nb_items(self):
+        return Items.get_nb_items_objects({'sources': [self.source], 'date_from': '20240101', 'date_to': '20240101'})
+
+    def test_count_index(self):
+        # Items saved before the index
+        for i in range(3):
+            item_id = f'{self.source}/2024/01/01/{i}.gz'
+            with open(os.path.join(self.items_dir.name, item_id), 'wb') as f:
+                f.write(b'')
+        item_id = self.save_item('a')
+        self.assertEqual(Items.r_object.hget(f'items:nb:{self.source}', '20240101'), '4')
+        self.save_item('b')
+        self.assertEqual(self.get_nb_items(), 5)
+
+        Items.remove_item_from_count_index(item_id)
+        self.assertEqual(self.get_nb_items(), 4)
+
+        # Deleted index: counted again
+        Items.r_object.delete(f'items:nb:{self.source}')
+        Items.remove_item_from_count_index(item_id)
+        self.assertFalse(Items.r_object.exists(f'items:nb:{self.source}'))
+        self.save_item('c')
+        self.assertEqual(Items.r_object.hget(f'items:nb:{self.source}', '20240101'), '6')
+
+
+class StubDNSServer(threading.Thread):
+    """
+    Local UDP DNS server: A records of RECORDS, NXDOMAIN for the other names, no response for slow.test
+    """
+    RECORDS = {'example.test.': '10.0.0.1', 'example2.test.': '10.0.0.2'}
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.queries = []
+
+    def run(self):
+        while True:
+            try:
+                wire, addr = self.sock.recvfrom(4096)
+            except OSError:  # closed
+                break
+            query = dns.message.from_wire(wire)
+            question = query.question[0]
+            name = question.name.to_text().lower()
+            self.queries.append((name, dns.rdatatype.to_text(question.rdtype)))
+            if name == 'slow.test.':
+                continue
+            response = dns.message.make_response(query)
+            if name not in self.RECORDS:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            elif question.rdtype == dns.rdatatype.A:
+                response.answer.append(dns.rrset.from_text(question.name, 300, 'IN', 'A', self.RECORDS[name]))
+            self.sock.sendto(response.to_wire(), addr)
+
+    def close(self):
+        self.sock.close()
+
+
+class TestDNSResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubDNSServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.close()
+
+    def get_resolver(self, cache=False):
+        return dns_resolver.DNSResolver(['127.0.0.1'], port=self.server.port, timeout=0.5, cache=cache)
+
+    def test_resolve_batch(self):
+        resolver = self.get_resolver()
+        try:
+            answers = resolver.resolve_batch([('example.test', 'A'), ('EXAMPLE.test', 'A'), ('example2.test', 'A'),
+                                              ('missing.test', 'A'), ('example.test', 'MX'), ('slow.test', 'A')])
+        finally:
+            resolver.close()
+        self.assertEqual(answers[('example.test', 'A')], [['300', 'IN', 'A', '10.0.0.1']])
+        self.assertEqual(answers[('example2.test', 'A')], [['300', 'IN', 'A', '10.0.0.2']])
+        # negative answers
+        self.assertEqual(answers[('missing.test', 'A')], [])
+        self.assertEqual(answers[('example.test', 'MX')], [])
+        # error
+        self.assertIsNone(answers[('slow.test', 'A')])
+        # deduplicated queries
+        self.assertEqual(self.server.queries.count(('example.test.', 'A')), 1)
+
+    def test_cache(self):
+        queries = [(f'{uuid.uuid4()}.test', 'A'), ('example.test', 'A')]
+        resolver = self.get_resolver(cache=True)
+        try:
+            resolver.cache_answers({queries[0]: []})
+            r_cache = dns_resolver.r_cache
+            r_cache.delete(resolver._get_cache_key(queries[1]))
+            answers = resolver.resolve_batch(queries)
+            self.assertEqual(answers, {queries[0]: [], queries[1]: [['300', 'IN', 'A', '10.0.0.1']]})
+            self.assertEqual(self.server.queries, [('example.test.', 'A')])
+            # cached answer, TTL of the record
+            self.assertEqual(resolver.resolve_batch(queries[1:]), {queries[1]: [['300', 'IN', 'A', '10.0.0.1']]})
+            self.assertEqual(len(self.server.queries), 1)
+            self.assertLessEqual(r_cache.ttl(resolver._get_cache_key(queries[1])), 300)
+        finally:
+            resolver.close()
+            for query in queries:
+                dns_resolver.r_cache.delete(resolver._get_cache_key(query))
+
+    def test_passive_dns_records(self):
+        records = dns_resolver.get_passive_dns_records('example.test', [['300', 'IN', 'A', '10.0.0.1']], '127.0.0.1')
+        self.assertEqual(len(records), 1)
+        self.assertTrue(records[0].endswith('||127.0.0.1||127.0.0.1||IN||example.test||A||10.0.0.1||300||1\n'))
+
+
+class TestRegexLiterals(unittest.TestCase):
+
+    def test_literals(self):
+        self.assertEqual(regex_helper.get_regex_literals('password'), {'password'})
+        self.assertEqual(regex_helper.get_regex_literals('foo|bar'), {'foo', 'bar'})
+        self.assertEqual(regex_helper.get_regex_literals(r'(?:secret|token)_[0-9a-f]{32}'), {'secret', 'token'})
+        self.assertEqual(regex_helper.get_regex_literals(r'[a-z]+@gmail\.com'), {'@gmail.com'})
+        self.assertEqual(regex_helper.get_regex_literals(r'(foo|ba)xyz'), {'xyz'})
+
+    def test_casefold(self):
+        self.assertEqual(regex_helper.get_regex_literals(r'(?i)PassWord\d+'), {'password'})
+        self.assertEqual(regex_helper.get_regex_literals(re.compile(r'LEAK\d+', re.IGNORECASE)), {'leak'})
+
+    def test_no_literals(self):
+        self.assertIsNone(regex_helper.get_regex_literals('.*'))
+        self.assertIsNone(regex_helper.get_regex_literals('a|bcd'))
+        self.assertIsNone(regex_helper.get_regex_literals('abc?de'))
+        self.assertIsNone(regex_helper.get_regex_literals('A(BC)*D'))
+        self.assertIsNone(regex_helper.get_regex_literals(b'bytes'))
+        self.assertIsNone(regex_helper.get_regex_literals('invalid('))
+
+    def test_required(self):
+        # A match contains at least one literal
+        contents = ['api_key = 123', 'APIKEY=abc', 'token_' + 'a' * 32, 'x@gmail.com', 'xyzbaxyz', 'foo-bar']
+        for regex in [r'api[_-]?key\s*=', r'(?:secret|token)_[0-9a-f]{32}', r'[a-z]+@gmail\.com', r'(foo|ba)xyz', 'foo|bar']:
+            literals = regex_helper.get_regex_literals(regex)
+            for content in contents:
+                if re.search(regex, content, re.IGNORECASE):
+                    self.assertTrue(any(literal in content.casefold() for literal in literals), (regex, content))
+
+
+class TestRegexPrefilter(unittest.TestCase):
+
+    def setUp(self):
+        self.prefilter = regex_helper.RegexPrefilter({'leak': r'leak\d+', 'digits': r'[0-9]+',
+                                                      'token': r'(?:secret|token)_[0-9a-f]{32}'})
+
+    def test_candidates(self):
+        self.assertEqual(len(self.prefilter), 3)
+        self.assertEqual(self.prefilter.always, ['digits'])
+        self.assertEqual(self.prefilter.get_candidates('nothing to see'), ['digits'])
+        self.assertEqual(sorted(self.prefilter.get_candidates('New LEAK42')), ['digits', 'leak'])
+        self.assertEqual(sorted(self.prefilter.get_candidates('Token_ and leak')), ['digits', 'leak', 'token'])
+
+    def test_is_candidate(self):
+        self.assertTrue(self.prefilter.is_candidate('digits', 'nothing to see'))
+        self.assertTrue(self.prefilter.is_candidate('token', 'SECRET_'))
+        self.assertFalse(self.prefilter.is_candidate('token', 'leak42'))
+        self.assertFalse(self.prefilter.is_candidate('leak', 'nothing to see'))
+
+    def test_regex_matcher(self):
+        matcher = Tracker.RegexMatcher(refresh=False)
+        matcher.load({'item': [{'regex': re.compile(r'leak\d+'), 'tracked': r'leak\d+'},
+                               {'regex': re.compile(r'[0-9]+'), 'tracked': r'[0-9]+'}],
+                      'message': []})
+        self.assertTrue(matcher.is_tracked_obj_type('item'))
+        self.assertFalse(matcher.is_tracked_obj_type('message'))
+        self.assertEqual([r['tracked'] for r in matcher.get_candidates('item', 'no match')], [r'[0-9]+'])
+        self.assertEqual(sorted(r['tracked'] for r in matcher.get_candidates('item', 'LEAK1')), [r'[0-9]+', r'leak\d+'])
+        self.assertEqual(matcher.get_candidates('domain', 'leak1'), [])
+
+    def test_tools(self):
+        # A tool output is always a candidate
+        prefilter = regex_helper.RegexPrefilter({tool_name: Tools.TOOLS[tool_name]['regex'] for tool_name in Tools.TOOLS})
+        self.assertFalse(set(prefilter.get_candidates('a clean item content')).difference(prefilter.always))
+        content = 'sqlmap identified the following injection point(s)'
+        self.assertIn('sqlmap', prefilter.get_candidates(content))
+        self.assertTrue(prefilter.is_candidate('sqlmap', content))
+        self.assertFalse(prefilter.is_candidate('inurlbr', content))
+
+
+class TestObjectsTags(unittest.TestCase):
+
+    def setUp(self):
+        self.tag = f'test:batch="{uuid.uuid4()}"'
+        self.domain = f'{uuid.uuid4().hex[:16]}.onion'
+        self.items = [Items.Item(f'submitted/2026/10/19/{uuid.uuid4()}.gz'),
+                      Items.Item(f'submitted/2026/10/17/{uuid.uuid4()}.gz'),
+                      Items.Item(f'crawled/2026/10/18/{self.domain}{uuid.uuid4()}')]
+        self.today = datetime.date.today().strftime('%Y%m%d')
+
+    def tearDown(self):
+        r_tags = Tag.r_tags
+        objs_ids = {item.id for item in self.items}
+        objs_ids.add(self.domain)
+        for item in self.items:
+            r_tags.delete(f'tag:item::{item.id}', f'item::{self.tag}:{item.get_date()}')
+        for obj in r_tags.lrange('dashboard:tags', 0, -1):
+            if obj.split(':', 3)[-1] in objs_ids:
+                r_tags.lrem('dashboard:tags', 0, obj)
+        r_tags.delete(f'tag:domain::{self.domain}', f'domain::{self.tag}', f'tag_metadata:{self.tag}')
+        for key in ('list_tags', 'list_tags:item', 'list_tags:item:', 'list_tags:domain', 'list_tags:domain:'):
+            r_tags.srem(key, self.tag)
+        r_tags.hdel(f'daily_tags:{self.today}', self.tag)
+
+    def test_add_objects_tags(self):
+        # Duplicates are tagged once
+        Tag.add_objects_tags([(item, self.tag) for item in self.items] + [(self.items[0], self.tag)])
+        for item in self.items:
+            self.assertEqual(Tag.get_object_tags('item', item.id), {self.tag})
+            self.assertIn(item.id, Tag.r_tags.smembers(f'item::{self.tag}:{item.get_date()}'))
+        # Crawled item domain
+        self.assertEqual(Tag.get_object_tags('domain', self.domain), {self.tag})
+        self.assertEqual(Tag.r_tags.smembers(f'domain::{self.tag}'), {self.domain})
+        for key in ('list_tags', 'list_tags:item', 'list_tags:item:', 'list_tags:domain', 'list_tags:domain:'):
+            self.assertTrue(Tag.r_tags.sismember(key, self.tag))
+        # First/last seen reduced over the batch
+        self.assertEqual(Tag.r_tags.hmget(f'tag_metadata:{self.tag}', 'first_seen', 'last_seen'), ['20261017', '20261019'])
+        self.assertEqual(Tag.r_tags.hget(f'daily_tags:{self.today}', self.tag), '4')
+        dashboard = {obj.split(':', 3)[-1] for obj in Tag.r_tags.lrange('dashboard:tags', 0, -1)}
+        self.assertTrue({item.id for item in self.items}.issubset(dashboard))
+
+        # Already tagged
+        Tag.add_objects_tags([(item, self.tag) for item in self.items])
+        self.assertEqual(Tag.r_tags.hget(f'daily_tags:{self.today}', self.tag), '4')
+
+    def test_add_object_tag(self):
+        Tag.add_object_tag(self.tag, 'item', self.items[1].id)
+        Tag.add_objects_tags([(self.items[0], self.tag)])
+        self.assertEqual(Tag.get_object_tags('item', self.items[1].id), {self.tag})
+        self.assertEqual(Tag.r_tags.hmget(f'tag_metadata:{self.tag}', 'first_seen', 'last_seen'), ['20261017', '20261019'])
+        self.assertEqual(Tag.r_tags.hget(f'daily_tags:{self.today}', self.tag), '2')
+
+
+class TestCrawlerTask(unittest.TestCase):
+
+    def setUp(self):
+        self.task = crawlers.CrawlerTask(str(uuid.uuid4()))
+        crawlers.r_crawler.hset(f'crawler:task:{self.task.uuid}',
+                                mapping={'url': 'http://test.onion/', 'domain': 'test.onion', 'depth': 2, 'har': 1,
+                                         'screenshot': 0, 'queue': 'onion', 'parent': 'manual', 'proxy': 'force_tor'})
+
+    def tearDown(self):
+        crawlers.r_crawler.delete(f'crawler:task:{self.task.uuid}')
+
+    def test_load(self):
+        fields = self.task.load()
+        self.assertEqual(fields['url'], 'http://test.onion/')
+        # The getters read the loaded fields
+        crawlers.r_crawler.hset(f'crawler:task:{self.task.uuid}', 'depth', 5)
+        self.assertEqual(self.task.get_url(), 'http://test.onion/')
+        self.assertEqual(self.task.get_domain(), 'test.onion')
+        self.assertEqual(self.task.get_depth(), 2)
+        self.assertTrue(self.task.get_har())
+        self.assertFalse(self.task.get_screenshot())
+        self.assertEqual(self.task.get_queue(), 'onion')
+        self.assertEqual(self.task.get_proxy(), 'force_tor')
+        self.assertEqual(self.task.get_user_agent(), crawlers.get_default_user_agent())
+        self.assertIsNone(self.task.get_cookiejar())
+        self.assertIsNone(self.task.get_capture())
+        # The set fields are updated in the loaded fields and the db
+        self.task._set_field('capture', 'capture_uuid')
+        self.assertEqual(self.task.get_capture(), 'capture_uuid')
+        self.assertEqual(crawlers.r_crawler.hget(f'crawler:task:{self.task.uuid}', 'capture'), 'capture_uuid')
+        # Reload
+        self.task.load()
+        self.assertEqual(self.task.get_depth(), 5)
+
+    def test_not_loaded(self):
+        self.assertEqual(self.task.get_depth(), 2)
+        crawlers.r_crawler.hset(f'crawler:task:{self.task.uuid}', 'depth', 5)
+        self.assertEqual(self.task.get_depth(), 5)
+
+    def test_load_deleted(self):
+        self.tearDown()
+        self.assertEqual(self.task.load(), {})
+        self.assertIsNone(self.task.get_url())
+        self.assertEqual(self.task.get_depth(), 1)
+
+
+class StubLacus:
+    """
+    Lacus client stub, the calls are delayed
+    """
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def _call(self, capture_uuid):
+        with self.lock:
+            self.calls.append(capture_uuid)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            time.sleep(self.delays.get(capture_uuid, 0))
+            if capture_uuid.startswith('error'):
+                raise ConnectionError(capture_uuid)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def get_capture_status(self, capture_uuid):
+        self._call(capture_uuid)
+        return 1
+
+    def enqueue(self, url):
+        self._call(url)
+        return f'capture_{url}'
+
+
+class TestLacusCaptureManager(unittest.TestCase):
+
+    def setUp(self):
+        self.lacus = StubLacus({'slow': 0.3, 'medium': 0.15, 'fast': 0.05, 'error': 0.1})
+        self.manager = crawlers.LacusCaptureManager(self.lacus, concurrency=4)
+
+    def tearDown(self):
+        self.manager.close()
+
+    def test_completion_order(self):
+        captures = [crawlers.CrawlerCapture(capture_uuid) for capture_uuid in ('slow', 'medium', 'fast')]
+        res = [(capture.uuid, status) for capture, status in self.manager.iter_captures_status(captures)]
+        self.assertEqual(res, [('fast', 1), ('medium', 1), ('slow', 1)])
+
+    def test_exceptions(self):
+        res = dict(self.manager.map(self.lacus.enqueue, ['fast', 'error', 'medium']))
+        self.assertEqual(res['fast'], 'capture_fast')
+        self.assertEqual(res['medium'], 'capture_medium')
+        self.assertIsInstance(res['error'], ConnectionError)
+
+    def test_concurrency(self):
+        # More calls than the concurrency
+        self.manager.set_concurrency(2)
+        urls = [f'url{i}' for i in range(6)]
+        self.lacus.delays = {url: 0.05 for url in urls}
+        res = self.manager.map(self.lacus.enqueue, urls)
+        self.assertEqual(sorted(res), [(url, f'capture_{url}') for url in urls])
+        self.assertEqual(self.lacus.max_running, 2)
+
+    def test_close_iterator(self):
+        self.manager.set_concurrency(1)
+        captures = [crawlers.CrawlerCapture(f'capture{i}') for i in range(5)]
+        self.lacus.delays = {capture.uuid: 0.1 for capture in captures}
+        statuses = self.manager.iter_captures_status(captures)
+        capture, status = next(statuses)
+        self.assertEqual(capture.uuid, 'capture0')
+        statuses.close()
+        time.sleep(0.3)
+        # The pending calls are cancelled, the next call may be already started
+        self.assertLessEqual(len(self.lacus.calls), 2)
+        # The manager can be reused
+        self.assertEqual(len(self.manager.map(self.lacus.get_capture_status, ['fast'])), 1)
+
+
+class TestHashsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.date_ymonth = datetime.datetime.now().strftime('%Y%m')
+        for algo in ('ssdeep', 'tlsh'):
+            if Duplicate.get_segment_size(algo, self.date_ymonth):
+                self.skipTest('Duplicates hashs already saved this month')
+
+    def tearDown(self):
+        for algo in ('ssdeep', 'tlsh'):
+            Duplicate.r_serv_db.delete(f'duplicates:hashs:{algo}:{self.date_ymonth}',
+                                       f'duplicates:segment:{algo}:{self.date_ymonth}')
+            Duplicate.r_serv_db.srem(f'duplicates:segments:{algo}', self.date_ymonth)
+
+    def test_similar(self):
+        content = ' '.join(str(uuid.uuid4()) for _ in range(200)).encode()
+        obj_hash = Duplicate.get_ssdeep_hash(content)
+        Duplicate.save_object_hash('ssdeep', self.date_ymonth, obj_hash, 'submitted/2026/10/18/a.gz')
+        cache = Duplicate.HashsCache('ssdeep', 0)
+        cache.refresh(force=True)
+        self.assertEqual(cache.get_nb_hashs(), 1)
+        self.assertEqual(cache.get_candidates(obj_hash), {self.date_ymonth: {obj_hash}})
+        other_hash = Duplicate.get_ssdeep_hash(content[:-200] + b'x' * 200)
+        self.assertEqual(cache.get_candidates(other_hash), {self.date_ymonth: {obj_hash}})
+
+    def test_exact_match_no_keys(self):
+        # Identical low-entropy items
+        content = b'ab' * 1500
+        for algo, obj_hash in (('ssdeep', Duplicate.get_ssdeep_hash(content)), ('tlsh', Duplicate.get_tlsh_hash(content))):
+            self.assertFalse(Duplicate.get_algo_index_keys(algo, obj_hash))
+            cache = Duplicate.HashsCache(algo, 0)
+            cache.refresh(force=True)
+            self.assertEqual(cache.get_candidates(obj_hash), {self.date_ymonth: set()})
+            size = Duplicate.save_object_hash(algo, self.date_ymonth, obj_hash, 'submitted/2026/10/18/a.gz')
+            cache.add(self.date_ymonth, obj_hash, size)
+            self.assertEqual(cache.get_candidates(obj_hash), {self.date_ymonth: {obj_hash}})
+
+    def test_empty_month(self):
+        cache = Duplicate.HashsCache('ssdeep', 0)
+        cache.refresh(force=True)
+        month = cache.months[self.date_ymonth]
+        self.assertEqual(len(month), 0)
+        # The hashs of the worker are added to a new month
+        obj_hash = Duplicate.get_ssdeep_hash(' '.join(str(uuid.uuid4()) for _ in range(200)).encode())
+        size = Duplicate.save_object_hash('ssdeep', self.date_ymonth, obj_hash, 'submitted/2026/10/18/a.gz')
+        cache.add(self.date_ymonth, obj_hash, size)
+        self.assertEqual(cache.get_nb_hashs(), 1)
+        # The month is not rebuilt
+        cache.refresh(force=True)
+        self.assertIs(cache.months[self.date_ymonth], month)
+        self.assertEqual(cache.get_nb_hashs(), 1)
+
+
+class FakeQueue:
+
+    def __init__(self, messages):
+        self.messages = messages
+        self.sent = []
+        self.sent_direct = []
+        self.nb_acked = 0
+
+    def get_messages(self, nb, timeout=None):
+        messages = self.messages[:nb]
+        self.messages = self.messages[nb:]
+        return messages
+
+    def send_message(self, obj_global_id, message, queue):
+        self.sent_direct.append((obj_global_id, message, queue))
+
+    def send_messages(self, messages):
+        self.sent.append(messages)
+
+    def end_messages(self, ended):
+        pass
+
+    def ack_messages(self, nb):
+        self.nb_acked += nb
+
+
+class EchoAnalyzer(AbstractModule):
+
+    def __init__(self, queue, module_name):
+        # No AILQueue
+        self.queue = queue
+        self.module_name = module_name
+        self.obj = None
+        self.sha256_mess = None
+        self._out_messages = None
+        self.debug = True
+
+    def compute(self, message):
+        self.add_message_to_queue(message=f'{self.module_name}:{message}', queue='Echo')
+        self.add_message_to_queue(message=f'{self.module_name}:{message}', queue='Echo2')
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = FakeQueue([(None, None, f'message{i}') for i in range(6)])
+        # No AILQueue
+        self.pipeline = Pipeline.Pipeline.__new__(Pipeline.Pipeline)
+        EchoAnalyzer.__init__(self.pipeline, self.queue, 'Pipeline')
+        self.pipeline.analyzers = [EchoAnalyzer(self.queue, 'A'), EchoAnalyzer(self.queue, 'B')]
+        self.pipeline.batch_size = 6
+        self.pipeline.blocking = False
+        self.pipeline._batch_running = False
+
+    def test_batch(self):
+        self.pipeline.batch_flush_interval = 3600
+        self.assertTrue(self.pipeline._run_batch())
+        # One round-trip by analyzer
+        self.assertEqual([len(messages) for messages in self.queue.sent], [12, 12])
+        self.assertFalse(self.queue.sent_direct)
+        self.assertEqual(self.queue.nb_acked, 6)
+
+    def test_intermediate_flush(self):
+        # Flush after each message
+        self.pipeline.batch_flush_interval = -1
+        self.assertTrue(self.pipeline._run_batch())
+        # The messages of an analyzer are still sent by batch
+        self.assertEqual([len(messages) for messages in self.queue.sent], [2] * 12)
+        self.assertFalse(self.queue.sent_direct)
+        self.assertEqual(self.queue.sent[-1], [('::', 'B:message5', 'Echo'), ('::', 'B:message5', 'Echo2')])
+        self.assertEqual(self.queue.nb_acked, 6)
+        # Not buffered outside a batch
+        for analyzer in self.pipeline.analyzers:
+            self.assertIsNone(analyzer._out_messages)
+        self.assertFalse(self.pipeline._run_batch())
+
+
+class FakeWorker:
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.alive = True
+        self.exitcode = None
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+    def join(self, timeout=None):
+        if timeout is None:
+            raise AssertionError('blocking join')
+
+    def is_alive(self):
+        return self.alive
+
+
+class TestModuleRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = Module_Runner.ModuleRunner.__new__(Module_Runner.ModuleRunner)
+        self.runner.module_name = 'TestModule'
+        self.runner.logger = Module_Runner.logging.getLogger('ModuleRunner')
+        self.runner.min_workers = 1
+        self.runner.max_workers = 2
+        self.runner.scale_backlog = 100
+        self.runner.workers = [FakeWorker(1), FakeWorker(2)]
+        self.runner.stopping_workers = []
+
+    def test_scale_down(self):
+        requeued = []
+        with patch.object(Module_Runner.ModuleRunner, 'get_nb_messages', lambda runner: 0), \
+                patch.object(Module_Runner.ail_queues, 'requeue_messages', lambda name, pid: requeued.append(pid)):
+            # The stopped worker is not joined
+            self.runner.scale()
+            self.assertEqual([w.pid for w in self.runner.workers], [1])
+            worker = self.runner.stopping_workers[0]
+            self.assertTrue(worker.terminated)
+            # Still ending its batch
+            self.runner.scale()
+            self.assertEqual(self.runner.stopping_workers, [worker])
+            self.assertFalse(requeued)
+            # Reaped
+            worker.alive = False
+            worker.exitcode = 0
+            self.runner.scale()
+            self.assertFalse(self.runner.stopping_workers)
+            self.assertEqual(requeued, [2])
+            self.assertEqual([w.pid for w in self.runner.workers], [1])
+
+
+class TestIndexBackend(unittest.TestCase):
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            index_whoosh.IndexBackend('/tmp')
+
+    def test_backends(self):
+        for index_type in index_whoosh.INDEX_BACKENDS:
+            with tempfile.TemporaryDirectory() as index_path:
+                backend = index_whoosh.get_index_backend(index_path, index_type=index_type, batch_size=2, batch_time=0)
+                backend.add_document('submitted/2024/01/01/a.gz', 'apple banana')
+                backend.add_document('submitted/2024/01/01/b.gz', 'banana cherry')
+                backend.add_document('submitted/2024/01/01/a.gz', 'apple')
+                backend.close()
+                self.assertEqual(index_whoosh.get_index_type(index_path), index_type)
+                # merge the segments of the closed index
+                index_whoosh.optimize_index(index_path)
+
+                backend = index_whoosh.get_index_backend(index_path, index_type=index_type, batch_size=1)
+                try:
+                    self.assertEqual(backend.search('banana'), ['submitted/2024/01/01/b.gz'])
+                    self.assertEqual(backend.search('apple'), ['submitted/2024/01/01/a.gz'])
+                finally:
+                    backend.close()
+
+    def test_sqlite_paths(self):
+        with tempfile.TemporaryDirectory() as index_path:
+            backend = index_whoosh.SqliteFTSBackend(index_path, batch_size=10, batch_time=0)
+            try:
+                for i in range(3):
+                    backend.add_document('submitted/2024/01/01/a.gz', f'apple{i}')
+                backend.commit()
+                self.assertEqual(backend.conn.execute('SELECT COUNT(*) FROM documents').fetchone()[0], 1)
+                self.assertEqual(backend.search('apple2'), ['submitted/2024/01/01/a.gz'])
+                self.assertEqual(backend.search('apple0'), [])
+                plan = backend.conn.execute('EXPLAIN QUERY PLAN SELECT doc_rowid FROM paths WHERE path = ?', ('a',)).fetchall()
+                self.assertIn('USING INDEX', plan[0][-1])
+            finally:
+                backend.close()
+
+    def test_sqlite_paths_migration(self):
+        # Index created without the paths table
+        with tempfile.TemporaryDirectory() as index_path:
+            conn = sqlite3.connect(os.path.join(index_path, 'index.db'))
+            conn.execute('CREATE VIRTUAL TABLE documents USING fts5(path UNINDEXED, content)')
+            conn.execute("INSERT INTO documents (path, content) VALUES ('submitted/2024/01/01/a.gz', 'apple')")
+            conn.commit()
+            conn.close()
+            backend = index_whoosh.SqliteFTSBackend(index_path, batch_size=1)
+            try:
+                backend.add_document('submitted/2024/01/01/a.gz', 'banana')
+                self.assertEqual(backend.search('apple'), [])
+                self.assertEqual(backend.search('banana'), ['submitted/2024/01/01/a.gz'])
+            finally:
+                backend.close()
+
+
+class FakeRetroHunt:
+
+    def __init__(self, last):
+        self.last = last
+        self.partitions_done = set()
+        self.partitions_last = {}
+
+    def get_last_analyzed(self):
+        return self.last
+
+    def delete_last_analyzed(self):
+        self.last = None
+
+    def has_partitions(self):
+        return bool(self.partitions_done or self.partitions_last)
+
+    def add_partition_done(self, partition):
+        self.partitions_done.add(partition)
+
+    def set_partition_last(self, partition, obj_id):
+        self.partitions_last[partition] = obj_id
+
+    def get_progress(self):
+        return None
+
+
+class FakeObject:
+
+    def __init__(self, obj_id):
+        self.id = obj_id
+
+    def get_id(self):
+        return self.id
+
+    def get_content(self, r_type='str'):
+        return b'content'
+
+
+class TestRetroHuntEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.items_dir = tempfile.TemporaryDirectory()
+        for source in ('a', 'a-b'):
+            for day in ('01', '02', '03'):
+                os.makedirs(os.path.join(self.items_dir.name, source, '2024', '01', day))
+        self.filters = {'item': {'sources': ['a', 'a-b'], 'date_from': '20240101', 'date_to': '20240131'}, 'decoded': {}}
+
+    def tearDown(self):
+        self.items_dir.cleanup()
+
+    def test_convert_last_analyzed_item(self):
+        retro_hunt = FakeRetroHunt('item::a/2024/01/02/x.gz')
+        with patch.object(Items, 'ITEMS_FOLDER', self.items_dir.name):
+            retro_hunt_engine.convert_last_analyzed(retro_hunt, self.filters)
+        self.assertEqual(retro_hunt.partitions_done, {'item:a:2024/01/01'})
+        self.assertEqual(retro_hunt.partitions_last, {'item:a:2024/01/02': 'a/2024/01/02/x.gz'})
+        self.assertIsNone(retro_hunt.last)
+
+    def test_convert_last_analyzed_obj(self):
+        retro_hunt = FakeRetroHunt('decoded::abc')
+        with patch.object(Items, 'ITEMS_FOLDER', self.items_dir.name):
+            retro_hunt_engine.convert_last_analyzed(retro_hunt, self.filters)
+            partitions = retro_hunt_engine.get_partitions(self.filters)
+        self.assertEqual(len(partitions), 7)
+        self.assertEqual(retro_hunt.partitions_done, set(partitions[:6]))
+        self.assertEqual(retro_hunt.partitions_last, {'decoded:': 'abc'})
+
+    def test_convert_last_analyzed_partitions(self):
+        # Already converted
+        retro_hunt = FakeRetroHunt('decoded::abc')
+        retro_hunt.add_partition_done('item:a:2024/01/01')
+        with patch.object(Items, 'ITEMS_FOLDER', self.items_dir.name):
+            retro_hunt_engine.convert_last_analyzed(retro_hunt, self.filters)
+        self.assertEqual(retro_hunt.partitions_done, {'item:a:2024/01/01'})
+        self.assertFalse(retro_hunt.partitions_last)
+
+    def test_partition_objs_resume(self):
+        objs = [FakeObject(obj_id) for obj_id in ('c', 'a', 'b')]
+        with patch.object(retro_hunt_engine.ail_objects, 'obj_iterator', lambda obj_type, filters: iter(objs)):
+            resumed = retro_hunt_engine.get_partition_objs('decoded:', self.filters, start_id='a')
+            self.assertEqual([obj.get_id() for obj, content in resumed], ['b'])
+            # Last object analyzed deleted
+            with self.assertLogs(level='WARNING'):
+                resumed = [obj.get_id() for obj, content in
+                           retro_hunt_engine.get_partition_objs('decoded:', self.filters, start_id='d')]
+            self.assertEqual(resumed, ['c', 'a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AIL 2 AIL Sync Benchmark
+========================
+
+Push synthetic ail streams from a local client to a local server (loopback, no TLS)
+with the legacy transport (one JSON object by message) and with the batch transport
+(compressed frames, bounded window of acknowledgements).
+
+The server side acknowledges the frames like the sync server, the objects are counted
+instead of being added to the sync importer.
+
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import random
+import string
+import sys
+import time
+
+import asyncio
+import websockets
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from core import ail_2_ail_transport
+
+WORDS = [''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 10))) for _ in range(2000)]
+
+
+def create_ail_stream(i):
+    content = ' '.join(random.choices(WORDS, k=random.randint(100, 600)))
+    return {'format': 'ail',
+            'version': 1,
+            'type': 'item',
+            'meta': {'ail:mime-type': 'text/plain',
+                     'compress': 'gzip',
+                     'encoding': 'base64',
+                     'ail:id': f'submitted/2026/10/18/{i}.gz',
+                     'tags': ['infoleak:submission="manual"'],
+                     'uuid_org': '03c51929-eeab-4d47-9dc0-c667f94c7d2d'},
+            'payload': {'raw': base64.b64encode(gzip.compress(content.encode())).decode()}}
+
+# # # # SERVER # # # #
+
+class Receiver:
+
+    def __init__(self):
+        self.nb = 0
+        self.done = asyncio.Event()
+        self.expected = 0
+
+    def add(self, nb):
+        self.nb += nb
+        if self.nb >= self.expected:
+            self.done.set()
+
+    async def handler(self, websocket, path):
+        compression = ail_2_ail_transport.get_subprotocol_compression(websocket.subprotocol)
+        try:
+            if compression:
+                await ail_2_ail_transport.receive_batches(websocket, compression, lambda streams: self.add(len(streams)))
+            else:
+                async for message in websocket:
+                    json.loads(message)
+                    self.add(1)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+
+# # # # CLIENT # # # #
+
+async def push_legacy(uri, ail_streams, sleep):
+    nb_bytes = 0
+    async with websockets.connect(uri, max_size=None) as websocket:
+        for ail_stream in ail_streams:
+            message = json.dumps(ail_stream)
+            nb_bytes += len(message)
+            await websocket.send(message)
+            if sleep:
+                await asyncio.sleep(sleep)
+    return nb_bytes
+
+async def push_batch(uri, ail_streams, compression, batch_size, window):
+    async with websockets.connect(uri, max_size=None, subprotocols=[f'{ail_2_ail_transport.SUBPROTOCOL}.{compression}']) as websocket:
+        assert ail_2_ail_transport.get_subprotocol_compression(websocket.subprotocol) == compression
+        sender = ail_2_ail_transport.BatchSender(websocket, compression, window=window, create_ail_stream=lambda obj: obj)
+        for i in range(0, len(ail_streams), batch_size):
+            await sender.send([(obj, None) for obj in ail_streams[i:i + batch_size]])
+        await sender.flush()
+        sender.close()
+    return sender.nb_bytes
+
+async def run(receiver, port, name, push, nb):
+    receiver.nb = 0
+    receiver.expected = nb
+    receiver.done.clear()
+    start = time.time()
+    nb_bytes = await push
+    await receiver.done.wait()
+    duration = time.time() - start
+    print(f'{name:<20} {nb:>8} {duration:>10.3f} {nb / duration:>12.1f} {nb_bytes / 1024 / 1024:>10.2f}')
+
+async def main(args):
+    ail_streams = [create_ail_stream(i) for i in range(args.nb)]
+    receiver = Receiver()
+    server = await websockets.serve(receiver.handler, '127.0.0.1', args.port, max_size=None,
+                                    subprotocols=ail_2_ail_transport.get_subprotocols())
+    uri = f'ws://127.0.0.1:{args.port}/push/benchmark'
+
+    print(f'{"transport":<20} {"objects":>8} {"time (s)":>10} {"objects/s":>12} {"sent (MB)":>10}')
+    nb_legacy = min(args.nb_legacy, args.nb)
+    await run(receiver, args.port, 'legacy', push_legacy(uri, ail_streams[:nb_legacy], args.sleep), nb_legacy)
+    await run(receiver, args.port, 'legacy (no sleep)', push_legacy(uri, ail_streams, 0), args.nb)
+    for compression in ail_2_ail_transport.get_compressions():
+        await run(receiver, args.port, f'batch {compression}',
+                  push_batch(uri, ail_streams, compression, args.batch_size, args.window), args.nb)
+
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AIL 2 AIL sync transports benchmark')
+    parser.add_argument('-n', '--nb', type=int, default=5000, help='Number of objects')
+    parser.add_argument('--nb-legacy', type=int, default=100, help='Number of objects pushed with the legacy pacing')
+    parser.add_argument('--sleep', type=float, default=0.1, help='Legacy transport sleep between two objects')
+    parser.add_argument('-b', '--batch-size', type=int, default=ail_2_ail_transport.BATCH_SIZE, help='Objects by frame')
+    parser.add_argument('-w', '--window', type=int, default=ail_2_ail_transport.WINDOW, help='Unacknowledged frames')
+    parser.add_argument('-p', '--port', type=int, default=14443, help='Loopback server port')
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
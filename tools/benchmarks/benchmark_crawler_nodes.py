@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Crawler Post-Processing Benchmark
+=================================
+
+Compare, for a crawled page, the cost of sending the page (html, screenshot and HAR) to a
+post-processing worker (pickle round-trip) with the work done by the worker.
+
+The worker work is measured without writing files: item gzip/base64, DOM hash, title,
+HAR serialization and compression (save_har), screenshot hash, cookies and etags extraction.
+
+"""
+
+import argparse
+import gzip
+import json
+import pickle
+import random
+import string
+import sys
+import os
+import time
+
+from hashlib import sha256
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import crawlers
+from lib.objects import DomHashs
+
+TAGS = ['div', 'p', 'a', 'span', 'li', 'td', 'img', 'h2']
+
+
+def random_text(nb_chars):
+    return ''.join(random.choices(string.ascii_letters + ' ', k=nb_chars))
+
+def generate_html(size):
+    html = ['<html><head><title>benchmark</title></head><body>']
+    length = 0
+    while length < size:
+        tag = random.choice(TAGS)
+        element = f'<{tag} class="c{random.randint(0, 50)}">{random_text(random.randint(10, 200))}</{tag}>'
+        html.append(element)
+        length += len(element)
+    html.append('</body></html>')
+    return ''.join(html)
+
+def generate_har(nb_entries, content_size):
+    entries = []
+    for i in range(nb_entries):
+        headers = [{'name': f'x-header-{j}', 'value': random_text(40)} for j in range(12)]
+        headers.append({'name': 'etag', 'value': f'"{random_text(16)}"'})
+        entries.append({'request': {'url': f'http://benchmark.onion/{i}', 'method': 'GET', 'headers': headers,
+                                    'cookies': [{'name': f'cookie{i % 5}', 'value': random_text(32)}]},
+                        'response': {'status': 200, 'headers': headers, 'cookies': [],
+                                     'content': {'size': content_size, 'text': random_text(content_size)}}})
+    return {'log': {'version': '1.2', 'entries': entries}}
+
+def process_node(node):
+    crawlers.get_gzipped_b64_item(node['item_id'], node['html'])
+    DomHashs.compute_dom_hash(node['html'])
+    crawlers.extract_title_from_html(node['html'])
+    sha256(node['png']).hexdigest()
+    gzip.compress(json.dumps(node['har']).encode())
+    crawlers.extract_cookies_names_from_har(node['har'])
+    crawlers.extract_etag_from_har(node['har'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawler post-processing transfer benchmark')
+    parser.add_argument('-n', '--nodes', type=int, default=20, help='Number of pages')
+    parser.add_argument('--html', type=int, default=200000, help='HTML size')
+    parser.add_argument('--png', type=int, default=1000000, help='Screenshot size')
+    parser.add_argument('--har', type=int, default=100, help='Number of HAR entries')
+    parser.add_argument('--har-content', type=int, default=5000, help='Size of the HAR entries content')
+    args = parser.parse_args()
+
+    random.seed(42)
+    nodes = []
+    for i in range(args.nodes):
+        nodes.append({'item_id': f'crawled/2026/10/18/benchmark.onion{i}', 'parent_id': None,
+                      'last_url': 'http://benchmark.onion', 'domain': 'benchmark.onion',
+                      'html': generate_html(args.html), 'png': random.randbytes(args.png),
+                      'har': generate_har(args.har, args.har_content), 'har_id': f'2026/10/18/benchmark.onion{i}'})
+
+    start = time.time()
+    nb_bytes = 0
+    for node in nodes:
+        data = pickle.dumps(node, protocol=pickle.HIGHEST_PROTOCOL)
+        nb_bytes += len(data)
+        pickle.loads(data)
+    time_transfer = time.time() - start
+
+    start = time.time()
+    for node in nodes:
+        process_node(node)
+    time_process = time.time() - start
+
+    print(f'{args.nodes} pages, {nb_bytes / args.nodes / 1024 / 1024:.2f} MB pickled by page')
+    print(f'Pickle round-trip: {time_transfer / args.nodes * 1000:.2f} ms/page')
+    print(f'Worker processing: {time_process / args.nodes * 1000:.2f} ms/page')
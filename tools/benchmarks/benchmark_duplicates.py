@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Duplicates Benchmark
+====================
+
+Compare the full scan of the hashs with the similarity index candidates
+on a synthetic corpus of ssdeep and TLSH hashs.
+
+The index is kept in memory, with the keys of the Duplicates module index
+(Duplicate.get_algo_index_keys). The recall is the fraction of the full scan
+matches also found with the index: 1.0 for ssdeep, TLSH sampling is lossy.
+
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+from collections import defaultdict
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import Duplicate
+
+B64 = string.ascii_letters + string.digits + '+/'
+HEX = '0123456789ABCDEF'
+
+
+def random_ssdeep():
+    block_size = 3 * 2 ** random.randint(4, 10)
+    chunk1 = ''.join(random.choices(B64, k=random.randint(40, 64)))
+    chunk2 = ''.join(random.choices(B64, k=random.randint(20, 32)))
+    return f'{block_size}:{chunk1}:{chunk2}'
+
+def mutate_ssdeep(ssdeep_hash, nb=4):
+    block_size, chunk1, chunk2 = ssdeep_hash.split(':')
+    chunk1 = list(chunk1)
+    for _ in range(nb):
+        chunk1[random.randrange(len(chunk1))] = random.choice(B64)
+    return f'{block_size}:{"".join(chunk1)}:{chunk2}'
+
+def random_tlsh():
+    return 'T1' + ''.join(random.choices(HEX, k=70))
+
+def mutate_tlsh(tlsh_hash, nb=6):
+    tlsh_hash = list(tlsh_hash)
+    for _ in range(nb):
+        tlsh_hash[random.randrange(8, len(tlsh_hash))] = random.choice(HEX)
+    return ''.join(tlsh_hash)
+
+def build_index(algo, hashs):
+    index = defaultdict(set)
+    for hash_ in hashs:
+        for key in Duplicate.get_algo_index_keys(algo, hash_):
+            index[key].add(hash_)
+    return index
+
+def full_scan(algo, hashs, hash_, threshold):
+    return {h for h in hashs if Duplicate.get_algo_similarity(algo, hash_, h) >= threshold}
+
+def index_scan(algo, index, hash_, threshold):
+    candidates = set()
+    for key in Duplicate.get_algo_index_keys(algo, hash_):
+        candidates.update(index.get(key, ()))
+    return {h for h in candidates if Duplicate.get_algo_similarity(algo, hash_, h) >= threshold}, len(candidates)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Duplicates similarity index benchmark')
+    parser.add_argument('-n', '--nb_hashs', type=int, default=1000000, help='Number of hashs in the corpus')
+    parser.add_argument('-q', '--queries', type=int, default=100, help='Number of queries')
+    parser.add_argument('-f', '--full', type=int, default=5, help='Number of queries checked with a full scan')
+    args = parser.parse_args()
+
+    random.seed(42)
+    generators = {'ssdeep': (random_ssdeep, mutate_ssdeep, 50), 'tlsh': (random_tlsh, mutate_tlsh, 52)}
+
+    for algo, (generate, mutate, threshold) in generators.items():
+        hashs = [generate() for _ in range(args.nb_hashs)]
+        queries = [mutate(random.choice(hashs)) for _ in range(args.queries)]
+
+        start = time.time()
+        index = build_index(algo, hashs)
+        print(f'[{algo}] index build: {time.time() - start:.2f}s, {args.nb_hashs} hashs, {len(index)} keys')
+
+        start = time.time()
+        nb_candidates = 0
+        results = []
+        for query in queries:
+            res, nb = index_scan(algo, index, query, threshold)
+            results.append(res)
+            nb_candidates += nb
+        time_index = (time.time() - start) / args.queries
+        print(f'[{algo}] index:     {time_index * 1000:.3f} ms/query, {nb_candidates / args.queries:.1f} candidates/query')
+
+        if args.full:
+            start = time.time()
+            recall = []
+            for query, res in zip(queries[:args.full], results):
+                expected = full_scan(algo, hashs, query, threshold)
+                if expected:
+                    recall.append(len(res & expected) / len(expected))
+            time_full = (time.time() - start) / min(args.full, args.queries)
+            print(f'[{algo}] full scan: {time_full * 1000:.3f} ms/query')
+            if recall:
+                print(f'[{algo}] recall:    {sum(recall) / len(recall):.2f}')
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexer Benchmark
+=================
+
+Compare the ingest rate of the full-text index backends on synthetic documents:
+Whoosh with a commit by document (previous Indexer), batched Whoosh and SQLite FTS5.
+
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import index_whoosh
+
+
+def random_word():
+    return ''.join(random.choices(string.ascii_lowercase, k=random.randint(3, 10)))
+
+def generate_documents(nb_docs, nb_words):
+    vocabulary = [random_word() for _ in range(20000)]
+    docs = []
+    for i in range(nb_docs):
+        doc_id = f'benchmark/2024/01/01/{i}.gz'
+        docs.append((doc_id, ' '.join(random.choices(vocabulary, k=nb_words))))
+    return docs
+
+def ingest(index_type, docs, batch_size, batch_time=0):
+    with tempfile.TemporaryDirectory() as index_path:
+        backend = index_whoosh.get_index_backend(index_path, index_type=index_type,
+                                                 batch_size=batch_size, batch_time=batch_time)
+        start = time.time()
+        for doc_id, content in docs:
+            backend.add_document(doc_id, content)
+        backend.close()
+        duration = time.time() - start
+
+        # check search
+        word = docs[0][1].split()[0]
+        backend = index_whoosh.get_index_backend(index_path, index_type=index_type, batch_size=1)
+        nb_found = len(backend.search(word, nb=len(docs)))
+        backend.close()
+        return duration, nb_found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Indexer ingest benchmark')
+    parser.add_argument('-n', '--nb_docs', type=int, default=2000, help='Number of documents')
+    parser.add_argument('-w', '--words', type=int, default=1000, help='Number of words by document')
+    parser.add_argument('-b', '--batch_size', type=int, default=200, help='Batch size')
+    args = parser.parse_args()
+
+    random.seed(42)
+    documents = generate_documents(args.nb_docs, args.words)
+
+    for name, index_type, batch_size in (('whoosh, commit by document', 'whoosh', 1),
+                                         (f'whoosh, batch {args.batch_size}', 'whoosh', args.batch_size),
+                                         (f'sqlite, batch {args.batch_size}', 'sqlite', args.batch_size)):
+        duration, nb_found = ingest(index_type, documents, batch_size)
+        print(f'{name:<30} {args.nb_docs / duration:10.1f} docs/s  ({nb_found} search results)')
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline Benchmark
+==================
+
+Compare the per-object overhead of N analyzers running as separate modules with the
+fused Pipeline module: queue round-trips and content reads, without the analyzers work.
+
+Separate modules: each module pops the message from its own queue, acknowledges it, and reads
+the content (the first module from disk, the next ones from Redis_Cache).
+Pipeline: the message is popped and acknowledged once, the content is read from disk once,
+the next analyzers hit the in-process content cache.
+
+The queues are emulated with the ail_queues scripts on a benchmark key of Redis_Queues,
+deleted at the end.
+
+"""
+
+import argparse
+import gzip
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import ail_queues
+from lib import content_cache
+from lib.item_basic import _decode_item_content, r_cache
+
+QUEUE = 'queue:benchmark_pipeline:in'
+PROCESSING = 'queue:benchmark_pipeline:processing:0'
+
+
+def generate_content(nb_chars):
+    words = [''.join(random.choices(string.ascii_letters, k=random.randint(2, 10))) for _ in range(5000)]
+    return ' '.join(random.choices(words, k=nb_chars // 7))[:nb_chars]
+
+def read_item(items_dir, item_id):
+    with gzip.open(os.path.join(items_dir, item_id), 'rb') as f:
+        return _decode_item_content(f.read())
+
+def queue_round_trip(messages, batch_size):
+    r_queues = ail_queues.r_queues
+    for i in range(0, len(messages), batch_size):
+        r_queues.rpush(QUEUE, *messages[i:i + batch_size])
+        popped, _ = ail_queues._POP_MESSAGES(keys=[QUEUE, PROCESSING], args=[batch_size])
+        r_queues.ltrim(PROCESSING, len(popped), -1)
+
+def run_separate(items_dir, items_ids, nb_analyzers, batch_size):
+    for n in range(nb_analyzers):
+        queue_round_trip(items_ids, batch_size)
+        for item_id in items_ids:
+            content = r_cache.get(f'benchmark_pipeline:{item_id}')
+            if content is None:
+                content = read_item(items_dir, item_id)
+                r_cache.set(f'benchmark_pipeline:{item_id}', content, ex=300)
+
+def run_pipeline(items_dir, items_ids, nb_analyzers, batch_size):
+    queue_round_trip(items_ids, batch_size)
+    for item_id in items_ids:
+        for n in range(nb_analyzers):
+            content = content_cache.get_content(item_id)
+            if content is None:
+                content = read_item(items_dir, item_id)
+                content_cache.set_content(item_id, content)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fused pipeline overhead benchmark')
+    parser.add_argument('-o', '--objects', type=int, default=500, help='Number of items')
+    parser.add_argument('-s', '--size', type=int, default=50000, help='Size of the items')
+    parser.add_argument('-a', '--analyzers', type=int, default=8, help='Number of analyzers')
+    parser.add_argument('-b', '--batch-size', type=int, default=50, help='Messages popped by batch')
+    args = parser.parse_args()
+
+    random.seed(42)
+    items_dir = tempfile.mkdtemp()
+    items_ids = []
+    for i in range(args.objects):
+        item_id = f'{i}.gz'
+        with gzip.open(os.path.join(items_dir, item_id), 'wb') as f:
+            f.write(generate_content(args.size).encode())
+        items_ids.append(item_id)
+
+    try:
+        start = time.time()
+        run_separate(items_dir, items_ids, args.analyzers, args.batch_size)
+        time_separate = time.time() - start
+
+        start = time.time()
+        run_pipeline(items_dir, items_ids, args.analyzers, args.batch_size)
+        time_pipeline = time.time() - start
+    finally:
+        shutil.rmtree(items_dir)
+        ail_queues.r_queues.delete(QUEUE, PROCESSING)
+        r_cache.delete(*[f'benchmark_pipeline:{item_id}' for item_id in items_ids])
+
+    print(f'{args.analyzers} analyzers, {args.objects} items of {args.size} chars')
+    print(f'Separate modules: {time_separate / args.objects * 1000:.3f} ms/item')
+    print(f'Pipeline:         {time_pipeline / args.objects * 1000:.3f} ms/item')
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tools Benchmark
+===============
+
+Compare the per-item cost of the Tools module signatures scan on a clean corpus:
+all the tools regexs executed on each item versus the literal prefilter.
+
+The regexs are executed in-process, without the regex helper timeout overhead.
+
+"""
+
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib.regex_helper import RegexPrefilter
+from modules.Tools import TOOLS
+
+
+def generate_content(nb_chars):
+    words = [''.join(random.choices(string.ascii_letters, k=random.randint(2, 10))) for _ in range(5000)]
+    content = []
+    size = 0
+    while size < nb_chars:
+        word = random.choice(words)
+        content.append(word)
+        size += len(word) + 1
+    return ' '.join(content)
+
+def scan_all(regexs, content):
+    return [tool_name for tool_name, regex in regexs.items() if regex.search(content)]
+
+def scan_prefilter(prefilter, regexs, content):
+    return [tool_name for tool_name in prefilter.get_candidates(content) if regexs[tool_name].search(content)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tools signatures scan benchmark')
+    parser.add_argument('-o', '--objects', type=int, default=200, help='Number of items')
+    parser.add_argument('-s', '--size', type=int, default=50000, help='Size of the items')
+    args = parser.parse_args()
+
+    random.seed(42)
+    regexs = {tool_name: re.compile(TOOLS[tool_name]['regex']) for tool_name in TOOLS}
+    prefilter = RegexPrefilter({tool_name: TOOLS[tool_name]['regex'] for tool_name in TOOLS})
+    print(f'{len(TOOLS)} tools, {len(prefilter.always)} without literal: {prefilter.always}')
+
+    contents = [generate_content(args.size) for _ in range(args.objects)]
+
+    start = time.time()
+    res_all = [scan_all(regexs, content) for content in contents]
+    time_all = time.time() - start
+
+    start = time.time()
+    res_prefilter = [scan_prefilter(prefilter, regexs, content) for content in contents]
+    time_prefilter = time.time() - start
+
+    assert [sorted(r) for r in res_all] == [sorted(r) for r in res_prefilter]
+
+    print(f'All regexs: {time_all / args.objects * 1000:.3f} ms/item')
+    print(f'Prefilter:  {time_prefilter / args.objects * 1000:.3f} ms/item')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracker_Term Benchmark
+======================
+
+Compare the TextBlob word frequency path with the Aho-Corasick TermMatcher
+on synthetic tracked words/sets and contents.
+
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import Tracker
+
+
+def random_word(length=None):
+    if not length:
+        length = random.randint(4, 12)
+    return ''.join(random.choices(string.ascii_lowercase, k=length))
+
+def generate_content(vocabulary, nb_words):
+    separators = [' ', ' ', ' ', '\n', ', ', '. ', '/', ':', '-']
+    return ''.join(f'{random.choice(vocabulary)}{random.choice(separators)}' for _ in range(nb_words))
+
+def textblob_match(tracked_words, tracked_sets, content):
+    words = []
+    sets = []
+    dict_words_freq = Tracker.get_text_word_frequency(content)
+    for word in tracked_words:
+        if word in dict_words_freq:
+            words.append(word)
+    for tracked_set in tracked_sets:
+        nb_uniq_word = 0
+        for word in tracked_set['words']:
+            if word in dict_words_freq:
+                nb_uniq_word += 1
+        if nb_uniq_word >= tracked_set['nb']:
+            sets.append(tracked_set['tracked'])
+    return words, sets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tracker_Term benchmark')
+    parser.add_argument('-w', '--words', type=int, default=5000, help='Number of tracked words')
+    parser.add_argument('-s', '--sets', type=int, default=1000, help='Number of tracked sets')
+    parser.add_argument('-o', '--objects', type=int, default=50, help='Number of objects')
+    parser.add_argument('-l', '--length', type=int, default=20000, help='Number of words by object')
+    args = parser.parse_args()
+
+    random.seed(42)
+    vocabulary = [random_word() for _ in range(50000)]
+    tracked_words = list({*random.sample(vocabulary, args.words // 2), *(random_word(14) for _ in range(args.words // 2))})
+    tracked_sets = []
+    for _ in range(args.sets):
+        words = sorted(set(random.sample(vocabulary, random.randint(2, 5))))
+        nb = random.randint(1, len(words))
+        tracked_sets.append({'words': words, 'nb': nb, 'tracked': f'{",".join(words)};{nb}'})
+    contents = [generate_content(vocabulary, args.length) for _ in range(args.objects)]
+
+    start = time.time()
+    matcher = Tracker.TermMatcher(refresh=False)
+    matcher.load(words={'item': tracked_words}, sets={'item': tracked_sets})
+    print(f'TermMatcher build: {time.time() - start:.3f}s ({args.words} words, {args.sets} sets)')
+
+    start = time.time()
+    res_textblob = [textblob_match(tracked_words, tracked_sets, content) for content in contents]
+    time_textblob = time.time() - start
+
+    start = time.time()
+    res_matcher = [matcher.match('item', content) for content in contents]
+    time_matcher = time.time() - start
+
+    for r1, r2 in zip(res_textblob, res_matcher):
+        assert sorted(r1[0]) == sorted(r2[0]) and sorted(r1[1]) == sorted(r2[1])
+
+    print(f'TextBlob:    {time_textblob / args.objects * 1000:.2f} ms/object')
+    print(f'TermMatcher: {time_matcher / args.objects * 1000:.2f} ms/object')
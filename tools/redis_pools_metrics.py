@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redis/Kvrocks Connection Pools Metrics
+======================================
+
+Show the connection pools metrics saved by the running modules, by server
+
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from lib import ConfigLoader
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Redis/Kvrocks connection pools metrics')
+    parser.add_argument('-p', '--processes', action='store_true', help='Show the metrics by process')
+    args = parser.parse_args()
+
+    all_metrics = ConfigLoader.get_all_processes_pools_metrics()
+
+    servers = {}
+    for process_name, pools_metrics in sorted(all_metrics.items()):
+        for metrics in pools_metrics:
+            if args.processes:
+                print(f'{process_name:<40} {metrics["server"]:<24} connections={metrics["in_use"] + metrics["available"]} '
+                      f'commands={metrics["commands"]} round_trips={metrics["round_trips"]} '
+                      f'latency={metrics["latency"] * 1000:.3f}ms {",".join(metrics["names"])}')
+            server = servers.setdefault(metrics['server'], {'processes': set(), 'connections': 0, 'commands': 0,
+                                                            'round_trips': 0, 'wait_time': 0.0})
+            server['processes'].add(process_name)
+            server['connections'] += metrics['in_use'] + metrics['available']
+            server['commands'] += metrics['commands']
+            server['round_trips'] += metrics['round_trips']
+            server['wait_time'] += metrics['wait_time']
+
+    print(f'{"server":<24} {"processes":>10} {"connections":>12} {"commands":>12} {"round trips":>12} {"latency (ms)":>13}')
+    for server_name, server in sorted(servers.items()):
+        latency = server['wait_time'] / server['round_trips'] * 1000 if server['round_trips'] else 0
+        print(f'{server_name:<24} {len(server["processes"]):>10} {server["connections"]:>12} {server["commands"]:>12} '
+              f'{server["round_trips"]:>12} {latency:>13.3f}')
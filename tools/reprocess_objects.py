@@ -41,19 +41,33 @@ MODULES = {
     'OcrExtractor': OcrExtractor
 }
 
-def reprocess_message_objects(object_type, module_name=None):
+# Print the resume token every PROGRESS objects
+PROGRESS = 1000
+
+def reprocess_message_objects(object_type, module_name=None, start=None):
+    filters = {}
+    # Resume after this item
+    if start and object_type == 'item':
+        filters['start'] = {'type': 'item', 'id': start}
+    nb = 0
     if module_name:
         module = MODULES[module_name]()
-        for obj in ail_objects.obj_iterator(object_type, filters={}):
+        for obj in ail_objects.obj_iterator(object_type, filters=filters):
             if not obj.exists():
                 print(f'ERROR: object does not exist, {obj.id}')
                 continue
             module.obj = obj
             module.compute(None)
+            nb += 1
+            if nb % PROGRESS == 0:
+                print(f'{nb} objects reprocessed, resume token: {obj.id}')
     else:
         queue = ail_queues.AILQueue('FeederModuleImporter', -1)
-        for obj in ail_objects.obj_iterator(object_type, filters={}):
+        for obj in ail_objects.obj_iterator(object_type, filters=filters):
             queue.send_message(obj.get_global_id(), message='reprocess')
+            nb += 1
+            if nb % PROGRESS == 0:
+                print(f'{nb} objects reprocessed, resume token: {obj.id}')
         queue.end()
 
 
@@ -62,6 +76,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Reprocess AIL Objects')
     parser.add_argument('-t', '--type', type=str, help='AIL Object Type', required=True)
     parser.add_argument('-m', '--module', type=str, help='AIL Module Name')
+    parser.add_argument('-s', '--start', type=str, help='Resume token: resume after this item id')
 
     args = parser.parse_args()
     if not args.type:
@@ -77,4 +92,4 @@ if __name__ == "__main__":
     modulename = args.module
     if modulename not in MODULES:
         raise Exception(f'Currently not supported Module: {modulename}')
-    reprocess_message_objects(obj_type, module_name=modulename)
+    reprocess_message_objects(obj_type, module_name=modulename, start=args.start)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*-coding:UTF-8 -*
+
+import os
+import sys
+
+sys.path.append(os.environ['AIL_HOME'])
+sys.path.append(os.environ['AIL_BIN'])
+##################################
+# Import Project packages
+##################################
+from update.bin.ail_updater import AIL_Updater
+from lib import ail_updates
+from lib.ConfigLoader import ConfigLoader
+from core import ail_2_ail
+
+class Updater(AIL_Updater):
+    """default Updater."""
+
+    def __init__(self, version):
+        super(Updater, self).__init__(version)
+
+
+# The sync queues were trimmed to 201 objects, whatever their max_size
+def update_sync_queues_max_size():
+    for queue_uuid in ail_2_ail.get_all_sync_queue():
+        max_size = ail_2_ail.get_sync_queue_max_size(queue_uuid)
+        if not max_size or int(max_size) < ail_2_ail.SYNC_QUEUE_DEFAULT_MAX_SIZE:
+            ail_2_ail.edit_sync_queue_max_size(queue_uuid, ail_2_ail.SYNC_QUEUE_DEFAULT_MAX_SIZE)
+
+
+# The Duplicates similarity index is kept in memory, remove the Kvrocks index
+def delete_duplicates_similarity_index():
+    config_loader = ConfigLoader()
+    r_dup = config_loader.get_db_conn("Kvrocks_Duplicates")
+    config_loader = None
+    for algo in ('ssdeep', 'tlsh'):
+        keys = []
+        for key in r_dup.scan_iter(match=f'duplicates:index:{algo}:*', count=1000):
+            keys.append(key)
+            if len(keys) >= 1000:
+                r_dup.delete(*keys)
+                keys = []
+        if keys:
+            r_dup.delete(*keys)
+        r_dup.delete(f'duplicates:indexed:{algo}')
+
+
+if __name__ == '__main__':
+    update_sync_queues_max_size()
+    delete_duplicates_similarity_index()
+    updater = Updater('v6.2')
+    updater.run_update()